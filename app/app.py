@@ -1,67 +1,192 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context, g
+import asyncio
+import hashlib
+import json
 import os
 import logging
+import random
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
+import circuit_breaker
+import event_loop
+import http_pool
+import logs
+import metrics
+from batch_jobs import BatchJobManager
+from coiot import CoIoTListener
+from device_index import DeviceSearchIndex, FILTER_COLUMNS, parse_filter, parse_sort
+from fingerprint_cache import FingerprintCache
+from firmware_check import FirmwareChecker
 from ha_client import HomeAssistantClient
+from inventory import DeviceInventory
+from inventory_store import InventoryStore
+from rollout import RolloutOrchestrator
+from scanner import DeviceScanner
+from shelly_async import AsyncShellyGen1Client, AsyncShellyGen2Client, async_probe_device
 from shelly_gen1 import ShellyGen1Client
 from shelly_gen2 import ShellyGen2Client
+from shelly_gen2_push import Gen2PushManager
+from shelly_probe import probe_device
+from status_cache import StatusCache
+from status_poller import StatusPoller
+from telemetry import TIERS, TelemetryStore
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging: level for the add-on log, and how many recent events
+# per device, from which level, are kept for /api/debug
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info').lower()
+logs.configure(
+    LOG_LEVEL,
+    per_device=int(os.environ.get('DEVICE_LOG_SIZE', 50)),
+    device_level=os.environ.get('DEVICE_LOG_LEVEL', 'info')
+)
 logger = logging.getLogger(__name__)
 
+# Fraction of requests written to the log (errors always are, debug logs all)
+REQUEST_LOG_SAMPLE = 1.0 if LOG_LEVEL == 'debug' else float(os.environ.get('REQUEST_LOG_SAMPLE', 0.01))
+
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 
 # Get admin password from environment
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', '')
 
+# Scan tuning (set by run.sh from config.yaml)
+SCAN_CONCURRENCY = int(os.environ.get('SCAN_CONCURRENCY', 16))
+SCAN_TIMEOUT = float(os.environ.get('SCAN_TIMEOUT', 20))
+
+# Background polling (0 disables it)
+POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', 60))
+POLL_CONCURRENCY = int(os.environ.get('POLL_CONCURRENCY', 4))
+
+# Gen2+ devices push their status over a WebSocket instead of being polled
+GEN2_PUSH = os.environ.get('GEN2_PUSH', 'true').lower() == 'true'
+
+# Gen1 devices multicast their status over CoIoT
+COIOT_ENABLED = os.environ.get('COIOT', 'true').lower() == 'true'
+
+# How many devices a batch operation works on at the same time
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+
+# Firmware rollouts: devices per wave, failure rate (%) that stops the
+# rollout, and how long a wave may take to come back with new firmware
+ROLLOUT_WAVE_SIZE = int(os.environ.get('ROLLOUT_WAVE_SIZE', 5))
+ROLLOUT_MAX_FAILURES = float(os.environ.get('ROLLOUT_MAX_FAILURES', 20))
+ROLLOUT_WAVE_TIMEOUT = int(os.environ.get('ROLLOUT_WAVE_TIMEOUT', 600))
+
+# How long a firmware availability check stays valid
+FIRMWARE_CHECK_HOURS = float(os.environ.get('FIRMWARE_CHECK_HOURS', 6))
+
+# Web server: worker threads, idle connection timeout, and how long open
+# requests get to finish when the add-on stops. debug uses Flask's dev server.
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+IDLE_TIMEOUT = int(os.environ.get('IDLE_TIMEOUT', 120))
+SHUTDOWN_TIMEOUT = int(os.environ.get('SHUTDOWN_TIMEOUT', 10))
+DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+
+# Scan, poll and batch operations on one asyncio event loop instead of threads
+ASYNC_CLIENTS = os.environ.get('ASYNC_CLIENTS', 'false').lower() == 'true'
+
+# How often changes to the inventory are written to the snapshot in /data
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 5))
+
+# Devices whose telemetry history is kept in memory (0 turns it off)
+TELEMETRY_DEVICES = int(os.environ.get('TELEMETRY_DEVICES', 1000))
+
+# Keep-alive connection pool for the Shelly clients
+http_pool.configure(
+    pool_size=int(os.environ.get('HTTP_POOL_SIZE', 2)),
+    retries=int(os.environ.get('HTTP_RETRIES', 1))
+)
+event_loop.configure(
+    pool_size=int(os.environ.get('HTTP_POOL_SIZE', 2)),
+    retries=int(os.environ.get('HTTP_RETRIES', 1))
+)
+
+# Skip devices that keep failing instead of waiting for their timeouts
+circuit_breaker.configure(
+    threshold=int(os.environ.get('OFFLINE_AFTER_FAILURES', 3)),
+    cooldown=int(os.environ.get('OFFLINE_RETRY_SECONDS', 60))
+)
+
 # Initialize HA client
 ha_client = HomeAssistantClient()
 
-# Log all requests
+# Keep the HA device list in memory, updated from registry events
+# The last known fleet is shown right away after a restart, and revalidated
+# in the background
+inventory_store = InventoryStore(flush_interval=SNAPSHOT_INTERVAL)
+snapshot = inventory_store.load()
+inventory = DeviceInventory(ha_client, store=inventory_store)
+inventory.restore(snapshot)
+inventory.start()
+inventory_store.start()
+
+# Remember device generations across requests and restarts
+fingerprints = FingerprintCache()
+
+# Log a sample of requests, and every failed one
 @app.before_request
-def log_request():
-    logger.info(f"Request: {request.method} {request.path}")
+def start_request_timer():
+    g.request_started = time.monotonic()
 
 @app.after_request
 def log_response(response):
-    logger.info(f"Response: {response.status_code} for {request.path}")
+    if response.status_code >= 500:
+        level = logging.WARNING
+    elif random.random() < REQUEST_LOG_SAMPLE:
+        level = logging.INFO
+    else:
+        return response
+    
+    elapsed = time.monotonic() - g.get('request_started', time.monotonic())
+    logger.log(level, "%s %s -> %s in %.0f ms", request.method, request.path, response.status_code, elapsed * 1000)
     return response
 
 
 def detect_generation(ip):
     """Detect if device is Gen1 or Gen2+"""
-    try:
-        # Try Gen2+ first
-        import requests
-        response = requests.get(f"http://{ip}/rpc/Shelly.GetDeviceInfo", timeout=2)
-        if response.status_code == 200:
-            return 2
-    except:
-        pass
-    
-    try:
-        # Try Gen1
-        import requests
-        response = requests.get(f"http://{ip}/shelly", timeout=2)
-        if response.status_code == 200:
-            return 1
-    except:
-        pass
-    
-    return None
+    device_info = probe_device(ip)
+    return device_info.get('generation') if device_info else None
 
 
 def get_shelly_client(ip, generation=None):
     """Get the appropriate Shelly client for the device"""
     if generation is None:
-        generation = detect_generation(ip)
+        cached = fingerprints.lookup(ip=ip)
+        if cached:
+            generation = cached['generation']
+        else:
+            device_info = probe_device(ip)
+            if device_info:
+                generation = device_info['generation']
+                fingerprints.remember(ip, generation, model=device_info.get('type'), mac=device_info.get('mac'))
     
     if generation == 1:
         return ShellyGen1Client(ip, ADMIN_PASSWORD)
     elif generation == 2:
-        return ShellyGen2Client(ip, ADMIN_PASSWORD)
+        return ShellyGen2Client(ip, ADMIN_PASSWORD, channel=gen2_push.channel_for(ip) if GEN2_PUSH else None)
+    
+    return None
+
+
+async def get_async_client(ip, generation=None):
+    """Async get_shelly_client (HTTP only, the push channel is synchronous)"""
+    if generation is None:
+        cached = fingerprints.lookup(ip=ip)
+        if cached:
+            generation = cached['generation']
+        else:
+            device_info = await async_probe_device(ip)
+            if device_info:
+                generation = device_info['generation']
+                fingerprints.remember(ip, generation, model=device_info.get('type'), mac=device_info.get('mac'))
+    
+    if generation == 1:
+        return AsyncShellyGen1Client(ip, ADMIN_PASSWORD)
+    elif generation == 2:
+        return AsyncShellyGen2Client(ip, ADMIN_PASSWORD)
     
     return None
 
@@ -70,28 +195,200 @@ def enrich_device_info(ha_device):
     """Enrich HA device info with live Shelly data"""
     ip = ha_device.get('ip')
     if not ip:
-        logger.warning(f"No IP found for device {ha_device.get('name')}")
+        logger.warning("No IP found for device %s", ha_device.get('name'))
         return ha_device
     
-    # Detect generation and get detailed info
-    generation = detect_generation(ip)
+    if not circuit_breaker.allow(ip):
+        # Known to be offline; keep the fingerprint for when it comes back.
+        # Once the cooldown has passed allow() checks whether it's back.
+        ha_device['scan_status'] = 'offline'
+        return ha_device
     
-    if generation:
-        client = get_shelly_client(ip, generation)
-        if client:
-            device_info = client.get_device_info()
-            if device_info:
-                # Merge info
-                ha_device.update({
-                    'generation': device_info.get('generation'),
-                    'auth': device_info.get('auth', False),
-                    'fw': device_info.get('fw', ha_device.get('sw_version')),
-                    'type': device_info.get('type', ha_device.get('model'))
-                })
+    # One probe gives us both the generation and the device info. If we know
+    # the generation already only the matching endpoint is asked.
+    cached = fingerprints.lookup(mac=ha_device.get('mac'), device_id=ha_device.get('id'), ip=ip)
+    device_info = probe_device(ip, cached['generation'] if cached else None)
+    
+    if not device_info and cached:
+        # Cached fingerprint is stale, forget it and probe both generations
+        fingerprints.invalidate(mac=ha_device.get('mac'), device_id=ha_device.get('id'), ip=ip)
+        device_info = probe_device(ip)
+    
+    return apply_probe_result(ha_device, device_info)
+
+
+async def enrich_device_info_async(ha_device):
+    """Async enrich_device_info, for scans on the event loop"""
+    ip = ha_device.get('ip')
+    if not ip:
+        logger.warning("No IP found for device %s", ha_device.get('name'))
+        return ha_device
+    
+    # allow() may do a short TCP check, keep that off the loop
+    if circuit_breaker.is_open(ip) and not await asyncio.get_running_loop().run_in_executor(None, circuit_breaker.allow, ip):
+        ha_device['scan_status'] = 'offline'
+        return ha_device
+    
+    cached = fingerprints.lookup(mac=ha_device.get('mac'), device_id=ha_device.get('id'), ip=ip)
+    device_info = await async_probe_device(ip, cached['generation'] if cached else None)
     
+    if not device_info and cached:
+        fingerprints.invalidate(mac=ha_device.get('mac'), device_id=ha_device.get('id'), ip=ip)
+        device_info = await async_probe_device(ip)
+    
+    return apply_probe_result(ha_device, device_info)
+
+
+def apply_probe_result(ha_device, device_info):
+    """Merge probed device info into an HA device and remember its fingerprint"""
+    ip = ha_device['ip']
+    if device_info:
+        # Merge info
+        ha_device.update({
+            'generation': device_info.get('generation'),
+            'auth': device_info.get('auth', False),
+            'fw': device_info.get('fw', ha_device.get('sw_version')),
+            'type': device_info.get('type', ha_device.get('model'))
+        })
+        ha_device['scan_status'] = 'ok'
+        fingerprints.remember(
+            ip,
+            device_info.get('generation'),
+            model=device_info.get('type'),
+            mac=device_info.get('mac') or ha_device.get('mac'),
+            device_id=ha_device.get('id')
+        )
+        return ha_device
+    
+    logger.debug("Scan: %s did not answer", ip, extra={'device': ip})
+    ha_device['scan_status'] = 'unreachable'
     return ha_device
 
 
+# Initialize scanner
+scanner = DeviceScanner(
+    enrich_device_info_async if ASYNC_CLIENTS else enrich_device_info,
+    max_workers=SCAN_CONCURRENCY,
+    deadline=SCAN_TIMEOUT
+)
+
+# Live status, kept fresh in the background
+status_cache = StatusCache()
+status_cache.restore({row['id']: row['status'] for row in snapshot if row['status']})
+gen2_push = Gen2PushManager(inventory, status_cache)
+coiot = CoIoTListener(inventory, status_cache, fingerprints)
+
+# Power, temperature, RSSI, ... history per device, for charts
+telemetry = TelemetryStore(max_devices=TELEMETRY_DEVICES)
+
+# Reachability is part of a device row, so flips count as inventory changes
+_reachability = {}
+
+
+def on_status_change(device_id, entry):
+    """Bump the inventory version when a device goes online or offline"""
+    if entry is None:
+        # The device left the inventory
+        telemetry.remove(device_id)
+        _reachability.pop(device_id, None)
+        return
+    inventory_store.put_status(device_id, entry)
+    if TELEMETRY_DEVICES and entry.get('online') and entry.get('status'):
+        telemetry.record(device_id, entry['status'], entry.get('last_seen'), source=entry.get('source'))
+    state = (entry.get('online'), entry.get('offline_since'))
+    if _reachability.get(device_id) != state:
+        _reachability[device_id] = state
+        inventory.touch(device_id)
+
+
+status_cache.add_listener(on_status_change)
+
+
+def is_pushed(device_id):
+    """Whether a device's status arrives by push, so it needn't be polled"""
+    return (GEN2_PUSH and gen2_push.is_live(device_id)) or (COIOT_ENABLED and coiot.is_live(device_id))
+
+
+poller = StatusPoller(
+    inventory,
+    status_cache,
+    get_shelly_client,
+    interval=POLL_INTERVAL,
+    max_concurrent=POLL_CONCURRENCY,
+    skip=is_pushed,
+    async_client_factory=get_async_client if ASYNC_CLIENTS else None
+)
+if GEN2_PUSH:
+    gen2_push.start()
+if COIOT_ENABLED:
+    try:
+        coiot.start()
+    except OSError as e:
+        logger.error("❌ Could not listen for CoIoT: %s", e)
+if POLL_INTERVAL > 0:
+    poller.start()
+
+
+# Batch operations run in the background
+batch_jobs = BatchJobManager(max_workers=BATCH_CONCURRENCY)
+
+# Firmware availability, checked in the background per model/version
+def on_firmware_change(model, fw):
+    """Bump the inventory version of every device a firmware answer applies to"""
+    for device in inventory.get_devices():
+        if (device.get('type') or device.get('model')) == model and device.get('fw') == fw:
+            inventory.touch(device['id'])
+
+
+firmware = FirmwareChecker(
+    inventory,
+    get_shelly_client,
+    ttl=FIRMWARE_CHECK_HOURS * 3600,
+    on_change=on_firmware_change
+)
+firmware.start()
+
+
+def live_fields(device):
+    """Cached reachability and firmware fields to merge into a device row"""
+    fields = status_cache.summary(device.get('id'))
+    since = circuit_breaker.offline_since(device['ip']) if device.get('ip') else None
+    if since and not fields.get('offline_since'):
+        fields.update(online=False, offline_since=since)
+    fields.update(firmware.lookup(device, has_password=bool(ADMIN_PASSWORD)))
+    return fields
+
+
+def poll_soon(ip):
+    """Refresh a device's cached status soon, e.g. after changing it"""
+    device = inventory.find(ip=ip)
+    if device:
+        poller.poll_now(device['id'])
+
+
+def store_auth(ip, enabled):
+    """Remember a changed auth setting, so the device's row shows it without a rescan"""
+    device = inventory.find(ip=ip)
+    if device:
+        inventory.merge(device['id'], {'auth': enabled})
+
+
+def shutdown_services():
+    """Stop the background work, e.g. when the add-on stops"""
+    logger.info("Stopping background services...")
+    poller.stop()
+    firmware.stop()
+    batch_jobs.stop()
+    if GEN2_PUSH:
+        gen2_push.stop()
+    if COIOT_ENABLED:
+        coiot.stop()
+    ha_client.ws_client.stop()
+    event_loop.stop()
+    http_pool.close_all()
+    inventory_store.stop()
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -103,10 +400,18 @@ def health():
     return jsonify({'status': 'ok'}), 200
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: device latency, HA WebSocket calls, scans, caches"""
+    metrics.INVENTORY_DEVICES.set(len(inventory.devices))
+    metrics.OFFLINE_DEVICES.set(sum(1 for entry in circuit_breaker.snapshot().values() if entry['open']))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/debug')
 def debug():
     """Debug endpoint to check HA API connection and show sample data"""
-    logger.info("=== DEBUG: Testing HA API Connection ===")
+    logger.debug("=== DEBUG: Testing HA API Connection ===")
     
     result = {
         'supervisor_token_present': bool(os.environ.get('SUPERVISOR_TOKEN')),
@@ -122,7 +427,7 @@ def debug():
         
         # NEW: Test WebSocket device registry access
         try:
-            logger.info("Testing WebSocket device registry access...")
+            logger.debug("Testing WebSocket device registry access...")
             device_registry = ha_client.ws_client.get_device_registry()
             result['websocket_device_registry_accessible'] = True
             result['total_devices_in_registry'] = len(device_registry)
@@ -211,122 +516,509 @@ def debug():
         except Exception as e:
             result['discovery_error'] = str(e)
         
+        # Devices currently failing or skipped by the circuit breaker
+        result['circuit_breaker'] = circuit_breaker.snapshot()
+        
+        # Recent log events per device (?device=<ip> for just one)
+        device = request.args.get('device')
+        result['device_events'] = logs.device_events.get(device) if device else logs.device_events.get()
+        
+        result['telemetry'] = telemetry.stats()
+        
     except Exception as e:
         result['error'] = str(e)
     
-    logger.info(f"Debug result: {result}")
+    logger.debug("Debug result: %s", result)
     return jsonify(result)
 
 
+def mark_no_ip(device):
+    """Fill in the row fields of a device we can't reach without an IP"""
+    device['error'] = 'No IP address found'
+    device['type'] = device.get('model', 'Unknown')
+    device['fw'] = device.get('sw_version', 'Unknown')
+    return device
+
+
+def split_scannable(devices):
+    """Split devices into the ones we can enrich and the ones without an IP"""
+    to_enrich = []
+    no_ip = []
+    for device in devices:
+        if device.get('ip'):
+            to_enrich.append(device)
+        else:
+            name = device.get('name', 'Unknown')
+            logger.warning("Device %s has no IP address - skipping enrichment", name)
+            # Still add it, but mark as no IP
+            no_ip.append(mark_no_ip(device))
+    return to_enrich, no_ip
+
+
+def inventory_rows(devices):
+    """Device rows straight from the inventory, without contacting devices"""
+    return [
+        dict(device, **live_fields(device)) if device.get('ip') else mark_no_ip(device)
+        for device in devices
+    ]
+
+
+# Search, sort and paging for the device table, following the inventory
+device_index = DeviceSearchIndex(inventory, inventory_rows)
+
+
+def inventory_etag(version):
+    """ETag for the device list at an inventory version"""
+    return f"inventory-{version}"
+
+
+# Every full scan gets its own number: scans at the same inventory version
+# can still differ in per-scan fields such as scan_status
+scan_generation = 0
+_scan_generation_lock = threading.Lock()
+
+
+def next_scan_generation():
+    """Number for a new full scan"""
+    global scan_generation
+    with _scan_generation_lock:
+        scan_generation += 1
+        return scan_generation
+
+
+def scan_etag(version, generation):
+    """ETag for a full scan result"""
+    return f"inventory-{version}-scan-{generation}"
+
+
+def scan_delta(since):
+    """Devices changed or removed since an inventory version"""
+    delta = inventory.changes_since(since)
+    if delta is None:
+        # Too old (or from before a restart): send everything
+        inventory.ensure_loaded()
+        version = inventory.version
+        body = {'version': version, 'full': True, 'devices': inventory_rows(inventory.get_devices()), 'removed': []}
+    else:
+        version, changed, removed = delta
+        body = {'version': version, 'full': False, 'devices': inventory_rows(changed), 'removed': removed}
+    
+    response = jsonify(body)
+    response.set_etag(inventory_etag(version))
+    return response
+
+
+def store_scan_result(device):
+    """Remember live data from a successful enrichment in the inventory"""
+    device.update(live_fields(device))
+    if device.get('scan_status') == 'ok':
+        inventory.merge(device['id'], {
+            key: device.get(key) for key in ('generation', 'auth', 'fw', 'type', 'scan_status')
+        })
+
+
+def revalidate_snapshot():
+    """Scan the devices restored from the snapshot, once, after boot"""
+    inventory.refresh()
+    devices = [device for device in inventory.get_devices() if device.get('stale') and device.get('ip')]
+    if not devices:
+        return
+    logger.info("Revalidating %s devices from the last run", len(devices))
+    for _, device in scanner.iter_scan(devices):
+        store_scan_result(device)
+
+
+if snapshot:
+    threading.Thread(target=revalidate_snapshot, name='revalidate', daemon=True).start()
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.route('/api/scan')
 def scan():
-    """Get Shelly devices from Home Assistant"""
+    """Get Shelly devices from Home Assistant
+
+    ?since=<version> returns only the devices changed or removed since then,
+    from the inventory. With If-None-Match, an unchanged inventory and no
+    other scan in between the answer is 304 without contacting any device.
+    """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return scan_delta(since)
+    
+    current = scan_etag(inventory.version, scan_generation)
+    if inventory.loaded and request.if_none_match.contains(current):
+        response = Response(status=304)
+        response.set_etag(current)
+        return response
+    
     logger.info("=== SCANNING FOR DEVICES FROM HOME ASSISTANT ===")
     
     try:
-        # First, test HA API connection
-        if not ha_client.test_connection():
+        # First, test HA API connection (only needed until the inventory is loaded)
+        if not inventory.loaded and not ha_client.test_connection():
             logger.error("❌ Cannot connect to Home Assistant API")
             return jsonify({
                 'error': 'Cannot connect to Home Assistant API',
                 'details': 'Check add-on logs for more information'
             }), 500
         
-        # Get devices from HA (now includes IP addresses from config entries)
-        devices = ha_client.get_shelly_devices()
+        # Get devices from the in-memory inventory (loaded once from HA). The
+        # version is read first, so a later ?since= can't miss a change.
+        inventory.ensure_loaded()
+        version = inventory.version
+        generation = next_scan_generation()
+        devices = inventory.get_devices()
         
-        logger.info(f"Found {len(devices)} devices from Home Assistant")
+        logger.info("Found %s devices from Home Assistant", len(devices))
         
         # If we found devices, enrich them with live data
         if devices:
-            enriched_devices = []
-            for device in devices:
-                ip = device.get('ip')
-                name = device.get('name', 'Unknown')
-                
-                if ip:
-                    logger.info(f"Enriching device: {name} at {ip}")
-                    enriched = enrich_device_info(device)
-                    enriched_devices.append(enriched)
-                else:
-                    logger.warning(f"Device {name} has no IP address - skipping enrichment")
-                    # Still add it, but mark as no IP
-                    device['error'] = 'No IP address found'
-                    device['type'] = device.get('model', 'Unknown')
-                    device['fw'] = device.get('sw_version', 'Unknown')
-                    enriched_devices.append(device)
+            to_enrich, enriched_devices = split_scannable(devices)
+            
+            logger.info("Enriching %s devices (%s in parallel, %ss deadline)", len(to_enrich), SCAN_CONCURRENCY, SCAN_TIMEOUT)
+            scanned = scanner.scan(to_enrich)
+            for device in scanned:
+                store_scan_result(device)
+            enriched_devices = scanned + [dict(d, **live_fields(d)) for d in enriched_devices]
             
-            logger.info(f"Returning {len(enriched_devices)} devices")
-            logger.info(f"  - With IP: {sum(1 for d in enriched_devices if d.get('ip'))}")
-            logger.info(f"  - Enriched: {sum(1 for d in enriched_devices if d.get('generation'))}")
-            return jsonify(enriched_devices)
+            logger.info("Returning %s devices", len(enriched_devices))
+            logger.info("  - With IP: %s", sum(1 for d in enriched_devices if d.get('ip')))
+            logger.info("  - Enriched: %s", sum(1 for d in enriched_devices if d.get('generation')))
+            logger.info("  - Timed out: %s", sum(1 for d in enriched_devices if d.get('scan_status') in ('pending', 'timeout')))
+            response = jsonify(enriched_devices)
+            response.set_etag(scan_etag(version, generation))
+            response.headers['X-Inventory-Version'] = str(version)
+            return response
         else:
             logger.warning("No Shelly devices found in Home Assistant")
             return jsonify([])
         
     except Exception as e:
-        logger.error(f"Error scanning devices: {e}", exc_info=True)
+        logger.error("Error scanning devices: %s", e, exc_info=True)
         return jsonify({
             'error': str(e),
             'details': 'Check add-on logs for more information'
         }), 500
 
 
+@app.route('/api/scan/stream')
+def scan_stream():
+    """Stream scan results as Server-Sent Events
+
+    Sends the HA registry rows right away (event "devices"), then one
+    "device" event per enriched device as soon as it answers, then "done".
+    """
+    logger.info("=== STREAMING SCAN FROM HOME ASSISTANT ===")
+    
+    def generate():
+        try:
+            inventory.ensure_loaded()
+            version = inventory.version
+            next_scan_generation()
+            devices = inventory.get_devices()
+            to_enrich, no_ip = split_scannable(devices)
+            yield sse_event('devices', [dict(d, **live_fields(d)) for d in to_enrich + no_ip])
+            
+            timed_out = 0
+            for _, device in scanner.iter_scan(to_enrich):
+                store_scan_result(device)
+                if device.get('scan_status') in ('pending', 'timeout'):
+                    timed_out += 1
+                yield sse_event('device', device)
+            
+            yield sse_event('done', {'count': len(devices), 'timed_out': timed_out, 'version': version})
+            
+        except Exception as e:
+            logger.error("Error streaming scan: %s", e, exc_info=True)
+            yield sse_event('scan_error', {'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/devices')
+def devices_query():
+    """One page of the device table, from the inventory without contacting devices
+
+    ?q= keeps the devices whose name, IP, MAC, type or firmware contain every
+    search term, ?generation=2, ?auth=false, ?online=, ?has_update= and ?type=
+    filter on exact values, ?sort=name,-ip sorts on one or more columns (- for
+    descending), and ?offset= / ?limit= (default 100, max 1000) pick the page.
+    ?select=true adds the IP and auth state of all matching devices.
+    """
+    search = request.args.get('q', '')
+    filters = {column: parse_filter(request.args[column]) for column in FILTER_COLUMNS if request.args.get(column)}
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(0, request.args.get('limit', 100, type=int)), 1000)
+    
+    version, total, rows = device_index.query(search, filters, parse_sort(request.args.get('sort')), offset, limit)
+    body = {'version': version, 'total': total, 'offset': offset, 'limit': limit, 'devices': rows}
+    if request.args.get('select') == 'true':
+        body['selection'] = device_index.select(search, filters)
+    
+    response = jsonify(body)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/api/status')
+def status_all():
+    """Cached live status of all devices, keyed by HA device id"""
+    return jsonify(status_cache.snapshot())
+
+
+@app.route('/api/status/<device_id>')
+def status_device(device_id):
+    """Cached live status of one device"""
+    entry = status_cache.get(device_id)
+    if entry is None:
+        return jsonify({'error': 'No status cached for this device'}), 404
+    return jsonify(entry)
+
+
+@app.route('/api/telemetry/<device_id>')
+def telemetry_device(device_id):
+    """Telemetry history of one device, for charts
+
+    Without ?metric= the recorded metrics are listed. ?metric=power,rssi
+    returns [time, mean, min, max] points per metric, at ?resolution=raw,
+    minute (default) or hour, optionally only those after ?since=<unix time>.
+    """
+    metrics = telemetry.metrics(device_id)
+    requested = [m for m in request.args.get('metric', '').split(',') if m]
+    if not requested:
+        return jsonify({'device': device_id, 'metrics': metrics, 'resolutions': ['raw'] + [t[0] for t in TIERS]})
+
+    unknown = [m for m in requested if m not in metrics]
+    if unknown:
+        return jsonify({'error': f"No telemetry for {', '.join(unknown)}", 'metrics': metrics}), 404
+
+    resolution = request.args.get('resolution', 'minute')
+    since = request.args.get('since', 0, type=float)
+    try:
+        series = {m: telemetry.query(device_id, m, resolution, since) or [] for m in requested}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'device': device_id, 'resolution': resolution, 'series': series})
+
+
+# Device detail sub-calls run side by side, each in its own worker
+_detail_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='detail')
+
+
+def project(data, fields):
+    """Only the dotted paths in fields (e.g. status.wifi_sta) of a nested dict"""
+    result = {}
+    for field in fields:
+        source, target = data, result
+        parts = field.split('.')
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return result
+
+
+def device_etag(ip, fields):
+    """ETag for /api/device/<ip> from what we already know, or None
+
+    The details are taken as unchanged while the device's inventory row and
+    the status the poller or push last saw stay the same, so a match needs
+    no device calls. Devices nobody keeps an eye on get no such ETag.
+    """
+    device = inventory.find(ip=ip)
+    if not device:
+        return None
+    seen = status_cache.summary(device['id'])
+    if not seen.get('online') or not seen.get('last_seen'):
+        return None
+    if POLL_INTERVAL <= 0 and not is_pushed(device['id']):
+        return None
+    key = f"{device['id']}|{inventory.version_of(device['id'])}|{seen['last_seen']}|{','.join(fields)}"
+    return 'device-' + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
 @app.route('/api/device/<ip>')
 def device_info(ip):
-    """Get detailed info for specific device"""
+    """Get detailed info for specific device
+
+    ?fields=status.wifi_sta,settings.name,fw returns only those (dotted)
+    fields; settings and status are only fetched from the device when asked for.
+    Gen2+ devices have no settings, so settings fields are left out for them.
+    With If-None-Match the answer is 304 without contacting the device while
+    its cached status and inventory row are unchanged (see device_etag).
+    """
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    sections = {f.split('.')[0] for f in fields}
+    etag = device_etag(ip, fields)
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
     try:
         client = get_shelly_client(ip)
         if not client:
             return jsonify({'error': 'Could not detect device generation'}), 404
         
-        device_info = client.get_device_info()
-        if device_info:
-            # Get additional info
-            if hasattr(client, 'get_settings'):
-                settings = client.get_settings()
-                if settings and 'error' not in settings:
-                    device_info['settings'] = settings
-            
-            status = client.get_status()
-            if status:
-                device_info['status'] = status
-            
-            return jsonify(device_info)
+        # Everything outside settings and status comes from the device info
+        calls = {}
+        if not fields or sections - {'settings', 'status'}:
+            calls['info'] = client.get_device_info
+        if (not fields or 'settings' in sections) and hasattr(client, 'get_settings'):
+            calls['settings'] = client.get_settings
+        if not fields or 'status' in sections:
+            calls['status'] = client.get_status
+        futures = {name: _detail_pool.submit(call) for name, call in calls.items()}
+        results = {name: future.result() for name, future in futures.items()}
         
-        return jsonify({'error': 'Device not found'}), 404
+        # Not found only if a call was made and came back empty
+        if 'info' in calls and not results['info'] or calls and not any(results.values()):
+            fingerprints.invalidate(ip=ip)
+            return jsonify({'error': 'Device not found'}), 404
+        
+        device_info = results.get('info') or {}
+        settings = results.get('settings')
+        if settings and 'error' not in settings:
+            device_info['settings'] = settings
+        if results.get('status'):
+            device_info['status'] = results['status']
+        if fields:
+            device_info = project(device_info, fields)
+        
+        # Without a cached status the ETag comes from the content, which
+        # only saves sending the body again
+        response = jsonify(device_info)
+        if etag:
+            response.set_etag(etag)
+        else:
+            response.add_etag()
+        return response.make_conditional(request)
         
     except Exception as e:
-        logger.error(f"Error getting device info for {ip}: {e}")
+        logger.error("Error getting device info for %s: %s", ip, e, extra={'device': ip})
         return jsonify({'error': str(e)}), 500
 
 
+def perform_update(ip):
+    """Start a firmware update, returning a result dict with 'success'"""
+    client = get_shelly_client(ip)
+    if not client:
+        return {'success': False, 'error': 'Could not detect device generation', 'not_found': True}
+    
+    logger.debug("✓ Device generation: Gen%s", client.generation, extra={'device': ip})
+    
+    result = client.update_firmware()
+    if result.get('success'):
+        poll_soon(ip)
+    else:
+        fingerprints.invalidate(ip=ip)
+    return result
+
+
+def perform_set_auth(ip, enable):
+    """Enable or disable authentication, returning a result dict with 'success'"""
+    client = get_shelly_client(ip)
+    if not client:
+        return {'success': False, 'error': 'Could not detect device generation', 'not_found': True}
+    
+    logger.debug("✓ Device: Gen%s", client.generation, extra={'device': ip})
+    
+    result = client.set_auth(enable, ADMIN_PASSWORD)
+    if result.get('success'):
+        store_auth(ip, enable)
+        poll_soon(ip)
+    else:
+        fingerprints.invalidate(ip=ip)
+    return result
+
+
+def perform_reboot(ip):
+    """Reboot a device, returning a result dict with 'success'"""
+    client = get_shelly_client(ip)
+    if not client:
+        return {'success': False, 'error': 'Could not detect device generation', 'not_found': True}
+    
+    if client.reboot():
+        poll_soon(ip)
+        return {'success': True}
+    
+    fingerprints.invalidate(ip=ip)
+    return {'success': False, 'error': 'Reboot failed'}
+
+
+async def perform_async(operation, ip, enable=True):
+    """Async perform_update/perform_set_auth/perform_reboot for batch jobs"""
+    client = await get_async_client(ip)
+    if not client:
+        return {'success': False, 'error': 'Could not detect device generation', 'not_found': True}
+    
+    if operation == 'update':
+        result = await client.update_firmware()
+    elif operation == 'auth':
+        result = await client.set_auth(enable, ADMIN_PASSWORD)
+    else:
+        result = {'success': True} if await client.reboot() else {'success': False, 'error': 'Reboot failed'}
+    
+    if result.get('success'):
+        if operation == 'auth':
+            store_auth(ip, enable)
+        poll_soon(ip)
+    else:
+        fingerprints.invalidate(ip=ip)
+    return result
+
+
+def probe_firmware(ip):
+    """Quick firmware check for the rollout baseline and health gate"""
+    cached = fingerprints.lookup(ip=ip)
+    return probe_device(ip, cached.get('generation') if cached else None)
+
+
+# Firmware rollouts in waves, tracked as batch jobs
+rollout = RolloutOrchestrator(
+    batch_jobs,
+    inventory,
+    perform_update,
+    probe_firmware,
+    has_update_fn=lambda device: firmware.lookup(device).get('has_update'),
+    wave_size=ROLLOUT_WAVE_SIZE,
+    max_failure_rate=ROLLOUT_MAX_FAILURES / 100,
+    health_timeout=ROLLOUT_WAVE_TIMEOUT
+)
+
+
 @app.route('/api/update/<ip>', methods=['POST'])
 def update_device(ip):
     """Trigger firmware update on device"""
     logger.info("=" * 60)
-    logger.info(f"FIRMWARE UPDATE REQUEST for {ip}")
+    logger.info("FIRMWARE UPDATE REQUEST for %s", ip, extra={'device': ip})
     logger.info("=" * 60)
     
     try:
-        client = get_shelly_client(ip)
-        if not client:
-            return jsonify({'error': 'Could not detect device generation'}), 404
-        
-        generation = client.get_device_info().get('generation') if client.get_device_info() else None
-        logger.info(f"✓ Device generation: Gen{generation}")
-        
-        result = client.update_firmware()
+        result = perform_update(ip)
         
         if result.get('success'):
-            logger.info(f"✅ SUCCESS: Firmware update started")
+            logger.info("✅ SUCCESS: Firmware update started", extra={'device': ip})
             return jsonify(result)
+        elif result.get('not_found'):
+            return jsonify({'error': result['error']}), 404
         else:
-            logger.error(f"❌ FAILED: {result.get('error')}")
+            logger.error("❌ FAILED: %s", result.get('error'), extra={'device': ip})
             return jsonify(result), 500
         
     except Exception as e:
-        logger.error(f"❌ EXCEPTION: {e}", exc_info=True)
+        logger.error("❌ EXCEPTION: %s", e, exc_info=True, extra={'device': ip})
         return jsonify({'error': str(e)}), 500
     finally:
         logger.info("=" * 60)
@@ -336,7 +1028,7 @@ def update_device(ip):
 def toggle_auth(ip):
     """Toggle authentication on device with extensive debugging"""
     logger.info("=" * 60)
-    logger.info(f"AUTH TOGGLE REQUEST for {ip}")
+    logger.info("AUTH TOGGLE REQUEST for %s", ip, extra={'device': ip})
     logger.info("=" * 60)
     
     try:
@@ -344,35 +1036,26 @@ def toggle_auth(ip):
             logger.error("❌ No admin password configured in add-on settings")
             return jsonify({'error': 'Password not configured in app settings'}), 400
         
-        logger.info(f"✓ Admin password is configured")
+        logger.info("✓ Admin password is configured")
         
         data = request.get_json()
         enable = data.get('enable', False)
-        logger.info(f"📝 Request: {'ENABLE' if enable else 'DISABLE'} authentication")
-        
-        client = get_shelly_client(ip)
-        if not client:
-            logger.error(f"❌ Could not detect device generation at {ip}")
-            return jsonify({'error': 'Could not detect device generation'}), 404
-        
-        device_info = client.get_device_info()
-        generation = device_info.get('generation') if device_info else None
-        current_auth = device_info.get('auth', False) if device_info else False
+        logger.info("📝 Request: %s authentication", 'ENABLE' if enable else 'DISABLE')
         
-        logger.info(f"✓ Device: Gen{generation}")
-        logger.info(f"✓ Current auth status: {'ENABLED' if current_auth else 'DISABLED'}")
-        
-        result = client.set_auth(enable, ADMIN_PASSWORD)
+        result = perform_set_auth(ip, enable)
         
         if result.get('success'):
-            logger.info(f"✅ SUCCESS: Auth {'enabled' if enable else 'disabled'}")
+            logger.info("✅ SUCCESS: Auth %s", 'enabled' if enable else 'disabled', extra={'device': ip})
             return jsonify({'success': True, 'auth_enabled': enable, 'response': result.get('response')})
+        elif result.get('not_found'):
+            logger.error("❌ Could not detect device generation at %s", ip, extra={'device': ip})
+            return jsonify({'error': result['error']}), 404
         else:
-            logger.error(f"❌ FAILED: {result.get('error')}")
+            logger.error("❌ FAILED: %s", result.get('error'), extra={'device': ip})
             return jsonify({'error': result.get('error')}), 500
         
     except Exception as e:
-        logger.error(f"❌ UNEXPECTED ERROR: {e}", exc_info=True)
+        logger.error("❌ UNEXPECTED ERROR: %s", e, exc_info=True, extra={'device': ip})
         return jsonify({'error': str(e)}), 500
     finally:
         logger.info("=" * 60)
@@ -382,22 +1065,90 @@ def toggle_auth(ip):
 def reboot_device(ip):
     """Reboot device"""
     try:
-        client = get_shelly_client(ip)
-        if not client:
-            return jsonify({'error': 'Could not detect device generation'}), 404
-        
-        success = client.reboot()
+        result = perform_reboot(ip)
         
-        if success:
+        if result.get('success'):
             return jsonify({'success': True, 'message': 'Device reboot initiated'})
+        elif result.get('not_found'):
+            return jsonify({'error': result['error']}), 404
         else:
-            return jsonify({'error': 'Reboot failed'}), 500
+            return jsonify({'error': result['error']}), 500
         
     except Exception as e:
-        logger.error(f"Error rebooting device {ip}: {e}")
+        logger.error("Error rebooting device %s: %s", ip, e, extra={'device': ip})
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/batch/<operation>', methods=['POST'])
+def start_batch(operation):
+    """Run update/auth/reboot on a set of devices in the background
+
+    Body: {"devices": ["192.168.1.10", ...], "enable": true}  (enable is for auth only)
+    Returns the job id right away; progress is at /api/jobs/<job_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    devices = data.get('devices') or []
+    
+    if not isinstance(devices, list) or not devices:
+        return jsonify({'error': 'No devices given'}), 400
+    
+    if operation not in ('update', 'auth', 'reboot'):
+        return jsonify({'error': f'Unknown operation: {operation}'}), 404
+    if operation == 'auth' and not ADMIN_PASSWORD:
+        return jsonify({'error': 'Password not configured in app settings'}), 400
+    enable = bool(data.get('enable', True))
+    
+    if ASYNC_CLIENTS:
+        async def action(ip):
+            return await perform_async(operation, ip, enable)
+    elif operation == 'update':
+        action = perform_update
+    elif operation == 'auth':
+        action = lambda ip: perform_set_auth(ip, enable)
+    else:
+        action = perform_reboot
+    
+    job = batch_jobs.submit(operation, devices, action)
+    logger.info("Batch %s started for %s devices (job %s)", operation, len(devices), job['id'])
+    return jsonify(job), 202
+
+
+@app.route('/api/rollout', methods=['POST'])
+def start_rollout():
+    """Update firmware in waves, waiting for each wave to come back healthy
+
+    Body: {"devices": [...], "wave_size": 5, "per_model": false, "max_failure_rate": 0.2}
+    Everything but devices is optional. Progress is at /api/jobs/<job_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    devices = data.get('devices') or []
+    
+    if not isinstance(devices, list) or not devices:
+        return jsonify({'error': 'No devices given'}), 400
+    
+    try:
+        job = rollout.start(
+            devices,
+            wave_size=data.get('wave_size'),
+            per_model=bool(data.get('per_model', False)),
+            max_failure_rate=data.get('max_failure_rate')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid rollout options: {e}'}), 400
+    
+    logger.info("Rollout started for %s devices in %s wave(s) (job %s)", len(devices), job['waves'], job['id'])
+    return jsonify(job), 202
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a batch job, per device"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
 if __name__ == '__main__':
     import sys
     
@@ -414,8 +1165,21 @@ if __name__ == '__main__':
     print(f"Port: {port}", file=sys.stderr)
     print(f"Admin Password: {'Configured' if ADMIN_PASSWORD else 'Not set'}", file=sys.stderr)
     print(f"Data Source: Home Assistant", file=sys.stderr)
+    print(f"Server: {'Flask debug' if DEBUG else f'waitress, {SERVER_THREADS} threads'}", file=sys.stderr)
     print("=" * 50, file=sys.stderr)
     sys.stderr.flush()
     
-    # Enable debug mode for troubleshooting
-    app.run(host='0.0.0.0', port=port, debug=True)
+    if DEBUG:
+        # Debugger for troubleshooting; no reloader, it would start every
+        # background service twice
+        app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False, threaded=True)
+    else:
+        from server import serve
+        serve(
+            app,
+            port=port,
+            threads=SERVER_THREADS,
+            idle_timeout=IDLE_TIMEOUT,
+            shutdown_timeout=SHUTDOWN_TIMEOUT,
+            on_shutdown=shutdown_services
+        )
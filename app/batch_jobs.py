@@ -0,0 +1,152 @@
+"""
+Background batch operations
+Runs one operation (update, auth, reboot) over many devices with bounded
+parallelism and keeps per-device progress for the UI to poll
+"""
+import asyncio
+import copy
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import event_loop
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJobManager:
+    """Job store plus a shared worker pool for batch operations"""
+
+    def __init__(self, max_workers=8, keep=50):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='batch')
+        # Same limit for async actions, which run on the event loop instead
+        self.slots = asyncio.Semaphore(max(1, max_workers))
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def create(self, operation, targets):
+        """Register a new job without starting any work"""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'operation': operation,
+            'status': 'running',
+            'created': time.time(),
+            'finished': None,
+            'total': len(targets),
+            'done': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'devices': {target: {'status': 'queued', 'error': None} for target in targets},
+        }
+
+        with self.lock:
+            self.jobs[job_id] = job
+            self._prune()
+        return job_id
+
+    def submit(self, operation, targets, action):
+        """Start action(target) for every target, returning the job right away
+
+        action may be a coroutine function, it then runs on the event loop.
+        """
+        # The same device twice in one job would run the operation twice
+        targets = list(dict.fromkeys(targets))
+        job_id = self.create(operation, targets)
+
+        for target in targets:
+            if asyncio.iscoroutinefunction(action):
+                event_loop.submit(self._run_one_async(job_id, target, action))
+            else:
+                self.executor.submit(self._run_one, job_id, target, action)
+
+        return self.get(job_id)
+
+    def _run_one(self, job_id, target, action):
+        """Run the action for one device and record the outcome"""
+        self.set_device(job_id, target, status='running')
+        try:
+            result = action(target) or {}
+        except Exception as e:
+            logger.error("Batch job %s: %s raised %s", job_id, target, e, exc_info=True, extra={'device': target})
+            result = {'success': False, 'error': str(e)}
+
+        self.finish_device(job_id, target, bool(result.get('success')), result.get('error'))
+
+    async def _run_one_async(self, job_id, target, action):
+        """Async _run_one, limited by the same number of workers"""
+        async with self.slots:
+            self.set_device(job_id, target, status='running')
+            try:
+                result = await action(target) or {}
+            except Exception as e:
+                logger.error("Batch job %s: %s raised %s", job_id, target, e, exc_info=True, extra={'device': target})
+                result = {'success': False, 'error': str(e)}
+
+        self.finish_device(job_id, target, bool(result.get('success')), result.get('error'))
+
+    def stop(self):
+        """Drop queued work; operations already sent to a device finish on their own"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def update_job(self, job_id, **fields):
+        """Set extra job-level fields (e.g. the current wave)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                job.update(fields)
+
+    def set_device(self, job_id, target, **fields):
+        """Update the progress fields of one device"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job and target in job['devices']:
+                job['devices'][target].update(fields)
+
+    def finish_device(self, job_id, target, success, error=None):
+        """Record the final outcome for one device"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job['devices'][target].update({
+                'status': 'success' if success else 'failed',
+                'error': None if success else (error or 'Unknown error'),
+            })
+            job['done'] += 1
+            job['succeeded' if success else 'failed'] += 1
+            logger.debug("Batch %s job %s: %s %s %s", job['operation'], job_id, target,
+                         job['devices'][target]['status'], error or '', extra={'device': target})
+            if job['done'] >= job['total'] and job['status'] == 'running':
+                self._finish(job)
+
+    def finish_job(self, job_id, status):
+        """End a job early (e.g. aborted), regardless of remaining devices"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job and job['status'] == 'running':
+                self._finish(job, status)
+
+    def _finish(self, job, status='finished'):
+        """Mark a job as done (caller holds the lock)"""
+        job['status'] = status
+        job['finished'] = time.time()
+        logger.info("Batch %s job %s %s: %s ok, %s failed", job['operation'], job['id'], status, job['succeeded'], job['failed'])
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the limit (caller holds the lock)"""
+        finished = sorted(
+            (job for job in self.jobs.values() if job['status'] != 'running'),
+            key=lambda job: job['created']
+        )
+        for job in finished[:max(0, len(self.jobs) - self.keep)]:
+            del self.jobs[job['id']]
+
+    def get(self, job_id):
+        """Get a copy of a job, or None"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
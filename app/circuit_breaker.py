@@ -0,0 +1,148 @@
+"""
+Per-device circuit breaker
+After a few failed requests in a row a device is considered offline and
+requests to it fail immediately, instead of each waiting for a timeout.
+Once the cooldown has passed a cheap TCP connect checks whether it's back.
+"""
+import logging
+import socket
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_breakers = {}
+_lock = threading.Lock()
+_settings = {
+    'threshold': 3,
+    'cooldown': 60,
+    'probe_timeout': 1,
+}
+
+
+class DeviceOffline(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a device whose circuit is open"""
+
+
+def configure(threshold=None, cooldown=None, probe_timeout=None):
+    """Set how many failures open the circuit and how long it stays open"""
+    with _lock:
+        if threshold is not None:
+            _settings['threshold'] = max(1, int(threshold))
+        if cooldown is not None:
+            _settings['cooldown'] = max(1, float(cooldown))
+        if probe_timeout is not None:
+            _settings['probe_timeout'] = float(probe_timeout)
+
+    logger.info("Circuit breaker: offline after %s failures, retry after %gs", _settings['threshold'], _settings['cooldown'])
+
+
+def _entry(host):
+    """Get the breaker state for a host (caller holds the lock)"""
+    entry = _breakers.get(host)
+    if entry is None:
+        entry = _breakers[host] = {
+            'failures': 0,
+            'opened': None,
+            'offline_since': None,
+            'probing': False,
+        }
+    return entry
+
+
+def _reachable(host, port=80):
+    """Cheap half-open check: can we open a TCP connection at all?"""
+    try:
+        with socket.create_connection((host, port), timeout=_settings['probe_timeout']):
+            return True
+    except OSError:
+        return False
+
+
+def allow(host):
+    """Whether a request to this host may go out
+
+    While the circuit is open this returns False without touching the
+    network. After the cooldown one caller gets to do a TCP check; if the
+    device answers the circuit is half-open and requests go through again.
+    """
+    with _lock:
+        entry = _breakers.get(host)
+        if entry is None or entry['opened'] is None:
+            return True
+        if entry['probing'] or time.monotonic() - entry['opened'] < _settings['cooldown']:
+            return False
+        entry['probing'] = True
+
+    reachable = _reachable(host)
+
+    with _lock:
+        entry['probing'] = False
+        if reachable:
+            # Half-open: let requests through, the next failure opens it again
+            entry['opened'] = None
+            entry['failures'] = _settings['threshold'] - 1
+            logger.info("Circuit breaker: %s answers again, retrying", host, extra={'device': host})
+        else:
+            entry['opened'] = time.monotonic()
+    return reachable
+
+
+def check(host):
+    """Raise DeviceOffline if requests to this host shouldn't go out"""
+    if not allow(host):
+        raise DeviceOffline(f"Device {host} is offline, not retrying before the cooldown has passed")
+
+
+def record_success(host):
+    """A request got an answer: close the circuit"""
+    with _lock:
+        entry = _breakers.get(host)
+        if entry is None:
+            return
+        if entry['opened'] is not None or entry['failures'] >= _settings['threshold']:
+            logger.info("✓ Circuit breaker: %s is back online", host, extra={'device': host})
+        del _breakers[host]
+
+
+def record_failure(host):
+    """A request failed without an answer: count it, open the circuit at the threshold"""
+    with _lock:
+        entry = _entry(host)
+        entry['failures'] += 1
+        if entry['offline_since'] is None:
+            entry['offline_since'] = time.time()
+        if entry['opened'] is None and entry['failures'] >= _settings['threshold']:
+            entry['opened'] = time.monotonic()
+            logger.warning("⚠ Circuit breaker: %s is offline after %s failures", host, entry['failures'], extra={'device': host})
+
+
+def is_open(host):
+    """Whether the device is currently considered offline"""
+    with _lock:
+        entry = _breakers.get(host)
+        return bool(entry and entry['opened'] is not None)
+
+
+def offline_since(host):
+    """When the current run of failures started, if the circuit is open"""
+    with _lock:
+        entry = _breakers.get(host)
+        if entry and entry['opened'] is not None:
+            return entry['offline_since']
+        return None
+
+
+def snapshot():
+    """State of all devices that have failed recently"""
+    with _lock:
+        return {
+            host: {
+                'open': entry['opened'] is not None,
+                'failures': entry['failures'],
+                'offline_since': entry['offline_since'],
+            }
+            for host, entry in _breakers.items()
+        }
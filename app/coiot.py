@@ -0,0 +1,194 @@
+"""
+Gen1 CoIoT listener
+Gen1 devices multicast their status as CoAP packets (CoIoT) on UDP 5683.
+Listening to these gives status updates and IP changes without polling.
+"""
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+
+from fingerprint_cache import normalize_mac
+
+logger = logging.getLogger(__name__)
+
+COIOT_GROUP = '224.0.1.187'
+COIOT_PORT = 5683
+
+# Shelly-specific CoAP options
+OPTION_GLOBAL_DEVID = 3332
+OPTION_STATUS_VALIDITY = 3412
+OPTION_STATUS_SERIAL = 3420
+
+
+def parse_coap(packet):
+    """Split a CoAP packet into (code, options, payload), or None if it isn't one"""
+    if len(packet) < 4:
+        return None
+
+    header, code, _ = struct.unpack('!BBH', packet[:4])
+    if header >> 6 != 1:
+        return None
+
+    pos = 4 + (header & 0x0F)
+    options = {}
+    number = 0
+    payload = b''
+
+    while pos < len(packet):
+        byte = packet[pos]
+        pos += 1
+        if byte == 0xFF:
+            payload = packet[pos:]
+            break
+
+        delta, length = byte >> 4, byte & 0x0F
+        values = []
+        for nibble in (delta, length):
+            if nibble == 13:
+                values.append(packet[pos] + 13)
+                pos += 1
+            elif nibble == 14:
+                values.append(struct.unpack('!H', packet[pos:pos + 2])[0] + 269)
+                pos += 2
+            elif nibble == 15:
+                return None
+            else:
+                values.append(nibble)
+
+        number += values[0]
+        options[number] = packet[pos:pos + values[1]]
+        pos += values[1]
+
+    return code, options, payload
+
+
+def parse_coiot(packet):
+    """Decode a CoIoT status packet into a dict, or None for anything else"""
+    parsed = parse_coap(packet)
+    if parsed is None:
+        return None
+
+    code, options, payload = parsed
+    devid = options.get(OPTION_GLOBAL_DEVID)
+    if not devid or not payload:
+        return None
+
+    # Global device id looks like "SHSW-1#A4CF12F454B1#2"
+    parts = devid.decode('ascii', 'replace').split('#')
+    if len(parts) < 2:
+        return None
+
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+
+    # Status packets carry "G": [[channel, sensor_id, value], ...]; the
+    # description packet (blk/sen) is not interesting here
+    if 'G' not in data:
+        return None
+
+    validity = options.get(OPTION_STATUS_VALIDITY)
+    serial = options.get(OPTION_STATUS_SERIAL)
+    return {
+        'code': code,
+        'model': parts[0],
+        'mac': normalize_mac(parts[1]),
+        'validity': int.from_bytes(validity, 'big') if validity else None,
+        'serial': int.from_bytes(serial, 'big') if serial else None,
+        'sensors': {str(item[1]): item[2] for item in data['G'] if len(item) >= 3},
+    }
+
+
+class CoIoTListener:
+    """Listens for CoIoT multicast and feeds the status cache and inventory"""
+
+    def __init__(self, inventory, status_cache, fingerprints=None,
+                 host='', port=COIOT_PORT, group=COIOT_GROUP):
+        self.inventory = inventory
+        self.status_cache = status_cache
+        self.fingerprints = fingerprints
+        self.host = host
+        self.port = port
+        self.group = group
+        self.last_seen = {}
+        self.validity = {}
+        self._sock = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Open the socket and listen in the background"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        if self.group:
+            membership = struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.settimeout(1)
+        self._sock = sock
+
+        threading.Thread(target=self._run, name='coiot', daemon=True).start()
+        logger.info("✓ Listening for CoIoT on %s:%s", self.group or self.host, self.port)
+
+    def stop(self):
+        """Stop listening"""
+        self._stopped.set()
+
+    def _run(self):
+        """Receive loop"""
+        try:
+            while not self._stopped.is_set():
+                try:
+                    packet, (address, _) = self._sock.recvfrom(4096)
+                except socket.timeout:
+                    continue
+                try:
+                    self.handle_packet(packet, address)
+                except Exception as e:
+                    logger.debug("Bad CoIoT packet from %s: %s", address, e)
+        finally:
+            self._sock.close()
+
+    def handle_packet(self, packet, address):
+        """Apply one received packet"""
+        message = parse_coiot(packet)
+        if message is None or not message['mac']:
+            return
+
+        device = self.inventory.find(mac=message['mac'])
+        if device is None:
+            return
+
+        device_id = device['id']
+        self.last_seen[device_id] = time.monotonic()
+        if message['validity']:
+            # Even values are in 1/10 s units, odd values in 4 s units
+            validity = message['validity']
+            self.validity[device_id] = validity * 4 if validity & 1 else validity / 10
+
+        self.status_cache.merge_status(device_id, {'coiot': message['sensors']}, source='coiot')
+
+        # The packet's source address is the device's current IP; the
+        # configuration_url in HA doesn't follow DHCP changes
+        if device.get('ip') != address:
+            logger.info("CoIoT: %s moved from %s to %s", device.get('name'), device.get('ip'), address, extra={'device': address})
+            self.inventory.update_ip(device_id, address)
+            if self.fingerprints is not None:
+                self.fingerprints.remember(
+                    address,
+                    device.get('generation') or 1,
+                    model=message['model'],
+                    mac=message['mac'],
+                    device_id=device_id
+                )
+
+    def is_live(self, device_id):
+        """Whether this device's status is arriving over CoIoT"""
+        seen = self.last_seen.get(device_id)
+        if seen is None:
+            return False
+        # Mains powered devices publish every few seconds; allow for lost packets
+        return time.monotonic() - seen < max(self.validity.get(device_id, 0), 60)
@@ -0,0 +1,164 @@
+"""
+Search index over the device rows
+Keeps one row per device with its search text and sort keys worked out in
+advance, and follows the inventory version, so filtering, sorting and
+paging the device table is done here instead of in the browser.
+"""
+import logging
+import re
+import threading
+
+from fingerprint_cache import normalize_mac
+
+logger = logging.getLogger(__name__)
+
+MAC_TERM = re.compile(r'^[0-9a-f]{2}([:-][0-9a-f]{2})+$')
+
+# Columns the table can be sorted on
+SORT_COLUMNS = ('name', 'type', 'generation', 'ip', 'mac', 'fw', 'auth', 'online', 'has_update')
+
+# Columns that can be filtered on by exact value
+FILTER_COLUMNS = ('generation', 'auth', 'online', 'has_update', 'type')
+
+
+def _text(value):
+    return str(value).lower() if value is not None else ''
+
+
+def _ip_key(ip):
+    """Sort IPv4 addresses numerically (10.0.0.9 before 10.0.0.10), anything else after them"""
+    try:
+        return (0, tuple(int(part) for part in ip.split('.')))
+    except (AttributeError, ValueError):
+        return (1, _text(ip))
+
+
+def search_text(row):
+    """Lower-case name, IP, MAC (with and without separators), type and firmware"""
+    mac = row.get('mac')
+    parts = [row.get('name'), row.get('ip'), mac, normalize_mac(mac), row.get('type'), row.get('fw')]
+    return '\n'.join(_text(part) for part in parts if part)
+
+
+def search_terms(query):
+    """Lower-case terms of a search query; all of them have to match"""
+    terms = []
+    for term in _text(query).split():
+        # 'aa:bb:cc' finds the MAC whichever way it was written
+        terms.append(normalize_mac(term).lower() if MAC_TERM.match(term) else term)
+    return terms
+
+
+def sort_keys(row):
+    """Comparable key per sort column; missing values sort last"""
+    keys = {}
+    for column in SORT_COLUMNS:
+        value = row.get(column)
+        if column == 'ip':
+            key = _ip_key(value) if value else None
+        elif column == 'mac':
+            key = normalize_mac(value)
+        elif isinstance(value, str):
+            key = value.lower()
+        elif isinstance(value, bool):
+            key = int(value)
+        elif isinstance(value, (int, float)) or value is None:
+            key = value
+        else:
+            key = _text(value)
+        keys[column] = (key is None, key if key is not None else 0)
+    return keys
+
+
+def parse_sort(value):
+    """'name,-ip' -> [('name', False), ('ip', True)]; unknown columns are skipped"""
+    sort = []
+    for column in (value or '').split(','):
+        descending = column.startswith('-')
+        column = column.lstrip('-+').strip()
+        if column in SORT_COLUMNS:
+            sort.append((column, descending))
+    return sort or [('name', False)]
+
+
+def parse_filter(value):
+    """Query string filter value as the type it has in the rows"""
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+class DeviceSearchIndex:
+    """Device rows with precomputed search text and sort keys, in step with the inventory"""
+
+    def __init__(self, inventory, build_rows):
+        self.inventory = inventory
+        self.build_rows = build_rows
+        self.lock = threading.Lock()
+        self.version = None
+        # device id -> (row, search text, sort keys)
+        self.entries = {}
+
+    def _add(self, rows):
+        """Index rows (caller holds the lock)"""
+        for row in rows:
+            self.entries[row['id']] = (row, search_text(row), sort_keys(row))
+
+    def sync(self):
+        """Apply the inventory changes since the last sync; returns the version"""
+        with self.lock:
+            delta = self.inventory.changes_since(self.version) if self.version is not None else None
+            if delta is None:
+                # First use, or too far behind: index everything
+                self.inventory.ensure_loaded()
+                version = self.inventory.version
+                devices = self.inventory.get_devices()
+                self.entries = {}
+                self._add(self.build_rows(devices))
+                self.version = version
+                logger.debug("Search index rebuilt: %s devices at version %s", len(self.entries), version)
+            elif delta[0] != self.version:
+                version, changed, removed = delta
+                for device_id in removed:
+                    self.entries.pop(device_id, None)
+                self._add(self.build_rows(changed))
+                self.version = version
+            return self.version
+
+    def _matches(self, search, filters):
+        """Entries matching a search and filters"""
+        terms = search_terms(search)
+        filters = filters or {}
+        with self.lock:
+            return [
+                entry for entry in self.entries.values()
+                if all(term in entry[1] for term in terms)
+                and all(entry[0].get(column) == value for column, value in filters.items())
+            ]
+
+    def query(self, search='', filters=None, sort=None, offset=0, limit=100):
+        """(version, total, rows) for one page of the matching devices, sorted
+
+        search matches devices that contain every term in their name, IP,
+        MAC, type or firmware; filters are exact column values; sort is a
+        list of (column, descending) pairs.
+        """
+        version = self.sync()
+        matches = self._matches(search, filters)
+        # Stable sorts from the last column to the first give the multi-column
+        # order; missing values go last either way
+        for column, descending in reversed(sort or [('name', False)]):
+            matches.sort(key=lambda entry: entry[2][column], reverse=descending)
+            if descending:
+                matches.sort(key=lambda entry: entry[2][column][0])
+        return version, len(matches), [entry[0] for entry in matches[offset:offset + limit]]
+
+    def select(self, search='', filters=None):
+        """ip and auth of every matching device with an IP, e.g. for select all"""
+        self.sync()
+        return [
+            {'ip': entry[0]['ip'], 'auth': bool(entry[0].get('auth'))}
+            for entry in self._matches(search, filters) if entry[0].get('ip')
+        ]
@@ -0,0 +1,84 @@
+"""
+Shared asyncio event loop for the async Shelly clients
+One loop on a background thread runs every async device call, so thousands
+of requests can be in flight without a thread per device. Synchronous code
+hands coroutines to it with submit() or run().
+"""
+import asyncio
+import logging
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_session = None
+_lock = threading.Lock()
+_settings = {
+    'pool_size': 2,
+    'retries': 1,
+}
+
+
+def configure(pool_size=None, retries=None):
+    """Set connections per device and connection retries for the shared session"""
+    if pool_size is not None:
+        _settings['pool_size'] = max(1, int(pool_size))
+    if retries is not None:
+        _settings['retries'] = max(0, int(retries))
+
+
+def get_loop():
+    """Get the shared loop, starting its thread on first use"""
+    global _loop
+    if _loop is not None:
+        return _loop
+
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='event-loop', daemon=True).start()
+            _loop = loop
+            logger.info("✓ Async event loop started")
+        return _loop
+
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop, returning a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared loop and wait for its result"""
+    return submit(coro).result(timeout)
+
+
+def get_session():
+    """The shared aiohttp session (only call this from the loop)"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=_settings['pool_size'])
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+def retries():
+    """How often a request that never connected is retried"""
+    return _settings['retries']
+
+
+async def _close_session():
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+def stop():
+    """Close the session and stop the loop"""
+    if _loop is None:
+        return
+    try:
+        run(_close_session(), timeout=5)
+    except Exception as e:
+        logger.debug("Closing the async session failed: %s", e)
+    _loop.call_soon_threadsafe(_loop.stop)
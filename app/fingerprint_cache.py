@@ -0,0 +1,163 @@
+"""
+Persistent device fingerprint cache
+Remembers generation, model and last-known IP per device so we don't
+have to re-detect the generation on every request
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_mac(mac):
+    """Normalize a MAC address to upper case hex without separators"""
+    if not mac or mac == 'Unknown':
+        return None
+    return mac.replace(':', '').replace('-', '').upper()
+
+
+class FingerprintCache:
+    """Device fingerprints keyed by MAC and HA device id, stored in the add-on data dir"""
+
+    def __init__(self, path=None):
+        data_dir = os.environ.get('DATA_DIR', '/data')
+        self.path = path or os.path.join(data_dir, 'fingerprints.json')
+        self.lock = threading.Lock()
+        self.records = {}
+        # device id / IP -> record key, so lookups don't scan every record
+        self.by_device_id = {}
+        self.by_ip = {}
+        self._load()
+
+    def _key(self, mac=None, device_id=None, ip=None):
+        """Primary key for a record, most stable identifier first"""
+        mac = normalize_mac(mac)
+        if mac:
+            return f"mac:{mac}"
+        if device_id:
+            return f"id:{device_id}"
+        if ip:
+            return f"ip:{ip}"
+        return None
+
+    def _load(self):
+        """Load fingerprints from disk"""
+        try:
+            with open(self.path) as f:
+                self.records = json.load(f)
+            logger.info("✓ Loaded %s device fingerprints from %s", len(self.records), self.path)
+        except FileNotFoundError:
+            self.records = {}
+        except Exception as e:
+            logger.warning("⚠ Could not load fingerprint cache %s: %s", self.path, e)
+            self.records = {}
+
+        for key, record in self.records.items():
+            self._index(key, record)
+
+    def _index(self, key, record):
+        """Add a record to the device id and IP indexes (caller holds the lock)"""
+        if record.get('device_id'):
+            self.by_device_id[record['device_id']] = key
+        if record.get('ip'):
+            self.by_ip[record['ip']] = key
+
+    def _delete(self, key):
+        """Remove a record and its index entries (caller holds the lock)"""
+        record = self.records.pop(key, None)
+        if record is None:
+            return
+        for index, field in ((self.by_device_id, 'device_id'), (self.by_ip, 'ip')):
+            if record.get(field) and index.get(record[field]) == key:
+                del index[record[field]]
+
+    def _save(self):
+        """Write fingerprints to disk atomically (caller holds the lock)"""
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.records, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning("⚠ Could not save fingerprint cache %s: %s", self.path, e)
+
+    def _find(self, mac=None, device_id=None, ip=None):
+        """Find the key of a matching record (caller holds the lock)"""
+        mac = normalize_mac(mac)
+        if mac and f"mac:{mac}" in self.records:
+            return f"mac:{mac}"
+
+        if device_id and device_id in self.by_device_id:
+            return self.by_device_id[device_id]
+        if ip and ip in self.by_ip:
+            return self.by_ip[ip]
+
+        return None
+
+    def lookup(self, mac=None, device_id=None, ip=None):
+        """Return the cached fingerprint for a device, or None"""
+        with self.lock:
+            key = self._find(mac, device_id, ip)
+            metrics.cache_lookup('fingerprint', key is not None)
+            if key is None:
+                return None
+
+            record = self.records[key]
+            # A different MAC behind the same id/IP means it's another device
+            if normalize_mac(mac) and record.get('mac') and record['mac'] != normalize_mac(mac):
+                logger.info("MAC changed for %s, dropping fingerprint", device_id or ip)
+                self._delete(key)
+                self._save()
+                return None
+
+            return dict(record)
+
+    def remember(self, ip, generation, model=None, mac=None, device_id=None):
+        """Store or refresh the fingerprint of a device"""
+        if not generation:
+            return
+
+        mac = normalize_mac(mac)
+        record = {
+            'generation': generation,
+            'model': model,
+            'ip': ip,
+            'mac': mac,
+            'device_id': device_id,
+        }
+
+        with self.lock:
+            key = self._key(mac, device_id, ip)
+            existing = self.records.get(key, {})
+            # Keep identifiers we learned earlier but don't know right now
+            for field in ('model', 'mac', 'device_id'):
+                if record[field] is None:
+                    record[field] = existing.get(field)
+
+            if all(existing.get(field) == value for field, value in record.items()):
+                return
+
+            # Drop stale records that point at the same device or IP
+            for other_key in {self.by_ip.get(ip), self.by_device_id.get(device_id) if device_id else None}:
+                if other_key is not None and other_key != key:
+                    self._delete(other_key)
+
+            record['updated'] = time.time()
+            self._delete(key)
+            self.records[key] = record
+            self._index(key, record)
+            self._save()
+
+    def invalidate(self, mac=None, device_id=None, ip=None):
+        """Forget a device, e.g. after a failed call"""
+        with self.lock:
+            key = self._find(mac, device_id, ip)
+            if key is not None:
+                logger.debug("Invalidating fingerprint %s", key)
+                self._delete(key)
+                self._save()
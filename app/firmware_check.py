@@ -0,0 +1,126 @@
+"""
+Fleet-wide firmware availability
+Checks for new firmware in the background and caches the answer per
+model + firmware version, so identical devices are only asked once and
+rendering the device table never triggers a live check
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class FirmwareChecker:
+    """Background firmware checks, cached per (model, firmware)"""
+
+    def __init__(self, inventory, client_factory, ttl=6 * 3600, retry_after=900,
+                 max_concurrent=4, scan_interval=60, on_change=None):
+        self.inventory = inventory
+        self.client_factory = client_factory
+        # on_change(model, fw) is called when the answer for a group changes
+        self.on_change = on_change
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.scan_interval = scan_interval
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix='fw-check')
+
+        self.lock = threading.Lock()
+        self.results = {}
+        self.failed = {}
+        self.in_flight = set()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _key(device):
+        """Cache key: devices with the same model and firmware get the same answer"""
+        model = device.get('type') or device.get('model')
+        fw = device.get('fw')
+        if not model or not fw or not device.get('generation'):
+            return None
+        return (model, fw)
+
+    def start(self):
+        """Check in the background, picking up new models/versions as they appear"""
+        threading.Thread(target=self._run, name='fw-check', daemon=True).start()
+
+    def stop(self):
+        """Stop checking"""
+        self._stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        """Loop: start checks for anything missing or expired"""
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Firmware check failed: %s", e, exc_info=True)
+            self._stopped.wait(self.scan_interval)
+
+    def refresh(self):
+        """Start checks for every (model, firmware) that has no fresh answer"""
+        now = time.time()
+        groups = {}
+        for device in self.inventory.get_devices():
+            key = self._key(device)
+            if key and device.get('ip'):
+                groups.setdefault(key, []).append(device)
+
+        with self.lock:
+            stale = [
+                key for key in groups
+                if key not in self.in_flight
+                and now - self.results.get(key, {}).get('checked', 0) > self.ttl
+                and now - self.failed.get(key, 0) > self.retry_after
+            ]
+            self.in_flight.update(stale)
+
+        for key in stale:
+            self.executor.submit(self._check, key, groups[key])
+
+        if stale:
+            logger.info("Checking firmware for %s model/version combination(s)", len(stale))
+
+    def _check(self, key, devices):
+        """Ask one device per group; try the next one if it doesn't answer"""
+        try:
+            for device in devices:
+                client = self.client_factory(device['ip'], device.get('generation'))
+                result = client.check_for_update() if client else None
+                if result is not None:
+                    with self.lock:
+                        old = self.results.get(key)
+                        self.results[key] = dict(result, checked=time.time())
+                        self.failed.pop(key, None)
+                    if self.on_change and (not old or any(old[k] != result[k] for k in result)):
+                        self.on_change(*key)
+                    return
+
+            logger.debug("No device of %s %s answered the firmware check", key[0], key[1])
+            with self.lock:
+                self.failed[key] = time.time()
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+
+    def lookup(self, device, has_password=False):
+        """Cached firmware fields for a device (never does a live check)"""
+        key = self._key(device)
+        with self.lock:
+            result = self.results.get(key) if key else None
+        metrics.cache_lookup('firmware', bool(result))
+        if not result:
+            return {}
+
+        has_update = result['has_update']
+        return {
+            'has_update': has_update,
+            'latest_version': result['latest_version'],
+            # Protected devices can only be updated when we know the password
+            'can_update': has_update and (has_password or not device.get('auth')),
+            'fw_checked': result['checked'],
+        }
@@ -1,143 +1,300 @@
 """
 Home Assistant WebSocket API client
 Used to fetch device registry and config entries
+
+Keeps one authenticated connection open in the background. Replies are
+matched to requests by message id, so several commands can be in flight
+on the same connection at once.
 """
 import json
 import logging
 import os
+import threading
+from concurrent.futures import Future
 import websocket
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 
 class HAWebSocketClient:
     """Client to interact with Home Assistant via WebSocket"""
-    
-    def __init__(self):
+
+    def __init__(self, heartbeat_interval=30, request_timeout=10, max_backoff=60):
         self.supervisor_token = os.environ.get('SUPERVISOR_TOKEN', '')
-        self.ws_url = 'ws://supervisor/core/websocket'
+        ha_url = os.environ.get('HA_URL', 'http://supervisor/core')
+        self.ws_url = ha_url.replace('http', 'ws', 1) + '/websocket'
         self.message_id = 0
-        
+        self.heartbeat_interval = heartbeat_interval
+        self.request_timeout = request_timeout
+        self.max_backoff = max_backoff
+
+        self._ws = None
+        self._send_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pending = {}
+        self._subscriptions = {}
+        self._subscription_ids = {}
+        self._reconnect_listeners = []
+        self._connected = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
     def _get_next_id(self):
         """Get next message ID"""
         self.message_id += 1
         return self.message_id
-    
-    def _send_message(self, ws, message):
-        """Send a message and return the response"""
-        msg_json = json.dumps(message)
-        logger.debug(f"Sending: {msg_json}")
-        ws.send(msg_json)
-        
-        # Receive response
-        result = ws.recv()
-        logger.debug(f"Received: {result[:200]}...")
-        return json.loads(result)
-    
-    def get_device_registry(self):
-        """Get device registry from Home Assistant via WebSocket"""
-        logger.info("Connecting to HA WebSocket API for device registry...")
-        
+
+    def start(self):
+        """Start the background connection (idempotent)"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='ha-websocket', daemon=True)
+            self._thread.start()
+            threading.Thread(target=self._heartbeat, name='ha-websocket-ping', daemon=True).start()
+
+    def stop(self):
+        """Close the connection and stop reconnecting"""
+        self._stopped.set()
+        self._close()
+
+    def _close(self):
+        """Close the current socket, the reader will notice and reconnect"""
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _connect(self):
+        """Open a socket and run the auth handshake"""
+        logger.info("Connecting to HA WebSocket API...")
+        ws = websocket.create_connection(self.ws_url, timeout=10)
+
         try:
-            # Connect to WebSocket
-            ws = websocket.create_connection(self.ws_url, timeout=10)
-            
             # Step 1: Receive auth_required
             auth_required = json.loads(ws.recv())
             if auth_required.get('type') != 'auth_required':
-                logger.error(f"Unexpected message: {auth_required}")
-                ws.close()
-                return []
-            
-            logger.debug("✓ Auth required received")
-            
+                raise ConnectionError(f"Unexpected message: {auth_required}")
+
             # Step 2: Send authentication
-            auth_msg = {
+            ws.send(json.dumps({
                 'type': 'auth',
                 'access_token': self.supervisor_token
-            }
-            ws.send(json.dumps(auth_msg))
-            
+            }))
+
             # Step 3: Receive auth result
             auth_result = json.loads(ws.recv())
             if auth_result.get('type') != 'auth_ok':
-                logger.error(f"Authentication failed: {auth_result}")
-                ws.close()
-                return []
-            
-            logger.info("✓ WebSocket authenticated")
-            
-            # Step 4: Request device registry
-            device_request = {
-                'id': self._get_next_id(),
-                'type': 'config/device_registry/list'
-            }
-            response = self._send_message(ws, device_request)
-            
-            # Step 5: Parse response
+                raise ConnectionError(f"Authentication failed: {auth_result}")
+        except Exception:
+            ws.close()
+            raise
+
+        # From here on the reader thread blocks on recv
+        ws.settimeout(None)
+        logger.info("✓ WebSocket authenticated")
+        return ws
+
+    def _run(self):
+        """Connection loop: connect, read until the socket drops, back off, repeat"""
+        backoff = 1
+
+        while not self._stopped.is_set():
+            try:
+                ws = self._connect()
+            except Exception as e:
+                logger.error("WebSocket connect failed: %s, retrying in %ss", e, backoff)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            with self._send_lock:
+                self._ws = ws
+                # Message ids must increase per connection, start over
+                self.message_id = 0
+            self._connected.set()
+            backoff = 1
+
+            # Subscriptions don't survive a reconnect, restore them once the
+            # reader is running (their replies arrive through it)
+            threading.Thread(target=self._on_connected, name='ha-websocket-resubscribe', daemon=True).start()
+
+            try:
+                self._read_loop(ws)
+            except Exception as e:
+                if not self._stopped.is_set():
+                    logger.warning("⚠ WebSocket connection lost: %s", e)
+            finally:
+                self._connected.clear()
+                self._fail_pending(ConnectionError('WebSocket connection lost'))
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
+    def _read_loop(self, ws):
+        """Dispatch incoming frames to the request waiting for them"""
+        while not self._stopped.is_set():
+            raw = ws.recv()
+            if not raw:
+                raise ConnectionError('Connection closed by Home Assistant')
+
+            message = json.loads(raw)
+            # Coalesced frames arrive as a list
+            for item in message if isinstance(message, list) else [message]:
+                self._dispatch(item)
+
+    def _on_connected(self):
+        """Restore event subscriptions and notify listeners after (re)connecting"""
+        self._subscription_ids = {}
+        for event_type, callback in list(self._subscriptions.items()):
+            self._subscribe(event_type, callback)
+
+        for listener in list(self._reconnect_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.error("Error in reconnect listener: %s", e, exc_info=True)
+
+    def _subscribe(self, event_type, callback):
+        """Send a subscribe_events command for one event type"""
+        try:
+            response = self.send_command('subscribe_events', event_type=event_type)
+            if response.get('success'):
+                self._subscription_ids[response['id']] = callback
+                logger.info("✓ Subscribed to %s events", event_type)
+            else:
+                logger.error("Failed to subscribe to %s: %s", event_type, response)
+        except Exception as e:
+            logger.error("WebSocket error subscribing to %s: %s", event_type, e)
+
+    def subscribe_events(self, event_type, callback):
+        """Call callback(event) for every event of this type, across reconnects"""
+        self._subscriptions[event_type] = callback
+        if self._connected.is_set():
+            self._subscribe(event_type, callback)
+        else:
+            # Subscribed from _on_connected once the connection is up
+            self.start()
+
+    def add_reconnect_listener(self, listener):
+        """Call listener() after every (re)connect, e.g. to resync missed events"""
+        self._reconnect_listeners.append(listener)
+
+    def _dispatch(self, message):
+        """Resolve the future for a reply, or hand an event to its subscriber"""
+        if message.get('type') == 'event':
+            callback = self._subscription_ids.get(message.get('id'))
+            if callback is not None:
+                try:
+                    callback(message.get('event', {}))
+                except Exception as e:
+                    logger.error("Error handling event: %s", e, exc_info=True)
+            return
+
+        future = self._pending.pop(message.get('id'), None)
+        if future is not None:
+            future.set_result(message)
+        else:
+            logger.debug("Unsolicited message: %.200s", message)
+
+    def _fail_pending(self, error):
+        """Fail every request still waiting for a reply"""
+        with self._send_lock:
+            self._ws = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _heartbeat(self):
+        """Ping Home Assistant periodically, reconnect if it stops answering"""
+        while not self._stopped.wait(self.heartbeat_interval):
+            if not self._connected.is_set():
+                continue
+            try:
+                response = self.send_command('ping')
+                if response.get('type') != 'pong':
+                    raise ConnectionError(f"Unexpected ping reply: {response}")
+            except Exception as e:
+                logger.warning("⚠ WebSocket heartbeat failed: %s, reconnecting", e)
+                self._close()
+
+    def send_command(self, command_type, timeout=None, **payload):
+        """Send a command over the shared connection and wait for its reply"""
+        with metrics.timed(metrics.HA_WEBSOCKET_SECONDS, metrics.HA_WEBSOCKET_ERRORS, command_type):
+            return self._send_command(command_type, timeout, payload)
+
+    def _send_command(self, command_type, timeout, payload):
+        timeout = timeout or self.request_timeout
+        self.start()
+
+        if not self._connected.wait(timeout):
+            raise ConnectionError('WebSocket not connected')
+
+        future = Future()
+        with self._send_lock:
+            if self._ws is None:
+                raise ConnectionError('WebSocket not connected')
+            message_id = self._get_next_id()
+            self._pending[message_id] = future
+            message = dict(payload, id=message_id, type=command_type)
+            msg_json = json.dumps(message)
+            logger.debug("Sending: %s", msg_json)
+            try:
+                self._ws.send(msg_json)
+            except Exception:
+                self._pending.pop(message_id, None)
+                raise
+
+        try:
+            return future.result(timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    def get_device_registry(self, strict=False):
+        """Get device registry from Home Assistant via WebSocket
+
+        With strict=True errors are raised instead of returning an empty list,
+        so callers can tell a failure apart from an empty registry.
+        """
+        try:
+            response = self.send_command('config/device_registry/list')
+
             if response.get('success'):
                 devices = response.get('result', [])
-                logger.info(f"✓ Got {len(devices)} devices from WebSocket")
-                ws.close()
+                logger.info("✓ Got %s devices from WebSocket", len(devices))
                 return devices
             else:
-                logger.error(f"Failed to get device registry: {response}")
-                ws.close()
+                logger.error("Failed to get device registry: %s", response)
+                if strict:
+                    raise RuntimeError(f"Failed to get device registry: {response.get('error')}")
                 return []
-            
+
         except Exception as e:
-            logger.error(f"WebSocket error getting device registry: {e}", exc_info=True)
+            if strict:
+                raise
+            logger.error("WebSocket error getting device registry: %s", e, exc_info=True)
             return []
-    
+
     def get_config_entries(self):
         """Get config entries from Home Assistant via WebSocket"""
-        logger.info("Connecting to HA WebSocket API for config entries...")
-        
         try:
-            # Connect to WebSocket
-            ws = websocket.create_connection(self.ws_url, timeout=10)
-            
-            # Step 1: Receive auth_required
-            auth_required = json.loads(ws.recv())
-            if auth_required.get('type') != 'auth_required':
-                logger.error(f"Unexpected message: {auth_required}")
-                ws.close()
-                return []
-            
-            # Step 2: Send authentication
-            auth_msg = {
-                'type': 'auth',
-                'access_token': self.supervisor_token
-            }
-            ws.send(json.dumps(auth_msg))
-            
-            # Step 3: Receive auth result
-            auth_result = json.loads(ws.recv())
-            if auth_result.get('type') != 'auth_ok':
-                logger.error(f"Authentication failed: {auth_result}")
-                ws.close()
-                return []
-            
-            logger.info("✓ WebSocket authenticated")
-            
-            # Step 4: Request config entries
-            entries_request = {
-                'id': self._get_next_id(),
-                'type': 'config_entries/list'
-            }
-            response = self._send_message(ws, entries_request)
-            
-            # Step 5: Parse response
+            response = self.send_command('config_entries/list')
+
             if response.get('success'):
                 entries = response.get('result', [])
-                logger.info(f"✓ Got {len(entries)} config entries from WebSocket")
-                ws.close()
+                logger.info("✓ Got %s config entries from WebSocket", len(entries))
                 return entries
             else:
-                logger.error(f"Failed to get config entries: {response}")
-                ws.close()
+                logger.error("Failed to get config entries: %s", response)
                 return []
-            
+
         except Exception as e:
-            logger.error(f"WebSocket error getting config entries: {e}", exc_info=True)
+            logger.error("WebSocket error getting config entries: %s", e, exc_info=True)
             return []
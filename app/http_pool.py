@@ -0,0 +1,105 @@
+"""
+Shared keep-alive HTTP sessions for the Shelly clients
+One pooled session per device host, so repeated calls reuse warm connections.
+Every request goes through the device's circuit breaker.
+"""
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_lock = threading.Lock()
+_settings = {
+    'pool_size': 2,
+    'retries': 1,
+    'backoff': 0.2,
+}
+
+
+def configure(pool_size=None, retries=None, backoff=None):
+    """Set pool size and retry policy for sessions created from now on"""
+    with _lock:
+        if pool_size is not None:
+            _settings['pool_size'] = max(1, int(pool_size))
+        if retries is not None:
+            _settings['retries'] = max(0, int(retries))
+        if backoff is not None:
+            _settings['backoff'] = float(backoff)
+        # Existing sessions keep their adapter, start fresh with the new settings
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+    logger.info("HTTP pool: %s connection(s) per device, %s retries", _settings['pool_size'], _settings['retries'])
+
+
+class DeviceSession(requests.Session):
+    """Session for one device that feeds and respects its circuit breaker"""
+
+    def __init__(self, host):
+        super().__init__()
+        self.host = host
+
+    def request(self, *args, **kwargs):
+        circuit_breaker.check(self.host)
+        try:
+            response = super().request(*args, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            circuit_breaker.record_failure(self.host)
+            raise
+        # Any HTTP answer, even a 401, means the device is there
+        circuit_breaker.record_success(self.host)
+        return response
+
+
+def _create_session(host):
+    """Create a session with a bounded connection pool and retry policy"""
+    # Only connection failures are retried: the request never reached the
+    # device, so this is safe for reboot/auth/update calls as well
+    retry = Retry(
+        total=_settings['retries'],
+        connect=_settings['retries'],
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=_settings['backoff'],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=_settings['pool_size'],
+        max_retries=retry
+    )
+
+    session = DeviceSession(host)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(host):
+    """Get the shared session for a device host"""
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _create_session(host)
+            _sessions[host] = session
+        return session
+
+
+def close_all():
+    """Close all pooled connections"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
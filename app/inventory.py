@@ -0,0 +1,280 @@
+"""
+In-memory Shelly device inventory
+Loaded once from the HA device registry and kept up to date through
+device_registry_updated events. Every change bumps a version number, so
+clients can ask for just the devices that changed since the last one they saw.
+With a store, changes are saved and the last known fleet is restored on boot.
+"""
+import logging
+import threading
+import time
+
+from fingerprint_cache import normalize_mac
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceInventory:
+    """Resident device list indexed by HA device id, MAC and IP"""
+
+    def __init__(self, ha_client, debounce=1.0, max_tombstones=1000, store=None):
+        self.ha_client = ha_client
+        self.store = store
+        self.debounce = debounce
+        self.lock = threading.RLock()
+        self.devices = {}
+        self.enrichment = {}
+        self.by_mac = {}
+        self.by_ip = {}
+        self.loaded = False
+
+        # Version of the last change, per device and for removals. Removals
+        # are kept for a while; deltas older than that need a full reload.
+        # Starting from the clock keeps versions increasing across restarts,
+        # and versions from before a restart always get a full reload.
+        self.version = int(time.time() * 1000)
+        self.oldest_delta = self.version
+        self.changed = {}
+        self.removed = {}
+        self.max_tombstones = max_tombstones
+
+        self._refresh_lock = threading.Lock()
+        self._refresh_done = None
+        self._refresh_timer = None
+
+    def start(self):
+        """Subscribe to registry changes; a full load happens on (re)connect"""
+        ws_client = self.ha_client.ws_client
+        ws_client.subscribe_events('device_registry_updated', self._on_registry_event)
+        # Events may have been missed while disconnected, resync after every reconnect
+        ws_client.add_reconnect_listener(self.refresh)
+
+    def _index(self, device):
+        """Add a device to the MAC and IP indexes (caller holds the lock)"""
+        mac = normalize_mac(device.get('mac'))
+        if mac:
+            self.by_mac[mac] = device['id']
+        if device.get('ip'):
+            self.by_ip[device['ip']] = device['id']
+
+    def _unindex(self, device):
+        """Remove a device from the MAC and IP indexes (caller holds the lock)"""
+        mac = normalize_mac(device.get('mac'))
+        if mac and self.by_mac.get(mac) == device['id']:
+            del self.by_mac[mac]
+        if device.get('ip') and self.by_ip.get(device['ip']) == device['id']:
+            del self.by_ip[device['ip']]
+
+    def _bump(self, device_id):
+        """Record a change to a device (caller holds the lock)"""
+        self.version += 1
+        self.changed[device_id] = self.version
+        self.removed.pop(device_id, None)
+        if self.store is not None:
+            self.store.put_device(device_id, self.devices[device_id], self.enrichment.get(device_id, {}))
+
+    def touch(self, device_id):
+        """Mark a device as changed, e.g. when its live status flips"""
+        with self.lock:
+            if device_id in self.devices:
+                self._bump(device_id)
+
+    def _put(self, device):
+        """Add or replace a device (caller holds the lock)"""
+        device_id = device['id']
+        old = self.devices.get(device_id)
+        if old == device:
+            return False
+        if old:
+            self._unindex(self._view(device_id))
+        self.devices[device_id] = device
+        # HA caught up with an IP change we saw on the network
+        live = self.enrichment.get(device_id, {})
+        if live.get('ip') == device.get('ip'):
+            live.pop('ip', None)
+        self._index(self._view(device_id))
+        self._bump(device_id)
+        return True
+
+    def _remove(self, device_id):
+        """Remove a device (caller holds the lock)"""
+        if device_id not in self.devices:
+            return False
+        self._unindex(self._view(device_id))
+        del self.devices[device_id]
+        self.enrichment.pop(device_id, None)
+
+        self.version += 1
+        self.changed.pop(device_id, None)
+        self.removed[device_id] = self.version
+        if self.store is not None:
+            self.store.remove(device_id)
+        if len(self.removed) > self.max_tombstones:
+            oldest = min(self.removed, key=self.removed.get)
+            self.oldest_delta = self.removed.pop(oldest)
+        return True
+
+    def restore(self, snapshot):
+        """Fill the inventory from a saved snapshot (see InventoryStore.load)
+
+        Restored devices are marked stale, with cached_at set to when their
+        data was saved, until a scan or poll confirms them. The registry part
+        is revalidated by the refresh on the next HA connection.
+        """
+        with self.lock:
+            for row in snapshot:
+                device_id = row['id']
+                if device_id in self.devices:
+                    continue
+                self.devices[device_id] = row['registry']
+                # A device that was already stale when saved keeps its original time
+                self.enrichment[device_id] = dict(row['live'], stale=True, cached_at=row['live'].get('cached_at', row['updated']))
+                self._index(self._view(device_id))
+                self.version += 1
+                self.changed[device_id] = self.version
+            if snapshot:
+                self.loaded = True
+        if snapshot:
+            logger.info("✓ Inventory: restored %s devices from the last run", len(snapshot))
+
+    def refresh(self):
+        """Reload the registry and apply the differences
+
+        Concurrent callers share the refresh that is already running instead
+        of each fetching the registry themselves.
+        """
+        with self._refresh_lock:
+            done = self._refresh_done
+            leader = done is None
+            if leader:
+                done = self._refresh_done = threading.Event()
+
+        if not leader:
+            done.wait()
+            return
+
+        try:
+            devices = self.ha_client.get_shelly_devices(strict=True)
+            with self.lock:
+                seen = set()
+                added = updated = removed = 0
+                for device in devices:
+                    if not device.get('id'):
+                        continue
+                    seen.add(device['id'])
+                    is_new = device['id'] not in self.devices
+                    if self._put(device):
+                        if is_new:
+                            added += 1
+                        else:
+                            updated += 1
+                for device_id in [d for d in self.devices if d not in seen]:
+                    self._remove(device_id)
+                    removed += 1
+                self.loaded = True
+            logger.info("✓ Inventory: %s devices (%s added, %s updated, %s removed)", len(seen), added, updated, removed)
+        except Exception as e:
+            logger.error("❌ Inventory refresh failed: %s", e)
+        finally:
+            with self._refresh_lock:
+                self._refresh_done = None
+            done.set()
+
+    def _schedule_refresh(self):
+        """Coalesce bursts of registry events into one refresh"""
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+            self._refresh_timer = threading.Timer(self.debounce, self.refresh)
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+
+    def _on_registry_event(self, event):
+        """Apply a device_registry_updated event"""
+        data = event.get('data', {})
+        action = data.get('action')
+        device_id = data.get('device_id')
+
+        if action == 'remove':
+            with self.lock:
+                if self._remove(device_id):
+                    logger.info("Inventory: device %s removed", device_id)
+        elif action in ('create', 'update'):
+            # The event only carries the device id, so fetch the registry and
+            # apply whatever changed (debounced, renames come in bursts)
+            logger.debug("Inventory: device %s %sd, refreshing", device_id, action)
+            self._schedule_refresh()
+
+    def ensure_loaded(self):
+        """Load the registry if that hasn't happened yet"""
+        if not self.loaded:
+            self.refresh()
+
+    def merge(self, device_id, patch):
+        """Store live data learned about a device (generation, fw, auth, ...)"""
+        with self.lock:
+            if device_id not in self.devices:
+                return
+            live = self.enrichment.setdefault(device_id, {})
+            view = self._view(device_id)
+            # Live data confirms a device restored from the snapshot
+            confirmed = live.pop('stale', None)
+            if confirmed:
+                live.pop('cached_at', None)
+            if confirmed or any(view.get(key) != value for key, value in patch.items()):
+                live.update(patch)
+                self._bump(device_id)
+
+    def update_ip(self, device_id, ip):
+        """Record a new IP seen on the network, until HA's registry catches up"""
+        with self.lock:
+            if device_id not in self.devices:
+                return False
+            view = self._view(device_id)
+            if view.get('ip') == ip:
+                return False
+            self._unindex(view)
+            self.enrichment.setdefault(device_id, {})['ip'] = ip
+            self._index(self._view(device_id))
+            self._bump(device_id)
+            return True
+
+    def _view(self, device_id):
+        """Registry data with live data on top (caller holds the lock)"""
+        return dict(self.devices[device_id], **self.enrichment.get(device_id, {}))
+
+    def get_devices(self):
+        """Get a copy of all devices"""
+        self.ensure_loaded()
+        with self.lock:
+            return [self._view(device_id) for device_id in self.devices]
+
+    def get(self, device_id):
+        """Get a copy of one device by HA device id"""
+        with self.lock:
+            if device_id in self.devices:
+                return self._view(device_id)
+            return None
+
+    def find(self, mac=None, ip=None):
+        """Get a copy of one device by MAC or IP"""
+        with self.lock:
+            device_id = self.by_mac.get(normalize_mac(mac)) if mac else None
+            if device_id is None and ip:
+                device_id = self.by_ip.get(ip)
+            return self._view(device_id) if device_id else None
+
+    def version_of(self, device_id):
+        """Version of the last change to a device, or None"""
+        with self.lock:
+            return self.changed.get(device_id)
+
+    def changes_since(self, version):
+        """(version, changed devices, removed ids) since a version, or None if too old"""
+        self.ensure_loaded()
+        with self.lock:
+            if version < self.oldest_delta or version > self.version:
+                return None
+            changed = [self._view(device_id) for device_id, v in self.changed.items() if v > version]
+            removed = [device_id for device_id, v in self.removed.items() if v > version]
+            return self.version, changed, removed
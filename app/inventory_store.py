@@ -0,0 +1,168 @@
+"""
+SQLite snapshot of the enriched inventory
+Keeps the last known fleet (registry data, live device data and latest
+status) in the add-on data dir, so the device table can be shown right
+after a restart instead of after a full scan. Changes are collected in
+memory and written in one transaction every few seconds; statuses change
+all the time, so they are only written every few minutes.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id TEXT PRIMARY KEY,
+    mac TEXT,
+    ip TEXT,
+    registry TEXT NOT NULL,
+    live TEXT NOT NULL DEFAULT '{}',
+    status TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS devices_mac ON devices (mac);
+CREATE INDEX IF NOT EXISTS devices_ip ON devices (ip);
+"""
+
+
+class InventoryStore:
+    """Write-behind device snapshot in SQLite"""
+
+    def __init__(self, path=None, flush_interval=5, status_interval=300):
+        data_dir = os.environ.get('DATA_DIR', '/data')
+        self.path = path or os.path.join(data_dir, 'inventory.db')
+        self.flush_interval = flush_interval
+        self.status_interval = status_interval
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        # device id -> (registry, live, time), or None to delete
+        self.pending = {}
+        # device id -> latest status entry
+        self.pending_status = {}
+        self._status_flushed = time.monotonic()
+        self._db = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        """Open the database on first use (caller holds db_lock)"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def load(self):
+        """All saved devices as dicts with registry, live, status and updated"""
+        try:
+            with self.db_lock:
+                rows = self._connect().execute(
+                    'SELECT id, registry, live, status, updated FROM devices'
+                ).fetchall()
+        except Exception as e:
+            logger.warning("⚠ Could not read inventory snapshot %s: %s", self.path, e)
+            return []
+
+        devices = []
+        for device_id, registry, live, status, updated in rows:
+            try:
+                devices.append({
+                    'id': device_id,
+                    'registry': json.loads(registry),
+                    'live': json.loads(live),
+                    'status': json.loads(status) if status else None,
+                    'updated': updated,
+                })
+            except ValueError as e:
+                logger.warning("⚠ Skipping unreadable snapshot row %s: %s", device_id, e)
+        logger.info("✓ Loaded %s devices from inventory snapshot", len(devices))
+        return devices
+
+    def put_device(self, device_id, registry, live):
+        """Queue a device's registry and live data for writing"""
+        with self.lock:
+            self.pending[device_id] = (dict(registry), dict(live), time.time())
+
+    def put_status(self, device_id, status):
+        """Queue a device's latest status entry for writing"""
+        with self.lock:
+            self.pending_status[device_id] = status
+
+    def remove(self, device_id):
+        """Queue a device for deletion"""
+        with self.lock:
+            self.pending[device_id] = None
+            self.pending_status.pop(device_id, None)
+
+    def flush(self, statuses=False):
+        """Write everything queued in one transaction; statuses when due or asked for"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            due = statuses or time.monotonic() - self._status_flushed >= self.status_interval
+            if due:
+                pending_status, self.pending_status = self.pending_status, {}
+                self._status_flushed = time.monotonic()
+            else:
+                pending_status = {}
+        if not pending and not pending_status:
+            return
+
+        deletes = [(device_id,) for device_id, entry in pending.items() if entry is None]
+        upserts = [
+            (device_id, registry.get('mac'), live.get('ip') or registry.get('ip'),
+             json.dumps(registry), json.dumps(live), updated)
+            for device_id, entry in pending.items() if entry is not None
+            for registry, live, updated in [entry]
+        ]
+        status_rows = [(json.dumps(status), device_id) for device_id, status in pending_status.items()]
+
+        try:
+            with self.db_lock:
+                db = self._connect()
+                with db:
+                    db.executemany('DELETE FROM devices WHERE id = ?', deletes)
+                    db.executemany(
+                        """INSERT INTO devices (id, mac, ip, registry, live, updated)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (id) DO UPDATE SET
+                               mac = excluded.mac, ip = excluded.ip, registry = excluded.registry,
+                               live = excluded.live, updated = excluded.updated""",
+                        upserts
+                    )
+                    db.executemany('UPDATE devices SET status = ? WHERE id = ?', status_rows)
+            logger.debug("Inventory snapshot: %s devices, %s statuses, %s removed", len(upserts), len(status_rows), len(deletes))
+        except Exception as e:
+            logger.warning("⚠ Could not write inventory snapshot %s: %s", self.path, e)
+            # Keep the changes for the next attempt, unless newer ones came in
+            with self.lock:
+                for device_id, entry in pending.items():
+                    self.pending.setdefault(device_id, entry)
+                for device_id, status in pending_status.items():
+                    self.pending_status.setdefault(device_id, status)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start writing queued changes in the background"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='inventory-store', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write what's left and close the database"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush(statuses=True)
+        with self.db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
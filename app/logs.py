@@ -0,0 +1,102 @@
+"""
+Logging setup
+Text logs to the add-on log at the configured level, plus a bounded ring
+buffer with the recent events of every device for /api/debug at its own
+level. Log calls tag their device with extra={'device': ip} (or a
+LoggerAdapter).
+"""
+import collections
+import logging
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+# Libraries that are only interesting when something is wrong
+QUIET_LOGGERS = ('urllib3', 'websocket', 'waitress', 'aiohttp', 'asyncio')
+
+
+class StructuredFormatter(logging.Formatter):
+    """'time LEVEL logger: message', with [device=...] when the record has one"""
+
+    def format(self, record):
+        text = super().format(record)
+        device = getattr(record, 'device', None)
+        return f"{text} [device={device}]" if device else text
+
+
+class DeviceEventBuffer(logging.Handler):
+    """Keeps the last few log events of each device, evicting the least recently active devices"""
+
+    def __init__(self, per_device=50, max_devices=1000):
+        super().__init__(logging.DEBUG)
+        self.per_device = per_device
+        self.max_devices = max_devices
+        self.events = collections.OrderedDict()
+
+    def emit(self, record):
+        # Called with self.lock held by Handler.handle()
+        device = getattr(record, 'device', None)
+        if device is None:
+            return
+        try:
+            message = record.getMessage()
+        except Exception:
+            self.handleError(record)
+            return
+
+        events = self.events.get(device)
+        if events is None:
+            events = self.events[device] = collections.deque(maxlen=self.per_device)
+            if len(self.events) > self.max_devices:
+                self.events.popitem(last=False)
+        else:
+            self.events.move_to_end(device)
+
+        events.append({
+            'time': record.created,
+            'level': record.levelname,
+            'source': record.name,
+            'message': message,
+        })
+
+    def get(self, device=None):
+        """Recent events of one device, or of all devices keyed by device"""
+        self.acquire()
+        try:
+            if device is not None:
+                return list(self.events.get(device, ()))
+            return {key: list(events) for key, events in self.events.items()}
+        finally:
+            self.release()
+
+
+device_events = DeviceEventBuffer()
+
+
+def configure(level='info', per_device=50, device_level='info'):
+    """Set up logging for the add-on; returns the numeric console level"""
+    console_level = LEVELS.get(str(level).lower(), logging.INFO)
+    device_events_level = LEVELS.get(str(device_level).lower(), logging.INFO)
+
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(StructuredFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    device_events.per_device = per_device
+    device_events.setLevel(device_events_level)
+    device_events.events.clear()
+
+    # The root logger only lets through what one of the handlers wants, so
+    # debug calls on the hot paths stay cheap unless debug is turned on
+    root = logging.getLogger()
+    root.handlers = [console, device_events]
+    root.setLevel(min(console_level, device_events_level))
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(console_level, logging.WARNING))
+
+    return console_level
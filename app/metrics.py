@@ -0,0 +1,230 @@
+"""
+In-process metrics in the Prometheus text format
+Counters, gauges and histograms with labels, kept in memory and rendered by
+/metrics. Small on purpose: the add-on doesn't need prometheus_client for this.
+"""
+import asyncio
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from circuit_breaker import DeviceOffline
+
+# Seconds; device calls are usually tens of milliseconds on a healthy LAN
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SCAN_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_registry = []
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """Base class: a named family of values keyed by label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def clear(self):
+        """Forget all label combinations"""
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        """Lines in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that is set to the current state"""
+
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        key = self._key(label_values)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Observations counted into fixed buckets, plus their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+
+        names = self.labels + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def error_reason(error):
+    """Short, bounded label for why a call failed"""
+    if isinstance(error, DeviceOffline):
+        return 'offline'
+    if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, (requests.exceptions.ConnectionError, ConnectionError, OSError)):
+        return 'connection'
+    return 'error'
+
+
+@contextmanager
+def timed(histogram, errors, *label_values):
+    """Observe how long the block takes; exceptions are counted by reason and re-raised"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        reason = error_reason(e)
+        errors.inc(*label_values, reason)
+        if reason == 'offline':
+            # Rejected by the circuit breaker without a request, not a latency
+            raise
+        histogram.observe(time.perf_counter() - started, *label_values)
+        raise
+    else:
+        histogram.observe(time.perf_counter() - started, *label_values)
+
+
+DEVICE_REQUEST_SECONDS = Histogram(
+    'shelly_device_request_seconds',
+    'Latency of requests to Shelly devices by generation (1, 2 or probe) and Gen1 path or Gen2 RPC method',
+    ('generation', 'method')
+)
+DEVICE_REQUEST_ERRORS = Counter(
+    'shelly_device_request_errors_total',
+    'Failed requests to Shelly devices by reason (timeout, connection, offline, rpc_error, error)',
+    ('generation', 'method', 'reason')
+)
+HA_WEBSOCKET_SECONDS = Histogram(
+    'shelly_ha_websocket_seconds',
+    'Latency of Home Assistant WebSocket commands',
+    ('command',)
+)
+HA_WEBSOCKET_ERRORS = Counter(
+    'shelly_ha_websocket_errors_total',
+    'Failed Home Assistant WebSocket commands by reason',
+    ('command', 'reason')
+)
+SCAN_SECONDS = Histogram(
+    'shelly_scan_duration_seconds',
+    'Duration of device scans (enrichment of all devices)',
+    buckets=SCAN_BUCKETS
+)
+SCAN_DEVICES = Counter(
+    'shelly_scan_devices_total',
+    'Devices scanned, by result (ok, unreachable, offline, timeout, pending, error)',
+    ('status',)
+)
+LAST_SCAN_DEVICES = Gauge(
+    'shelly_last_scan_devices',
+    'Devices in the most recent scan, by result',
+    ('status',)
+)
+CACHE_LOOKUPS = Counter(
+    'shelly_cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ('cache', 'result')
+)
+INVENTORY_DEVICES = Gauge(
+    'shelly_inventory_devices',
+    'Shelly devices known from Home Assistant'
+)
+OFFLINE_DEVICES = Gauge(
+    'shelly_offline_devices',
+    'Devices currently skipped by the circuit breaker'
+)
+
+
+def device_request(generation, method):
+    """Time one request to a device (see timed)"""
+    return timed(DEVICE_REQUEST_SECONDS, DEVICE_REQUEST_ERRORS, generation, method)
+
+
+def cache_lookup(cache, hit):
+    """Count a cache hit or miss"""
+    CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss')
@@ -0,0 +1,147 @@
+"""
+Rolling firmware rollout
+Updates devices in waves and only starts the next wave once every device
+of the current one is back online with new firmware. Stops by itself when
+too many devices fail.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class RolloutOrchestrator:
+    """Wave-based firmware updates with health gates, tracked as batch jobs"""
+
+    def __init__(self, batch_jobs, inventory, update_fn, probe_fn, has_update_fn=None,
+                 wave_size=5, max_failure_rate=0.2, health_timeout=600, health_interval=10):
+        self.batch_jobs = batch_jobs
+        self.inventory = inventory
+        self.update_fn = update_fn
+        self.probe_fn = probe_fn
+        # has_update_fn(device) -> True/False, or None when it isn't known yet
+        self.has_update_fn = has_update_fn
+        self.wave_size = wave_size
+        self.max_failure_rate = max_failure_rate
+        self.health_timeout = health_timeout
+        self.health_interval = health_interval
+
+    def plan_waves(self, ips, wave_size, per_model=False):
+        """Split devices into waves, optionally never mixing models in one wave"""
+        if per_model:
+            groups = {}
+            for ip in ips:
+                device = self.inventory.find(ip=ip) or {}
+                groups.setdefault(device.get('type') or device.get('model') or '?', []).append(ip)
+            batches = list(groups.values())
+        else:
+            batches = [ips]
+
+        return [batch[i:i + wave_size] for batch in batches for i in range(0, len(batch), wave_size)]
+
+    def start(self, ips, wave_size=None, per_model=False, max_failure_rate=None):
+        """Start a rollout in the background, returning its job"""
+        ips = list(dict.fromkeys(ips))
+        wave_size = max(1, int(wave_size or self.wave_size))
+        max_failure_rate = self.max_failure_rate if max_failure_rate is None else float(max_failure_rate)
+        waves = self.plan_waves(ips, wave_size, per_model)
+
+        job_id = self.batch_jobs.create('rollout', ips)
+        self.batch_jobs.update_job(
+            job_id,
+            waves=len(waves),
+            wave=0,
+            wave_size=wave_size,
+            per_model=per_model,
+            max_failure_rate=max_failure_rate
+        )
+
+        threading.Thread(
+            target=self._run,
+            args=(job_id, waves, max_failure_rate),
+            name=f"rollout-{job_id}",
+            daemon=True
+        ).start()
+        return self.batch_jobs.get(job_id)
+
+    def _run(self, job_id, waves, max_failure_rate):
+        """Work through the waves, stopping when the failure rate gets too high"""
+        logger.info("Rollout %s: %s devices in %s wave(s)", job_id, sum(len(w) for w in waves), len(waves))
+
+        try:
+            for number, wave in enumerate(waves, start=1):
+                self.batch_jobs.update_job(job_id, wave=number)
+                self._run_wave(job_id, wave)
+
+                job = self.batch_jobs.get(job_id)
+                failure_rate = job['failed'] / job['done'] if job['done'] else 0
+                if failure_rate > max_failure_rate and number < len(waves):
+                    logger.error("❌ Rollout %s aborted after wave %s: %.0f%% failed", job_id, number, failure_rate * 100)
+                    for remaining in waves[number:]:
+                        for ip in remaining:
+                            self.batch_jobs.set_device(job_id, ip, status='skipped')
+                    self.batch_jobs.finish_job(job_id, 'aborted')
+                    return
+        except Exception as e:
+            logger.error("❌ Rollout %s crashed: %s", job_id, e, exc_info=True)
+            self.batch_jobs.finish_job(job_id, 'error')
+
+    def _run_wave(self, job_id, wave):
+        """Start the updates of one wave, then wait until they're all healthy"""
+        # Kick off all updates of the wave at once; the wave size is the limit
+        with ThreadPoolExecutor(max_workers=len(wave), thread_name_prefix='rollout') as executor:
+            results = dict(zip(wave, executor.map(self._start_update, wave)))
+        old_fw = {ip: result.get('old_fw') for ip, result in results.items()}
+
+        updating = []
+        for ip, result in results.items():
+            if result.get('up_to_date'):
+                # Nothing to install: its firmware would never change
+                self.batch_jobs.set_device(job_id, ip, old_fw=old_fw[ip], new_fw=old_fw[ip], up_to_date=True)
+                self.batch_jobs.finish_device(job_id, ip, True)
+            elif result.get('success'):
+                self.batch_jobs.set_device(job_id, ip, status='updating', old_fw=old_fw[ip])
+                updating.append(ip)
+            else:
+                self.batch_jobs.finish_device(job_id, ip, False, result.get('error'))
+
+        # Health gate: reachable again and reporting different firmware
+        deadline = time.monotonic() + self.health_timeout
+        while updating and time.monotonic() < deadline:
+            time.sleep(self.health_interval)
+            for ip in list(updating):
+                info = self.probe_fn(ip)
+                if info and info.get('fw') and info['fw'] != old_fw[ip]:
+                    self.batch_jobs.set_device(job_id, ip, new_fw=info['fw'])
+                    self.batch_jobs.finish_device(job_id, ip, True)
+                    self.inventory.merge((self.inventory.find(ip=ip) or {}).get('id'), {'fw': info['fw']})
+                    updating.remove(ip)
+
+        for ip in updating:
+            self.batch_jobs.finish_device(job_id, ip, False, 'Did not come back with new firmware in time')
+
+    def _start_update(self, ip):
+        """Read the current firmware of one device, then trigger its update if there is one"""
+        # The firmware the device reports right now is what the health gate
+        # compares against; the inventory's copy may be missing or outdated
+        try:
+            info = self.probe_fn(ip)
+        except Exception as e:
+            logger.error("Rollout: probing %s raised %s", ip, e, extra={'device': ip})
+            info = None
+        if not info or not info.get('fw'):
+            return {'success': False, 'error': 'Could not read the current firmware'}
+
+        device = dict(self.inventory.find(ip=ip) or {}, **info)
+        if self.has_update_fn and self.has_update_fn(device) is False:
+            logger.info("Rollout: %s is already on the latest firmware (%s)", ip, info['fw'], extra={'device': ip})
+            return {'success': True, 'up_to_date': True, 'old_fw': info['fw']}
+
+        try:
+            result = self.update_fn(ip) or {}
+        except Exception as e:
+            logger.error("Rollout: update of %s raised %s", ip, e, extra={'device': ip})
+            result = {'success': False, 'error': str(e)}
+        return dict(result, old_fw=info['fw'])
@@ -0,0 +1,118 @@
+"""
+Concurrent device enrichment for scans
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import event_loop
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceScanner:
+    """Enrich many devices in parallel with a bounded worker pool and a deadline
+
+    enrich_fn may also be a coroutine function; it then runs on the shared
+    event loop with max_workers as the limit instead of a thread each.
+    """
+
+    def __init__(self, enrich_fn, max_workers=16, deadline=20):
+        self.enrich_fn = enrich_fn
+        self.max_workers = max(1, max_workers)
+        self.deadline = deadline
+        self.is_async = asyncio.iscoroutinefunction(enrich_fn)
+
+    def _submit_async(self, devices, begun):
+        """Schedule async enrichments on the event loop, returning {future: index}"""
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def enrich(index, device):
+            async with slots:
+                begun.add(index)
+                return await self.enrich_fn(device)
+
+        return {
+            event_loop.submit(enrich(index, dict(device))): index
+            for index, device in enumerate(devices)
+        }
+
+    def iter_scan(self, devices):
+        """Yield (index, device) as enrichments finish, then the devices that missed the deadline"""
+        if not devices:
+            return
+
+        started = time.monotonic()
+        executor = None
+        begun = set()
+        futures = {}
+        counts = Counter()
+
+        try:
+            # Each worker gets its own copy so a late worker can never mutate
+            # a device that has already been returned to the caller
+            if self.is_async:
+                futures = self._submit_async(devices, begun)
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(devices)),
+                    thread_name_prefix='scan'
+                )
+                futures = {
+                    executor.submit(self.enrich_fn, dict(device)): index
+                    for index, device in enumerate(devices)
+                }
+            pending = set(futures)
+
+            while pending:
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = futures[future]
+                    try:
+                        device = future.result()
+                    except Exception as e:
+                        logger.error("Error enriching %s: %s", devices[index].get('name'), e, extra={'device': devices[index].get('ip')})
+                        device = dict(devices[index], scan_status='error', error=str(e))
+                    counts[device.get('scan_status') or 'unknown'] += 1
+                    yield index, device
+
+            if pending:
+                logger.warning("⚠ Scan deadline of %ss reached, %s device(s) did not answer", self.deadline, len(pending))
+
+            # Anything still unanswered missed the deadline: devices being
+            # probed timed out, devices still queued were never reached
+            for future in pending:
+                index = futures[future]
+                status = 'timeout' if future.running() or index in begun else 'pending'
+                counts[status] += 1
+                yield index, dict(devices[index], scan_status=status)
+
+        finally:
+            # Don't wait for stragglers, drop anything that never started
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                # Async stragglers cost nothing to stop
+                for future in futures:
+                    future.cancel()
+            elapsed = time.monotonic() - started
+            logger.info("✓ Enriched %s devices in %.1fs", len(devices), elapsed)
+            metrics.SCAN_SECONDS.observe(elapsed)
+            metrics.LAST_SCAN_DEVICES.clear()
+            for status, count in counts.items():
+                metrics.SCAN_DEVICES.inc(status, amount=count)
+                metrics.LAST_SCAN_DEVICES.set(count, status)
+
+    def scan(self, devices):
+        """Enrich all devices, marking the ones that miss the deadline as timed out"""
+        results = [None] * len(devices)
+        for index, device in self.iter_scan(devices):
+            results[index] = device
+        return results
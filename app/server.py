@@ -0,0 +1,114 @@
+"""
+Production WSGI server
+Serves the app with waitress on a pool of threads, so a long scan never
+blocks the UI, and drains in-flight requests on SIGTERM (add-on stop)
+"""
+import logging
+import signal
+import threading
+import time
+
+from waitress.server import create_server
+
+logger = logging.getLogger(__name__)
+
+
+def _can_drain(server):
+    """Whether the waitress internals the drain relies on are there
+
+    They aren't public API; if an upgrade changes them we fall back to
+    serving for a fixed grace period and then closing the server.
+    """
+    dispatcher = getattr(server, 'task_dispatcher', None)
+    return (
+        all(hasattr(dispatcher, name) for name in ('lock', 'queue', 'active_count', 'shutdown'))
+        and all(hasattr(server, name) for name in ('active_channels', 'asyncore', '_map', 'adj', 'accepting', 'pull_trigger'))
+    )
+
+
+def _busy(server):
+    """Whether requests are still being handled or responses still being sent"""
+    dispatcher = server.task_dispatcher
+    with dispatcher.lock:
+        if dispatcher.queue or dispatcher.active_count:
+            return True
+    return any(channel.total_outbufs_len for channel in list(server.active_channels.values()))
+
+
+def _drain(server, timeout, finished):
+    """Wait for in-flight requests, then let the main loop end"""
+    deadline = time.monotonic() + timeout
+    while _busy(server) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    if _busy(server):
+        logger.warning("⚠ Requests still running after %ss, stopping anyway", timeout)
+    finished.set()
+    server.pull_trigger()
+
+
+def serve(app, host='0.0.0.0', port=8099, threads=8, idle_timeout=120,
+          shutdown_timeout=10, on_shutdown=None):
+    """Serve until SIGTERM/SIGINT, then finish open requests and call on_shutdown"""
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        # Idle/stuck connections are closed after this long
+        channel_timeout=idle_timeout,
+        # select() can't watch descriptors above 1024, and the per-device
+        # connection pools of a large fleet easily get there
+        asyncore_use_poll=True,
+        ident='shelly-ha-manager'
+    )
+    stopping = threading.Event()
+    finished = threading.Event()
+    drainable = _can_drain(server)
+    if not drainable:
+        logger.warning("⚠ Unknown waitress internals, open requests get a fixed %ss on shutdown", shutdown_timeout)
+
+    def grace_period():
+        finished.wait(shutdown_timeout)
+        finished.set()
+
+    def handle_signal(signum, frame):
+        if stopping.is_set():
+            # A second signal: stop right away
+            finished.set()
+            return
+        stopping.set()
+        logger.info("Received %s, finishing open requests...", signal.Signals(signum).name)
+        if drainable:
+            # Stop accepting new connections, keep serving the open ones
+            server.accepting = False
+            drain = threading.Thread(target=_drain, args=(server, shutdown_timeout, finished), name='drain', daemon=True)
+        else:
+            # Keep serving for a fixed time, then close
+            drain = threading.Thread(target=grace_period, name='drain', daemon=True)
+        drain.start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info("✓ Serving on http://%s:%s with %s threads", host, port, threads)
+    try:
+        if drainable:
+            # Like server.run(), but one loop iteration at a time until drained
+            while not finished.is_set():
+                server.asyncore.loop(
+                    timeout=server.adj.asyncore_loop_timeout,
+                    map=server._map,
+                    use_poll=server.adj.asyncore_use_poll,
+                    count=1
+                )
+            server.task_dispatcher.shutdown()
+        else:
+            # Serve from a daemon thread; open connections end with the process
+            threading.Thread(target=server.run, name='waitress', daemon=True).start()
+            finished.wait()
+    finally:
+        server.close()
+        if on_shutdown:
+            on_shutdown()
+        logger.info("✓ Server stopped")
@@ -0,0 +1,297 @@
+"""
+Async Shelly clients
+Same methods and return values as ShellyGen1Client and ShellyGen2Client,
+but as coroutines on the shared event loop (see event_loop.py)
+"""
+import asyncio
+import json
+import logging
+import uuid
+
+import aiohttp
+
+import circuit_breaker
+import event_loop
+import metrics
+from shelly_gen1 import ShellyGen1Client
+from shelly_gen2 import ShellyGen2Client
+from shelly_probe import parse_probe
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch(ip, method, path, timeout, **kwargs):
+    """One HTTP request through the device's circuit breaker, returning (status, json or None)"""
+    if circuit_breaker.is_open(ip):
+        # May do a short TCP check, keep that off the loop
+        await asyncio.get_running_loop().run_in_executor(None, circuit_breaker.check, ip)
+
+    session = event_loop.get_session()
+    attempts = event_loop.retries() + 1
+    for attempt in range(attempts):
+        try:
+            async with session.request(
+                method,
+                f"http://{ip}{path}",
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                **kwargs
+            ) as response:
+                status = response.status
+                body = await response.read()
+            break
+        except aiohttp.ClientConnectorError:
+            # Never connected, so retrying is safe for any call
+            if attempt + 1 < attempts:
+                await asyncio.sleep(0.2 * 2 ** attempt)
+                continue
+            circuit_breaker.record_failure(ip)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            circuit_breaker.record_failure(ip)
+            raise
+
+    circuit_breaker.record_success(ip)
+    return status, json.loads(body) if status == 200 and body else None
+
+
+async def async_probe_device(ip, generation=None, timeout=2):
+    """Async probe_device: race the identification endpoints, first answer wins"""
+    if generation == 1:
+        paths = ['/shelly']
+    elif generation == 2:
+        paths = ['/rpc/Shelly.GetDeviceInfo']
+    else:
+        paths = ['/rpc/Shelly.GetDeviceInfo', '/shelly']
+
+    async def probe(path):
+        try:
+            with metrics.device_request('probe', path):
+                status, data = await fetch(ip, 'GET', path, timeout)
+            if status == 200 and data:
+                return parse_probe(path, data)
+        except Exception as e:
+            logger.debug("Probe %s on %s failed: %s", path, ip, e, extra={'device': ip})
+        return None
+
+    pending = {asyncio.ensure_future(probe(path)) for path in paths}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                info = task.result()
+                if info:
+                    return info
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class AsyncShellyGen1Client:
+    """Async client for Shelly Gen1 devices (HTTP API)"""
+
+    generation = 1
+
+    def __init__(self, ip, password=None, timeout=5):
+        self.ip = ip
+        self.password = password
+        self.timeout = timeout
+        self.log = logging.LoggerAdapter(logger, {'device': ip})
+
+    def get_auth(self):
+        """Get basic auth if password is set"""
+        if self.password:
+            return aiohttp.BasicAuth('admin', self.password)
+        return None
+
+    async def _get(self, path, params=None):
+        with metrics.device_request(self.generation, path):
+            return await fetch(self.ip, 'GET', path, self.timeout, params=params, auth=self.get_auth())
+
+    async def get_device_info(self):
+        """Get device information"""
+        try:
+            with metrics.device_request(self.generation, '/shelly'):
+                status, data = await fetch(self.ip, 'GET', '/shelly', self.timeout)
+            if status == 200 and data:
+                return ShellyGen1Client.parse_device_info(data)
+            return None
+        except Exception as e:
+            self.log.error("Error getting Gen1 device info from %s: %s", self.ip, e)
+            return None
+
+    async def get_settings(self):
+        """Get device settings"""
+        try:
+            status, data = await self._get('/settings')
+            if status == 200:
+                return data
+            elif status == 401:
+                return {'error': 'Authentication required'}
+            return None
+        except Exception as e:
+            self.log.error("Error getting Gen1 settings from %s: %s", self.ip, e)
+            return None
+
+    async def get_status(self):
+        """Get device status"""
+        try:
+            status, data = await self._get('/status')
+            return data if status == 200 else None
+        except Exception as e:
+            self.log.error("Error getting Gen1 status from %s: %s", self.ip, e)
+            return None
+
+    async def set_auth(self, enable, password):
+        """Enable or disable authentication"""
+        try:
+            params = {
+                'enabled': '1' if enable else '0',
+                'username': 'admin',
+                'password': password if enable else ''
+            }
+            status, data = await self._get('/settings/login', params=params)
+            if status == 200:
+                return {'success': True, 'response': data}
+            return {'success': False, 'error': f'Status {status}'}
+        except Exception as e:
+            self.log.error("Error setting Gen1 auth on %s: %s", self.ip, e)
+            return {'success': False, 'error': str(e)}
+
+    async def reboot(self):
+        """Reboot device"""
+        try:
+            status, _ = await self._get('/reboot')
+            return status == 200
+        except Exception as e:
+            self.log.error("Error rebooting Gen1 device %s: %s", self.ip, e)
+            return False
+
+    async def update_firmware(self):
+        """Trigger firmware update"""
+        try:
+            status, data = await self._get('/ota', params={'update': 'true'})
+            if status == 200:
+                return {'success': True, 'response': data}
+            return {'success': False, 'error': f'Status {status}'}
+        except Exception as e:
+            self.log.error("Error updating Gen1 firmware on %s: %s", self.ip, e)
+            return {'success': False, 'error': str(e)}
+
+    async def check_for_update(self):
+        """Check whether newer firmware is available (reads /ota, doesn't install)"""
+        try:
+            status, data = await self._get('/ota')
+            if status != 200 or data is None:
+                return None
+            has_update = bool(data.get('has_update'))
+            return {
+                'has_update': has_update,
+                'latest_version': data.get('new_version') if has_update else data.get('old_version')
+            }
+        except Exception as e:
+            self.log.error("Error checking Gen1 firmware on %s: %s", self.ip, e)
+            return None
+
+
+class AsyncShellyGen2Client:
+    """Async client for Shelly Gen2+ devices (RPC API over HTTP)"""
+
+    generation = 2
+
+    def __init__(self, ip, password=None, timeout=5):
+        self.ip = ip
+        self.password = password
+        self.timeout = timeout
+        self.log = logging.LoggerAdapter(logger, {'device': ip})
+
+    async def make_rpc_call(self, method, params=None):
+        """Make an RPC call to the device"""
+        try:
+            payload = {
+                'id': str(uuid.uuid4()),
+                'method': method
+            }
+
+            if params:
+                payload['params'] = params
+
+            # Add password if available and needed
+            if self.password and params is None:
+                payload['params'] = {'password': self.password}
+            elif self.password and params:
+                payload['params']['password'] = self.password
+
+            with metrics.device_request(self.generation, method):
+                status, result = await fetch(self.ip, 'POST', '/rpc', self.timeout, json=payload)
+
+            if status == 200 and result is not None:
+                if 'result' in result:
+                    return result['result']
+                elif 'error' in result:
+                    metrics.DEVICE_REQUEST_ERRORS.inc(self.generation, method, 'rpc_error')
+                    self.log.error("RPC error: %s", result['error'])
+
+            return None
+
+        except Exception as e:
+            self.log.error("Error making RPC call to %s: %s", self.ip, e)
+            return None
+
+    async def get_device_info(self):
+        """Get device information"""
+        data = await self.make_rpc_call('Shelly.GetDeviceInfo')
+        return ShellyGen2Client.parse_device_info(data) if data else None
+
+    async def get_config(self):
+        """Get device configuration"""
+        return await self.make_rpc_call('Shelly.GetConfig')
+
+    async def get_status(self):
+        """Get device status"""
+        return await self.make_rpc_call('Shelly.GetStatus')
+
+    async def set_auth(self, enable, password):
+        """Enable or disable authentication"""
+        params = {
+            'config': {
+                'auth': {
+                    'enable': enable,
+                    'user': 'admin',
+                    'pass': password if enable else ''
+                }
+            }
+        }
+
+        # If auth is currently enabled, include password in request
+        if self.password:
+            params['password'] = self.password
+
+        result = await self.make_rpc_call('Sys.SetConfig', params)
+        if result is not None:
+            return {'success': True, 'response': result}
+        return {'success': False, 'error': 'RPC call failed'}
+
+    async def reboot(self):
+        """Reboot device"""
+        return await self.make_rpc_call('Shelly.Reboot') is not None
+
+    async def update_firmware(self, stage='stable'):
+        """Trigger firmware update"""
+        result = await self.make_rpc_call('Shelly.Update', {'stage': stage})
+        if result is not None:
+            return {'success': True, 'response': result}
+        return {'success': False, 'error': 'RPC call failed'}
+
+    async def check_for_update(self, stage='stable'):
+        """Check whether newer firmware is available"""
+        result = await self.make_rpc_call('Shelly.CheckForUpdate')
+        if result is None:
+            return None
+
+        # An empty result means the device is up to date
+        available = result.get(stage) or {}
+        return {
+            'has_update': bool(available.get('version')),
+            'latest_version': available.get('version')
+        }
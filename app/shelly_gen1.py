@@ -1,20 +1,26 @@
 """
 Shelly Gen1 HTTP API Client
 """
-import requests
 import logging
 
+import metrics
+from http_pool import get_session
+
 logger = logging.getLogger(__name__)
 
 
 class ShellyGen1Client:
     """Client for Shelly Gen1 devices (HTTP API)"""
     
+    generation = 1
+    
     def __init__(self, ip, password=None, timeout=5):
         self.ip = ip
         self.password = password
         self.timeout = timeout
         self.base_url = f"http://{ip}"
+        self.session = get_session(ip)
+        self.log = logging.LoggerAdapter(logger, {'device': ip})
     
     def get_auth(self):
         """Get authentication tuple if password is set"""
@@ -22,38 +28,40 @@ class ShellyGen1Client:
             return ('admin', self.password)
         return None
     
+    def _get(self, path, **kwargs):
+        """GET a path on the device, timed per path for /metrics"""
+        with metrics.device_request(self.generation, path):
+            return self.session.get(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+    
+    @staticmethod
+    def parse_device_info(data):
+        """Normalize a /shelly response"""
+        return {
+            'type': data.get('type'),
+            'mac': data.get('mac'),
+            'auth': data.get('auth', False),
+            'fw': data.get('fw'),
+            'generation': 1
+        }
+    
     def get_device_info(self):
         """Get device information"""
         try:
-            response = requests.get(
-                f"{self.base_url}/shelly",
-                timeout=self.timeout
-            )
+            response = self._get('/shelly')
             
             if response.status_code == 200:
-                data = response.json()
-                return {
-                    'type': data.get('type'),
-                    'mac': data.get('mac'),
-                    'auth': data.get('auth', False),
-                    'fw': data.get('fw'),
-                    'generation': 1
-                }
+                return self.parse_device_info(response.json())
             
             return None
             
         except Exception as e:
-            logger.error(f"Error getting Gen1 device info from {self.ip}: {e}")
+            self.log.error("Error getting Gen1 device info from %s: %s", self.ip, e)
             return None
     
     def get_settings(self):
         """Get device settings"""
         try:
-            response = requests.get(
-                f"{self.base_url}/settings",
-                auth=self.get_auth(),
-                timeout=self.timeout
-            )
+            response = self._get('/settings', auth=self.get_auth())
             
             if response.status_code == 200:
                 return response.json()
@@ -63,17 +71,13 @@ class ShellyGen1Client:
             return None
             
         except Exception as e:
-            logger.error(f"Error getting Gen1 settings from {self.ip}: {e}")
+            self.log.error("Error getting Gen1 settings from %s: %s", self.ip, e)
             return None
     
     def get_status(self):
         """Get device status"""
         try:
-            response = requests.get(
-                f"{self.base_url}/status",
-                auth=self.get_auth(),
-                timeout=self.timeout
-            )
+            response = self._get('/status', auth=self.get_auth())
             
             if response.status_code == 200:
                 return response.json()
@@ -81,7 +85,7 @@ class ShellyGen1Client:
             return None
             
         except Exception as e:
-            logger.error(f"Error getting Gen1 status from {self.ip}: {e}")
+            self.log.error("Error getting Gen1 status from %s: %s", self.ip, e)
             return None
     
     def set_auth(self, enable, password):
@@ -93,12 +97,7 @@ class ShellyGen1Client:
                 'password': password if enable else ''
             }
             
-            response = requests.get(
-                f"{self.base_url}/settings/login",
-                params=params,
-                auth=self.get_auth(),
-                timeout=self.timeout
-            )
+            response = self._get('/settings/login', params=params, auth=self.get_auth())
             
             if response.status_code == 200:
                 return {'success': True, 'response': response.json()}
@@ -106,32 +105,24 @@ class ShellyGen1Client:
             return {'success': False, 'error': f'Status {response.status_code}'}
             
         except Exception as e:
-            logger.error(f"Error setting Gen1 auth on {self.ip}: {e}")
+            self.log.error("Error setting Gen1 auth on %s: %s", self.ip, e)
             return {'success': False, 'error': str(e)}
     
     def reboot(self):
         """Reboot device"""
         try:
-            response = requests.get(
-                f"{self.base_url}/reboot",
-                auth=self.get_auth(),
-                timeout=self.timeout
-            )
+            response = self._get('/reboot', auth=self.get_auth())
             
             return response.status_code == 200
             
         except Exception as e:
-            logger.error(f"Error rebooting Gen1 device {self.ip}: {e}")
+            self.log.error("Error rebooting Gen1 device %s: %s", self.ip, e)
             return False
     
     def update_firmware(self):
         """Trigger firmware update"""
         try:
-            response = requests.get(
-                f"{self.base_url}/ota?update=true",
-                auth=self.get_auth(),
-                timeout=self.timeout
-            )
+            response = self._get('/ota', params={'update': 'true'}, auth=self.get_auth())
             
             if response.status_code == 200:
                 return {'success': True, 'response': response.json()}
@@ -139,5 +130,24 @@ class ShellyGen1Client:
             return {'success': False, 'error': f'Status {response.status_code}'}
             
         except Exception as e:
-            logger.error(f"Error updating Gen1 firmware on {self.ip}: {e}")
+            self.log.error("Error updating Gen1 firmware on %s: %s", self.ip, e)
             return {'success': False, 'error': str(e)}
+    
+    def check_for_update(self):
+        """Check whether newer firmware is available (reads /ota, doesn't install)"""
+        try:
+            response = self._get('/ota', auth=self.get_auth())
+            
+            if response.status_code == 200:
+                data = response.json()
+                has_update = bool(data.get('has_update'))
+                return {
+                    'has_update': has_update,
+                    'latest_version': data.get('new_version') if has_update else data.get('old_version')
+                }
+            
+            return None
+            
+        except Exception as e:
+            self.log.error("Error checking Gen1 firmware on %s: %s", self.ip, e)
+            return None
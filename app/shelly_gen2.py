@@ -1,21 +1,30 @@
 """
 Shelly Gen2+ RPC API Client
 """
-import requests
 import logging
 import uuid
 
+import metrics
+from http_pool import get_session
+from shelly_gen2_push import ChannelUnavailable
+
 logger = logging.getLogger(__name__)
 
 
 class ShellyGen2Client:
     """Client for Shelly Gen2+ devices (RPC API)"""
     
-    def __init__(self, ip, password=None, timeout=5):
+    generation = 2
+    
+    def __init__(self, ip, password=None, timeout=5, channel=None):
         self.ip = ip
         self.password = password
         self.timeout = timeout
         self.base_url = f"http://{ip}/rpc"
+        self.session = get_session(ip)
+        self.log = logging.LoggerAdapter(logger, {'device': ip})
+        # Open push WebSocket to the device, used instead of HTTP when available
+        self.channel = channel
     
     def make_rpc_call(self, method, params=None):
         """Make an RPC call to the device"""
@@ -34,45 +43,62 @@ class ShellyGen2Client:
             elif self.password and params:
                 payload['params']['password'] = self.password
             
-            response = requests.post(
-                self.base_url,
-                json=payload,
-                timeout=self.timeout
-            )
+            with metrics.device_request(self.generation, method):
+                result = None
+                if self.channel is not None:
+                    try:
+                        result = self.channel.call(payload, timeout=self.timeout)
+                    except ChannelUnavailable as e:
+                        # Never sent, so it's safe to send it again over HTTP
+                        self.log.debug("Push channel to %s unusable, falling back to HTTP: %s", self.ip, e)
+                
+                if result is None:
+                    response = self.session.post(
+                        self.base_url,
+                        json=payload,
+                        timeout=self.timeout
+                    )
+                    if response.status_code == 200:
+                        result = response.json()
             
-            if response.status_code == 200:
-                result = response.json()
+            if result is not None:
                 if 'result' in result:
                     return result['result']
                 elif 'error' in result:
-                    logger.error(f"RPC error: {result['error']}")
+                    metrics.DEVICE_REQUEST_ERRORS.inc(self.generation, method, 'rpc_error')
+                    self.log.error("RPC error: %s", result['error'])
                     return None
             
             return None
             
         except Exception as e:
-            logger.error(f"Error making RPC call to {self.ip}: {e}")
+            self.log.error("Error making RPC call to %s: %s", self.ip, e)
             return None
     
+    @staticmethod
+    def parse_device_info(data):
+        """Normalize a Shelly.GetDeviceInfo (or Gen2 /shelly) response"""
+        return {
+            'type': data.get('model'),
+            'mac': data.get('mac'),
+            'auth': data.get('auth_en', False),
+            'fw': data.get('fw_id', data.get('ver')),
+            'generation': 2,
+            'name': data.get('name', f"Shelly {data.get('model')}")
+        }
+    
     def get_device_info(self):
         """Get device information"""
         try:
             data = self.make_rpc_call('Shelly.GetDeviceInfo')
             
             if data:
-                return {
-                    'type': data.get('model'),
-                    'mac': data.get('mac'),
-                    'auth': data.get('auth_en', False),
-                    'fw': data.get('fw_id', data.get('ver')),
-                    'generation': 2,
-                    'name': data.get('name', f"Shelly {data.get('model')}")
-                }
+                return self.parse_device_info(data)
             
             return None
             
         except Exception as e:
-            logger.error(f"Error getting Gen2 device info from {self.ip}: {e}")
+            self.log.error("Error getting Gen2 device info from %s: %s", self.ip, e)
             return None
     
     def get_config(self):
@@ -80,7 +106,7 @@ class ShellyGen2Client:
         try:
             return self.make_rpc_call('Shelly.GetConfig')
         except Exception as e:
-            logger.error(f"Error getting Gen2 config from {self.ip}: {e}")
+            self.log.error("Error getting Gen2 config from %s: %s", self.ip, e)
             return None
     
     def get_status(self):
@@ -88,7 +114,7 @@ class ShellyGen2Client:
         try:
             return self.make_rpc_call('Shelly.GetStatus')
         except Exception as e:
-            logger.error(f"Error getting Gen2 status from {self.ip}: {e}")
+            self.log.error("Error getting Gen2 status from %s: %s", self.ip, e)
             return None
     
     def set_auth(self, enable, password):
@@ -116,7 +142,7 @@ class ShellyGen2Client:
             return {'success': False, 'error': 'RPC call failed'}
             
         except Exception as e:
-            logger.error(f"Error setting Gen2 auth on {self.ip}: {e}")
+            self.log.error("Error setting Gen2 auth on %s: %s", self.ip, e)
             return {'success': False, 'error': str(e)}
     
     def reboot(self):
@@ -125,7 +151,7 @@ class ShellyGen2Client:
             result = self.make_rpc_call('Shelly.Reboot')
             return result is not None
         except Exception as e:
-            logger.error(f"Error rebooting Gen2 device {self.ip}: {e}")
+            self.log.error("Error rebooting Gen2 device %s: %s", self.ip, e)
             return False
     
     def update_firmware(self, stage='stable'):
@@ -140,5 +166,24 @@ class ShellyGen2Client:
             return {'success': False, 'error': 'RPC call failed'}
             
         except Exception as e:
-            logger.error(f"Error updating Gen2 firmware on {self.ip}: {e}")
+            self.log.error("Error updating Gen2 firmware on %s: %s", self.ip, e)
             return {'success': False, 'error': str(e)}
+    
+    def check_for_update(self, stage='stable'):
+        """Check whether newer firmware is available"""
+        try:
+            result = self.make_rpc_call('Shelly.CheckForUpdate')
+            
+            if result is None:
+                return None
+            
+            # An empty result means the device is up to date
+            available = result.get(stage) or {}
+            return {
+                'has_update': bool(available.get('version')),
+                'latest_version': available.get('version')
+            }
+            
+        except Exception as e:
+            self.log.error("Error checking Gen2 firmware on %s: %s", self.ip, e)
+            return None
@@ -0,0 +1,251 @@
+"""
+Push-based status for Shelly Gen2+ devices
+Keeps one WebSocket open to each Gen2 device's /rpc endpoint. The device
+streams NotifyStatus / NotifyFullStatus frames over it, which are applied
+to the status cache, and RPC calls can be sent over the same socket.
+"""
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import Future
+import websocket
+
+import circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelUnavailable(ConnectionError):
+    """The request could not be sent over the channel (it never reached the device)"""
+
+
+class Gen2Channel:
+    """One persistent RPC WebSocket to a Gen2 device"""
+
+    def __init__(self, ip, device_id, status_cache, timeout=5, max_backoff=300):
+        self.ip = ip
+        self.device_id = device_id
+        self.status_cache = status_cache
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.log = logging.LoggerAdapter(logger, {'device': ip})
+        # Devices only send notifications to peers that identified themselves
+        self.src = f"shelly-ha-manager-{uuid.uuid4().hex[:8]}"
+
+        self.connected = False
+        # Only once the device has sent us a status do we rely on the channel;
+        # a device with auth enabled accepts the socket but refuses to talk
+        self.live = False
+        self._refused = False
+        self._ws = None
+        self._message_id = 0
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Connect in the background (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=f"gen2-push-{self.ip}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Close the socket and stop reconnecting"""
+        self._stopped.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        """Connection loop with exponential backoff"""
+        backoff = 5
+
+        while not self._stopped.is_set():
+            if not circuit_breaker.allow(self.ip):
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            try:
+                ws = websocket.create_connection(f"ws://{self.ip}/rpc", timeout=self.timeout)
+            except Exception as e:
+                circuit_breaker.record_failure(self.ip)
+                self.log.debug("Gen2 push connect to %s failed: %s, retrying in %ss", self.ip, e, backoff)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            circuit_breaker.record_success(self.ip)
+            ws.settimeout(None)
+            with self._send_lock:
+                self._ws = ws
+            self.connected = True
+            backoff = 5
+            self.log.info("✓ Gen2 push channel open to %s", self.ip)
+
+            # The first request registers us for notifications; its reply
+            # seeds the cache with the full status
+            threading.Thread(target=self._seed_status, daemon=True).start()
+
+            try:
+                while not self._stopped.is_set():
+                    raw = ws.recv()
+                    if not raw:
+                        raise ConnectionError('Connection closed by device')
+                    self._dispatch(json.loads(raw))
+            except Exception as e:
+                if not self._stopped.is_set():
+                    self.log.info("Gen2 push channel to %s closed: %s", self.ip, e)
+            finally:
+                self.connected = False
+                self.live = False
+                with self._send_lock:
+                    self._ws = None
+                    pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError('Push channel closed'))
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
+            if self._refused:
+                # Polled meanwhile; try again now and then in case auth was turned off
+                self._refused = False
+                self._stopped.wait(self.max_backoff)
+
+    def _seed_status(self):
+        """Fetch the full status once the channel is open"""
+        try:
+            response = self.call({'method': 'Shelly.GetStatus'})
+            if 'result' in response:
+                self.live = True
+                self.status_cache.update(self.device_id, status=response['result'], source='push')
+            elif 'error' in response:
+                # Usually auth: no notifications will come either, so leave
+                # the device to the poller and close the socket
+                self.log.info("Gen2 push: %s refused GetStatus, polling it instead: %s", self.ip, response['error'])
+                self._refused = True
+                ws = self._ws
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+        except Exception as e:
+            self.log.debug("Gen2 push: could not seed status for %s: %s", self.ip, e)
+
+    def _dispatch(self, message):
+        """Route a frame: notifications to the cache, replies to their caller"""
+        method = message.get('method')
+        if method in ('NotifyStatus', 'NotifyFullStatus'):
+            self.live = True
+        if method == 'NotifyStatus':
+            params = dict(message.get('params', {}))
+            params.pop('ts', None)
+            self.status_cache.merge_status(self.device_id, params, source='push')
+        elif method == 'NotifyFullStatus':
+            params = dict(message.get('params', {}))
+            params.pop('ts', None)
+            self.status_cache.update(self.device_id, status=params, source='push')
+        elif method is None:
+            future = self._pending.pop(message.get('id'), None)
+            if future is not None:
+                future.set_result(message)
+
+    def call(self, payload, timeout=None):
+        """Send an RPC request frame and return the raw response frame"""
+        future = Future()
+        with self._send_lock:
+            if self._ws is None:
+                raise ChannelUnavailable(f"No push channel to {self.ip}")
+            self._message_id += 1
+            message_id = self._message_id
+            self._pending[message_id] = future
+            frame = dict(payload, id=message_id, src=self.src)
+            try:
+                self._ws.send(json.dumps(frame))
+            except Exception as e:
+                self._pending.pop(message_id, None)
+                raise ChannelUnavailable(f"Could not send to {self.ip}: {e}")
+
+        try:
+            return future.result(timeout or self.timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+
+class Gen2PushManager:
+    """Keeps a push channel open to every Gen2 device in the inventory"""
+
+    def __init__(self, inventory, status_cache, sync_interval=30):
+        self.inventory = inventory
+        self.status_cache = status_cache
+        self.sync_interval = sync_interval
+        self.channels = {}
+        # ip -> channel, for looking up the channel when creating a client
+        self.by_ip = {}
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start managing channels in the background"""
+        threading.Thread(target=self._run, name='gen2-push', daemon=True).start()
+
+    def stop(self):
+        """Close all channels"""
+        self._stopped.set()
+        with self.lock:
+            for channel in self.channels.values():
+                channel.stop()
+            self.channels.clear()
+            self.by_ip.clear()
+
+    def _run(self):
+        """Follow the inventory: open channels for new Gen2 devices, close removed ones"""
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error("Gen2 push sync failed: %s", e)
+            self._stopped.wait(self.sync_interval)
+
+    def sync(self):
+        """Match open channels to the Gen2 devices currently known"""
+        wanted = {
+            d['id']: d['ip'] for d in self.inventory.get_devices()
+            if d.get('generation') == 2 and d.get('ip') and d.get('id')
+        }
+
+        with self.lock:
+            for device_id, channel in list(self.channels.items()):
+                # Removed, or moved to another IP
+                if wanted.get(device_id) != channel.ip:
+                    channel.stop()
+                    del self.channels[device_id]
+                    if self.by_ip.get(channel.ip) is channel:
+                        del self.by_ip[channel.ip]
+
+            for device_id, ip in wanted.items():
+                if device_id not in self.channels:
+                    channel = Gen2Channel(ip, device_id, self.status_cache)
+                    self.channels[device_id] = channel
+                    self.by_ip[ip] = channel
+                    channel.start()
+
+    def channel_for(self, ip):
+        """The live channel to a device, or None"""
+        channel = self.by_ip.get(ip)
+        return channel if channel is not None and channel.live else None
+
+    def is_live(self, device_id):
+        """Whether a device's status is being pushed to us"""
+        channel = self.channels.get(device_id)
+        return bool(channel and channel.live)
@@ -0,0 +1,59 @@
+"""
+Single-probe Shelly generation detection
+Races the Gen1 and Gen2 identification endpoints and turns the winning
+response straight into normalized device info
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from http_pool import get_session
+from shelly_gen1 import ShellyGen1Client
+from shelly_gen2 import ShellyGen2Client
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for the probe requests themselves (two per device)
+_probe_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix='probe')
+
+
+def parse_probe(path, data):
+    """Normalize a probe response into device info"""
+    if path == '/shelly' and data.get('gen', 1) < 2:
+        return ShellyGen1Client.parse_device_info(data)
+    # Gen2+ answers /shelly too, with a 'gen' field and the same shape as GetDeviceInfo
+    return ShellyGen2Client.parse_device_info(data)
+
+
+def _fetch(ip, path, timeout):
+    """Fetch one identification endpoint, returning parsed device info or None"""
+    try:
+        with metrics.device_request('probe', path):
+            response = get_session(ip).get(f"http://{ip}{path}", timeout=timeout)
+        if response.status_code == 200:
+            return parse_probe(path, response.json())
+    except Exception as e:
+        logger.debug("Probe %s on %s failed: %s", path, ip, e, extra={'device': ip})
+    return None
+
+
+def probe_device(ip, generation=None, timeout=2):
+    """Identify a device with one round-trip and return normalized device info
+
+    If the generation is already known only the matching endpoint is asked,
+    otherwise the Gen2 and Gen1 endpoints are raced and the first answer wins.
+    """
+    if generation == 1:
+        paths = ['/shelly']
+    elif generation == 2:
+        paths = ['/rpc/Shelly.GetDeviceInfo']
+    else:
+        paths = ['/rpc/Shelly.GetDeviceInfo', '/shelly']
+
+    futures = [_probe_pool.submit(_fetch, ip, path, timeout) for path in paths]
+    for future in as_completed(futures):
+        info = future.result()
+        if info:
+            return info
+
+    return None
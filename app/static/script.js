@@ -1,10 +1,24 @@
 let isScanning = false;
-let devicesData = [];
-let filteredDevices = [];
-let sortColumn = 'name';
-let sortDirection = 'asc';
+// Searching and sorting happen on the server; the browser only holds the
+// blocks of rows around the part of the table in view
+let totalDevices = 0;
+let rowCache = new Map();
+let loadingBlocks = new Set();
+let sortColumns = [{ column: 'name', direction: 'asc' }];
 let selectionMode = false;
-let selectedDevices = new Set();
+// Selected device IP -> whether it has auth enabled
+let selectedDevices = new Map();
+let inventoryVersion = null;
+let querySequence = 0;
+let searchTimer = null;
+
+// How often open dashboards ask for changed devices
+const REFRESH_INTERVAL = 30000;
+// Rows fetched per request, and rows kept in the DOM above and below the view
+const BLOCK_SIZE = 100;
+const OVERSCAN = 10;
+// Wait for a pause in typing before searching
+const SEARCH_DELAY = 150;
 
 // Helper function to get correct API URL
 function getApiUrl(endpoint) {
@@ -22,6 +36,17 @@ async function initializeApp() {
     await i18n.init();
     updateUIText();
     setupSearchListener();
+    window.addEventListener('resize', scheduleRender);
+    await loadInventory();
+    setInterval(refreshDevices, REFRESH_INTERVAL);
+}
+
+// Show the last known devices right away, without contacting them
+async function loadInventory() {
+    const result = await queryDevices();
+    if (result && !isScanning && result.devices.some(device => device.stale)) {
+        document.getElementById('statusMessage').textContent = i18n.t('scan_status_cached', { count: result.total });
+    }
 }
 
 function updateUIText() {
@@ -33,25 +58,55 @@ function updateUIText() {
 
 function setupSearchListener() {
     const searchInput = document.getElementById('searchInput');
-    searchInput.addEventListener('input', (e) => {
-        filterDevices(e.target.value);
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(queryDevices, SEARCH_DELAY);
     });
 }
 
-function filterDevices(searchTerm) {
-    if (!searchTerm.trim()) {
-        filteredDevices = [...devicesData];
-    } else {
-        const term = searchTerm.toLowerCase();
-        filteredDevices = devicesData.filter(device => 
-            device.name.toLowerCase().includes(term) ||
-            device.ip.includes(term) ||
-            device.mac.toLowerCase().includes(term) ||
-            device.type.toLowerCase().includes(term) ||
-            device.fw.toLowerCase().includes(term)
-        );
+// /api/devices URL for the current search and sort
+function queryUrl(extra = {}) {
+    const params = new URLSearchParams(Object.assign({
+        q: document.getElementById('searchInput').value.trim(),
+        sort: sortColumns.map(sort => (sort.direction === 'desc' ? '-' : '') + sort.column).join(','),
+        offset: 0,
+        limit: BLOCK_SIZE
+    }, extra));
+    return getApiUrl(`/api/devices?${params}`);
+}
+
+// Fetch the block of rows starting at start into the row cache; returns the
+// result, or null if it failed or a newer query started in the meantime
+async function fetchBlock(start, sequence = querySequence) {
+    try {
+        const response = await fetch(queryUrl({ offset: start }));
+        if (!response.ok) return null;
+        const result = await response.json();
+        if (sequence !== querySequence) return null;
+        
+        totalDevices = result.total;
+        inventoryVersion = result.version;
+        result.devices.forEach((device, i) => rowCache.set(start + i, device));
+        return result;
+    } catch (error) {
+        return null;
+    } finally {
+        loadingBlocks.delete(start);
     }
-    displayDevices(filteredDevices);
+}
+
+// Start over with the current search and sort, from the top of the table
+async function queryDevices() {
+    const sequence = ++querySequence;
+    rowCache = new Map();
+    loadingBlocks = new Set();
+    const result = await fetchBlock(0, sequence);
+    if (!result) return null;
+    
+    const viewport = document.getElementById('deviceViewport');
+    if (viewport) viewport.scrollTop = 0;
+    displayDevices();
+    return result;
 }
 
 // Wait for DOM and i18n to be ready
@@ -64,72 +119,189 @@ async function startScan() {
     const btn = document.getElementById('scanBtn');
     const btnText = document.getElementById('scanBtnText');
     const status = document.getElementById('statusMessage');
-    const deviceTable = document.getElementById('deviceTable');
     
     btn.disabled = true;
     btnText.textContent = i18n.t('scan_status_scanning');
     status.textContent = i18n.t('scan_status_scanning');
-    deviceTable.innerHTML = '<div class="loading"><div class="mdc-circular-progress"></div><div>' + i18n.t('loading_message') + '</div></div>';
+    showMessage('<div class="loading"><div class="mdc-circular-progress"></div><div>' + i18n.t('loading_message') + '</div></div>');
     
-    try {
-        const response = await fetch(getApiUrl('/api/scan'));
-        const devices = await response.json();
-        
-        devicesData = devices;
-        filteredDevices = [...devices];
-        displayDevices(filteredDevices);
-        status.textContent = i18n.t('scan_status_complete', { count: devices.length });
-    } catch (error) {
-        status.textContent = i18n.t('scan_status_error', { error: error.message });
-        deviceTable.innerHTML = '<div class="empty-state"><div class="empty-state__icon">⚠️</div><div class="empty-state__message">' + i18n.t('error_occurred') + '</div></div>';
-    } finally {
+    const finishScan = () => {
         isScanning = false;
         btn.disabled = false;
         btnText.textContent = i18n.t('scan_button');
-    }
+    };
+    
+    // Rows arrive from HA first, live device data is patched in as it comes
+    const source = new EventSource(getApiUrl('/api/scan/stream'));
+    let enrichedCount = 0;
+    
+    let scanCount = 0;
+    
+    source.addEventListener('devices', (e) => {
+        // The rows are in the server's index now, only the page is fetched
+        scanCount = JSON.parse(e.data).length;
+        queryDevices();
+        status.textContent = i18n.t('scan_status_enriching', { done: 0, count: scanCount });
+    });
+    
+    source.addEventListener('device', (e) => {
+        const device = JSON.parse(e.data);
+        applyDevicePatch(device);
+        enrichedCount++;
+        status.textContent = i18n.t('scan_status_enriching', { done: enrichedCount, count: scanCount });
+    });
+    
+    source.addEventListener('done', (e) => {
+        source.close();
+        const result = JSON.parse(e.data);
+        status.textContent = i18n.t('scan_status_complete', { count: result.count });
+        finishScan();
+        // Sort and filter again with the live data
+        queryDevices();
+    });
+    
+    source.addEventListener('scan_error', (e) => {
+        source.close();
+        const result = JSON.parse(e.data);
+        status.textContent = i18n.t('scan_status_error', { error: result.error });
+        finishScan();
+    });
+    
+    source.onerror = () => {
+        // Connection dropped before the scan finished
+        source.close();
+        if (!isScanning) return;
+        status.textContent = i18n.t('scan_status_error', { error: i18n.t('error_occurred') });
+        if (rowElements.size === 0) {
+            showMessage('<div class="empty-state"><div class="empty-state__icon">⚠️</div><div class="empty-state__message">' + i18n.t('error_occurred') + '</div></div>');
+        }
+        finishScan();
+    };
 }
 
-function sortDevices(column) {
-    if (sortColumn === column) {
-        sortDirection = sortDirection === 'asc' ? 'desc' : 'asc';
-    } else {
-        sortColumn = column;
-        sortDirection = 'asc';
+// Merge live data for one device and update only its own cells
+function applyDevicePatch(patch) {
+    for (const device of rowCache.values()) {
+        if (device.id !== patch.id) continue;
+        
+        Object.assign(device, patch);
+        if (!patch.stale) {
+            // Confirmed by live data since the snapshot was restored
+            delete device.stale;
+            delete device.cached_at;
+        }
+        const row = rowElements.get(String(device.id));
+        if (row) updateRow(row, device);
+        return;
     }
+}
 
-    filteredDevices.sort((a, b) => {
-        let valA = a[column];
-        let valB = b[column];
-
-        if (typeof valA === 'boolean') {
-            valA = valA ? 1 : 0;
-            valB = valB ? 1 : 0;
+// Patch the cached row of the device at an IP, e.g. after changing it
+function applyPatchByIp(ip, patch) {
+    for (const device of rowCache.values()) {
+        if (device.ip === ip) {
+            applyDevicePatch(Object.assign({ id: device.id }, patch));
+            return;
         }
+    }
+}
+
+// Reload the rows in view when the inventory changed since the last query
+async function refreshDevices() {
+    if (isScanning || inventoryVersion === null || document.hidden) return;
+    
+    const version = inventoryVersion;
+    const [first] = visibleRange();
+    const start = Math.floor(first / BLOCK_SIZE) * BLOCK_SIZE;
+    const result = await fetchBlock(start);
+    if (!result || result.version === version) return;
+    
+    // Other cached blocks are outdated, they're fetched again as they come into view
+    for (const index of [...rowCache.keys()]) {
+        if (index < start || index >= start + result.devices.length) rowCache.delete(index);
+    }
+    displayDevices();
+}
 
-        if (typeof valA === 'string') {
-            valA = valA.toLowerCase();
-            valB = valB.toLowerCase();
+// Click sorts on a column (again to reverse), shift-click adds it as a further sort column
+function sortDevices(column, event) {
+    const index = sortColumns.findIndex(sort => sort.column === column);
+    if (event && event.shiftKey) {
+        if (index === -1) {
+            sortColumns.push({ column: column, direction: 'asc' });
+        } else {
+            sortColumns[index].direction = sortColumns[index].direction === 'asc' ? 'desc' : 'asc';
         }
+    } else if (index === 0) {
+        sortColumns = [{ column: column, direction: sortColumns[0].direction === 'asc' ? 'desc' : 'asc' }];
+    } else {
+        sortColumns = [{ column: column, direction: 'asc' }];
+    }
+    
+    renderHeader();
+    queryDevices();
+}
 
-        if (valA < valB) return sortDirection === 'asc' ? -1 : 1;
-        if (valA > valB) return sortDirection === 'asc' ? 1 : -1;
-        return 0;
-    });
+// Device table DOM: <tr>s are kept per device id while in view, and reused
+// for other devices when they scroll out
+let rowElements = new Map();
+let spareRows = [];
+let placeholderRows = [];
+let rowHeight = 49;
+let renderQueued = false;
 
-    displayDevices(filteredDevices);
+// Replace the table with a message (loading, empty, error)
+function showMessage(html) {
+    rowElements = new Map();
+    spareRows = [];
+    placeholderRows = [];
+    document.getElementById('deviceTable').innerHTML = html;
 }
 
-function displayDevices(devices) {
-    const deviceTable = document.getElementById('deviceTable');
-    
-    if (devices.length === 0) {
-        deviceTable.innerHTML = '<div class="empty-state"><div class="empty-state__icon">🔍</div><div class="empty-state__message">' + i18n.t('no_devices_found') + '</div></div>';
+// Show the rows in view, building the table first if needed
+function displayDevices() {
+    if (totalDevices === 0) {
+        showMessage('<div class="empty-state"><div class="empty-state__icon">🔍</div><div class="empty-state__message">' + i18n.t('no_devices_found') + '</div></div>');
         return;
     }
     
-    const getSortClass = (column) => {
-        if (sortColumn !== column) return '';
-        return sortDirection === 'asc' ? 'mdc-data-table__header-cell--sorted-ascending' : 'mdc-data-table__header-cell--sorted-descending';
+    if (!document.getElementById('deviceViewport')) {
+        document.getElementById('deviceTable').innerHTML = `
+            <div class="mdc-data-table device-viewport" id="deviceViewport">
+                <table class="mdc-data-table__table">
+                    <thead id="deviceHeader"></thead>
+                    <tbody class="mdc-data-table__content" id="deviceRows">
+                        <tr class="device-spacer" id="spacerTop"></tr>
+                        <tr class="device-spacer" id="spacerBottom"></tr>
+                    </tbody>
+                </table>
+            </div>
+        `;
+        document.getElementById('deviceViewport').addEventListener('scroll', scheduleRender, { passive: true });
+        renderHeader();
+    }
+    renderRows();
+}
+
+function scheduleRender() {
+    if (renderQueued) return;
+    renderQueued = true;
+    requestAnimationFrame(() => {
+        renderQueued = false;
+        renderRows();
+    });
+}
+
+function renderHeader() {
+    const header = document.getElementById('deviceHeader');
+    if (!header) return;
+    
+    const headerCell = (column, label) => {
+        const sort = sortColumns.find(sort => sort.column === column);
+        const sortClass = !sort ? '' : 'mdc-data-table__header-cell--sorted ' + (sort.direction === 'asc'
+            ? 'mdc-data-table__header-cell--sorted-ascending'
+            : 'mdc-data-table__header-cell--sorted-descending');
+        return `<th class="mdc-data-table__header-cell ${sortClass}" onclick="sortDevices('${column}', event)">${i18n.t(label)}</th>`;
     };
 
     const checkboxColumn = selectionMode ? `<th class="mdc-data-table__header-cell mdc-data-table__header-cell--checkbox">
@@ -141,77 +313,211 @@ function displayDevices(devices) {
         </div>
     </th>` : '';
 
-    deviceTable.innerHTML = `
-        <div class="mdc-data-table">
-            <table class="mdc-data-table__table">
-                <thead>
-                    <tr class="mdc-data-table__header-row">
-                        ${checkboxColumn}
-                        <th class="mdc-data-table__header-cell ${getSortClass('name')} ${sortColumn === 'name' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('name')">${i18n.t('table_header_name')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('type')} ${sortColumn === 'type' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('type')">${i18n.t('table_header_type')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('generation')} ${sortColumn === 'generation' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('generation')">${i18n.t('table_header_gen')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('ip')} ${sortColumn === 'ip' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('ip')">${i18n.t('table_header_ip')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('mac')} ${sortColumn === 'mac' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('mac')">${i18n.t('table_header_mac')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('fw')} ${sortColumn === 'fw' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('fw')">${i18n.t('table_header_fw')}</th>
-                        <th class="mdc-data-table__header-cell ${getSortClass('auth')} ${sortColumn === 'auth' ? 'mdc-data-table__header-cell--sorted' : ''}" onclick="sortDevices('auth')">${i18n.t('table_header_auth')}</th>
-                    </tr>
-                </thead>
-                <tbody class="mdc-data-table__content">
-                    ${devices.map(device => {
-                        const fwClass = device.has_update ? 'fw-outdated' : 'fw-latest';
-                        let tooltipText = '';
-                        let showButton = false;
-                        
-                        if (device.has_update) {
-                            if (device.can_update) {
-                                tooltipText = i18n.t('fw_update_to', { version: device.latest_version });
-                                showButton = true;
-                            } else {
-                                tooltipText = i18n.t('fw_set_password');
-                            }
-                        } else {
-                            tooltipText = i18n.t('fw_latest');
-                        }
-
-                        const checkboxCell = selectionMode ? `<td class="mdc-data-table__cell mdc-data-table__cell--checkbox">
-                            <div class="mdc-checkbox">
-                                <input type="checkbox" class="mdc-checkbox__native-control device-checkbox" value="${device.ip}" onchange="toggleDevice('${device.ip}', this.checked)" ${selectedDevices.has(device.ip) ? 'checked' : ''}>
-                                <div class="mdc-checkbox__background">
-                                    <div class="mdc-checkbox__checkmark"></div>
-                                </div>
-                            </div>
-                        </td>` : '';
-                        
-                        return `
-                        <tr class="mdc-data-table__row ${selectedDevices.has(device.ip) ? 'mdc-data-table__row--selected' : ''}">
-                            ${checkboxCell}
-                            <td class="mdc-data-table__cell">${escapeHtml(device.name)}</td>
-                            <td class="mdc-data-table__cell"><span class="device-type-badge">${escapeHtml(device.type)}</span></td>
-                            <td class="mdc-data-table__cell">${i18n.t('gen_prefix')}${device.generation || 1}</td>
-                            <td class="mdc-data-table__cell"><a href="http://${escapeHtml(device.ip)}" target="_blank">${escapeHtml(device.ip)}</a></td>
-                            <td class="mdc-data-table__cell">${escapeHtml(device.mac)}</td>
-                            <td class="mdc-data-table__cell fw-cell">
-                                <span class="${fwClass}">${escapeHtml(device.fw)}</span>
-                                <div class="fw-tooltip">
-                                    <div class="fw-tooltip-text">${tooltipText}</div>
-                                    ${showButton ? `<button class="fw-update-btn" onclick="updateFirmware('${device.ip}', event)">${i18n.t('fw_update_btn')}</button>` : ''}
-                                </div>
-                            </td>
-                            <td class="mdc-data-table__cell">
-                                <span class="auth-badge ${device.auth ? 'auth-enabled' : 'auth-disabled'}" 
-                                      onclick="toggleAuth('${device.ip}', ${device.auth}, event)"
-                                      title="Click to ${device.auth ? 'disable' : 'enable'} authentication">
-                                    ${device.auth ? i18n.t('auth_enabled') : i18n.t('auth_disabled')}
-                                </span>
-                            </td>
-                        </tr>
-                    `;}).join('')}
-                </tbody>
-            </table>
-        </div>
+    header.innerHTML = `
+        <tr class="mdc-data-table__header-row">
+            ${checkboxColumn}
+            ${headerCell('name', 'table_header_name')}
+            ${headerCell('type', 'table_header_type')}
+            ${headerCell('generation', 'table_header_gen')}
+            ${headerCell('ip', 'table_header_ip')}
+            ${headerCell('mac', 'table_header_mac')}
+            ${headerCell('fw', 'table_header_fw')}
+            ${headerCell('auth', 'table_header_auth')}
+        </tr>
     `;
 }
 
+// Indexes of the first and (exclusive) last row to have in the DOM
+function visibleRange() {
+    const viewport = document.getElementById('deviceViewport');
+    if (!viewport) return [0, Math.min(totalDevices, BLOCK_SIZE)];
+    const first = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - OVERSCAN);
+    // The viewport grows with its rows up to the window height
+    const height = Math.max(viewport.clientHeight, window.innerHeight);
+    const count = Math.ceil(height / rowHeight) + 2 * OVERSCAN;
+    return [first, Math.min(totalDevices, first + count)];
+}
+
+// Fetch the blocks the view needs and forget the ones far away from it
+function loadRows(first, last) {
+    for (let start = Math.floor(first / BLOCK_SIZE) * BLOCK_SIZE; start < last; start += BLOCK_SIZE) {
+        if (rowCache.has(start) && rowCache.has(Math.min(start + BLOCK_SIZE, totalDevices) - 1)) continue;
+        if (loadingBlocks.has(start)) continue;
+        loadingBlocks.add(start);
+        fetchBlock(start).then(result => {
+            if (result) scheduleRender();
+        });
+    }
+    for (const index of rowCache.keys()) {
+        if (index < first - BLOCK_SIZE || index >= last + BLOCK_SIZE || index >= totalDevices) {
+            rowCache.delete(index);
+        }
+    }
+}
+
+function renderRows() {
+    const tbody = document.getElementById('deviceRows');
+    if (!tbody) return;
+    
+    const [first, last] = visibleRange();
+    loadRows(first, last);
+    
+    const devices = [];
+    for (let index = first; index < last; index++) {
+        devices.push(rowCache.get(index) || null);
+    }
+    
+    // Rows of devices that are no longer in view are kept for reuse
+    const inView = new Set(devices.filter(Boolean).map(device => String(device.id)));
+    for (const [id, row] of rowElements) {
+        if (!inView.has(id)) {
+            row.remove();
+            rowElements.delete(id);
+            spareRows.push(row);
+        }
+    }
+    placeholderRows.forEach(row => row.remove());
+    
+    // Put the rows in order between the spacers, moving only what's out of place
+    const top = document.getElementById('spacerTop');
+    let previous = top;
+    let placeholders = 0;
+    for (const device of devices) {
+        const row = device ? rowFor(device) : placeholderRow(placeholders++);
+        if (previous.nextElementSibling !== row) {
+            tbody.insertBefore(row, previous.nextSibling);
+        }
+        previous = row;
+    }
+    top.style.height = `${first * rowHeight}px`;
+    document.getElementById('spacerBottom').style.height = `${(totalDevices - last) * rowHeight}px`;
+    
+    // Rows may be taller or shorter than assumed (fonts, badges): measure once
+    const sample = rowElements.values().next().value;
+    if (sample && Math.abs(sample.offsetHeight - rowHeight) > 1 && sample.offsetHeight > 0) {
+        rowHeight = sample.offsetHeight;
+        scheduleRender();
+    }
+}
+
+function rowFor(device) {
+    const id = String(device.id);
+    let row = rowElements.get(id);
+    if (!row) {
+        row = spareRows.pop() || document.createElement('tr');
+        rowElements.set(id, row);
+    }
+    updateRow(row, device);
+    return row;
+}
+
+// Empty row for a device that is still being fetched
+function placeholderRow(index) {
+    if (!placeholderRows[index]) {
+        const row = document.createElement('tr');
+        row.className = 'mdc-data-table__row device-row--placeholder';
+        row.innerHTML = `<td class="mdc-data-table__cell" colspan="8">…</td>`;
+        placeholderRows[index] = row;
+    }
+    return placeholderRows[index];
+}
+
+// Bring a row up to date with a device, touching only the cells that changed
+function updateRow(row, device) {
+    const cells = deviceCells(device);
+    const pending = !device.scan_status && !device.error;
+    row.className = `mdc-data-table__row ${selectedDevices.has(device.ip) ? 'mdc-data-table__row--selected' : ''} ${pending ? 'device-row--pending' : ''}`;
+    row.dataset.deviceId = device.id;
+    row.device = device;
+    
+    while (row.cells.length > cells.length) {
+        row.deleteCell(-1);
+    }
+    while (row.cells.length < cells.length) {
+        row.insertCell(-1);
+    }
+    cells.forEach((cell, i) => {
+        const td = row.cells[i];
+        if (td.className !== cell.className) td.className = cell.className;
+        if (td.renderedHtml !== cell.html) {
+            td.innerHTML = cell.html;
+            td.renderedHtml = cell.html;
+        }
+    });
+}
+
+// Update the rows in view in place, e.g. after a selection change
+function updateRows() {
+    rowElements.forEach(row => updateRow(row, row.device));
+}
+
+// Class and contents of each cell of a device row
+function deviceCells(device) {
+    const fwClass = device.has_update ? 'fw-outdated' : 'fw-latest';
+    let tooltipText = '';
+    let showButton = false;
+    
+    if (device.has_update) {
+        if (device.can_update) {
+            tooltipText = i18n.t('fw_update_to', { version: device.latest_version });
+            showButton = true;
+        } else {
+            tooltipText = i18n.t('fw_set_password');
+        }
+    } else {
+        tooltipText = i18n.t('fw_latest');
+    }
+
+    const checkbox = `
+        <div class="mdc-checkbox">
+            <input type="checkbox" class="mdc-checkbox__native-control device-checkbox" value="${device.ip}" onchange="toggleDevice('${device.ip}', this.checked)" ${selectedDevices.has(device.ip) ? 'checked' : ''}>
+            <div class="mdc-checkbox__background">
+                <div class="mdc-checkbox__checkmark"></div>
+            </div>
+        </div>`;
+    
+    // Rows without scan_status are still waiting for live data
+    const pending = !device.scan_status && !device.error;
+    const generation = device.generation ? `${i18n.t('gen_prefix')}${device.generation}` : (pending ? '…' : `${i18n.t('gen_prefix')}1`);
+    const offline = device.offline_since
+        ? `<span class="offline-badge" title="${escapeHtml(new Date(device.offline_since * 1000).toLocaleString())}">${i18n.t('offline_since', { time: formatSince(device.offline_since) })}</span>`
+        : '';
+    const stale = device.stale && device.cached_at
+        ? `<span class="stale-badge" title="${escapeHtml(new Date(device.cached_at * 1000).toLocaleString())}">${i18n.t('cached_since', { time: formatSince(device.cached_at) })}</span>`
+        : '';
+    
+    const cell = 'mdc-data-table__cell';
+    
+    return [
+        ...(selectionMode ? [{ className: `${cell} mdc-data-table__cell--checkbox`, html: checkbox }] : []),
+        { className: cell, html: `${escapeHtml(device.name)}${offline}${stale}` },
+        { className: cell, html: `<span class="device-type-badge">${escapeHtml(device.type)}</span>` },
+        { className: cell, html: generation },
+        { className: cell, html: `<a href="http://${escapeHtml(device.ip)}" target="_blank">${escapeHtml(device.ip)}</a>` },
+        { className: cell, html: escapeHtml(device.mac) },
+        { className: `${cell} fw-cell`, html: `
+            <span class="${fwClass}">${escapeHtml(device.fw)}</span>
+            <div class="fw-tooltip">
+                <div class="fw-tooltip-text">${tooltipText}</div>
+                ${showButton ? `<button class="fw-update-btn" onclick="updateFirmware('${device.ip}', event)">${i18n.t('fw_update_btn')}</button>` : ''}
+            </div>` },
+        { className: cell, html: `
+            <span class="auth-badge ${device.auth ? 'auth-enabled' : 'auth-disabled'}" 
+                  onclick="toggleAuth('${device.ip}', ${device.auth}, event)"
+                  title="Click to ${device.auth ? 'disable' : 'enable'} authentication">
+                ${device.auth ? i18n.t('auth_enabled') : i18n.t('auth_disabled')}
+            </span>` }
+    ];
+}
+
+// Short "how long ago" for a unix timestamp, e.g. "5 min" or "3 h"
+function formatSince(timestamp) {
+    const minutes = Math.max(0, Math.floor((Date.now() / 1000 - timestamp) / 60));
+    if (minutes < 60) return `${minutes} min`;
+    if (minutes < 48 * 60) return `${Math.floor(minutes / 60)} h`;
+    return `${Math.floor(minutes / 1440)} d`;
+}
+
 // Selection mode functions
 function toggleSelectionMode() {
     selectionMode = !selectionMode;
@@ -225,32 +531,44 @@ function toggleSelectionMode() {
         selectedDevices.clear();
     }
     
-    displayDevices(filteredDevices);
+    renderHeader();
+    updateRows();
     updateSelectedCount();
 }
 
 function toggleDevice(ip, checked) {
+    const row = [...rowElements.values()].find(row => row.device.ip === ip);
     if (checked) {
-        selectedDevices.add(ip);
+        selectedDevices.set(ip, Boolean(row && row.device.auth));
     } else {
         selectedDevices.delete(ip);
     }
+    if (row) updateRow(row, row.device);
     updateSelectedCount();
 }
 
-function toggleSelectAll(checked) {
+// Selects every device matching the search, not just the ones in view
+async function toggleSelectAll(checked) {
     if (checked) {
-        filteredDevices.forEach(device => selectedDevices.add(device.ip));
+        try {
+            const response = await fetch(queryUrl({ select: 'true', limit: 0 }));
+            const result = await response.json();
+            result.selection.forEach(device => selectedDevices.set(device.ip, device.auth));
+        } catch (error) {
+            rowElements.forEach(row => selectedDevices.set(row.device.ip, Boolean(row.device.auth)));
+        }
     } else {
         selectedDevices.clear();
     }
-    displayDevices(filteredDevices);
+    updateRows();
     updateSelectedCount();
 }
 
 function clearSelection() {
     selectedDevices.clear();
-    displayDevices(filteredDevices);
+    const selectAll = document.getElementById('selectAll');
+    if (selectAll) selectAll.checked = false;
+    updateRows();
     updateSelectedCount();
 }
 
@@ -258,20 +576,88 @@ function updateSelectedCount() {
     document.getElementById('selectedCount').textContent = `${selectedDevices.size} selected`;
 }
 
-// Batch operations (placeholders for v0.7.0)
+// Batch operations (run in the background on the server)
 function batchUpdate() {
     if (selectedDevices.size === 0) return;
-    alert(`Batch update for ${selectedDevices.size} devices will be implemented in v0.7.0`);
+    // Firmware goes out in waves, each wave waiting for the previous one to come back
+    runBatch('/api/rollout', {}, i18n.t('batch_confirm_update', { count: selectedDevices.size }));
 }
 
 function batchToggleAuth() {
     if (selectedDevices.size === 0) return;
-    alert(`Batch auth toggle for ${selectedDevices.size} devices will be implemented in v0.7.0`);
+    // Enable unless every selected device already has auth on
+    const enable = [...selectedDevices.values()].some(auth => !auth);
+    const message = enable
+        ? i18n.t('batch_confirm_auth_enable', { count: selectedDevices.size })
+        : i18n.t('batch_confirm_auth_disable', { count: selectedDevices.size });
+    runBatch('/api/batch/auth', { enable: enable }, message);
 }
 
 function batchReboot() {
     if (selectedDevices.size === 0) return;
-    alert(`Batch reboot for ${selectedDevices.size} devices will be implemented in v0.7.0`);
+    runBatch('/api/batch/reboot', {}, i18n.t('batch_confirm_reboot', { count: selectedDevices.size }));
+}
+
+async function runBatch(path, options, confirmMessage) {
+    if (!confirm(confirmMessage)) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(getApiUrl(path), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(Object.assign({ devices: [...selectedDevices.keys()] }, options))
+        });
+        
+        const job = await response.json();
+        
+        if (response.ok) {
+            watchJob(job.id);
+        } else {
+            alert(i18n.t('batch_error', { error: job.error || 'Unknown error' }));
+        }
+    } catch (error) {
+        alert(i18n.t('batch_error', { error: error.message }));
+    }
+}
+
+// Show job progress in the status line until it's done, then refresh the rows in view
+function watchJob(jobId) {
+    const status = document.getElementById('statusMessage');
+    
+    const poll = async () => {
+        try {
+            const response = await fetch(getApiUrl(`/api/jobs/${jobId}`));
+            const job = await response.json();
+            if (!response.ok) {
+                status.textContent = i18n.t('batch_error', { error: job.error || 'Unknown error' });
+                return;
+            }
+            
+            const operation = i18n.t(`batch_op_${job.operation}`);
+            if (job.status === 'running') {
+                if (job.operation === 'rollout') {
+                    status.textContent = i18n.t('rollout_progress', { wave: job.wave, waves: job.waves, done: job.done, total: job.total, failed: job.failed });
+                } else {
+                    status.textContent = i18n.t('batch_progress', { operation: operation, done: job.done, total: job.total, failed: job.failed });
+                }
+                setTimeout(poll, 2000);
+            } else if (job.status === 'aborted') {
+                status.textContent = i18n.t('rollout_aborted', { wave: job.wave, succeeded: job.succeeded, failed: job.failed });
+                refreshDevices();
+            } else {
+                status.textContent = i18n.t('batch_complete', { operation: operation, succeeded: job.succeeded, failed: job.failed });
+                refreshDevices();
+            }
+        } catch (error) {
+            setTimeout(poll, 5000);
+        }
+    };
+    
+    poll();
 }
 
 function escapeHtml(text) {
@@ -300,19 +686,19 @@ async function updateFirmware(ip, event) {
     btn.textContent = i18n.t('fw_updating');
     
     try {
-        const response = await fetch(getApiUrl(`/api/update/${ip}`), {
-            method: 'POST'
+        const response = await fetch(getApiUrl('/api/rollout'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ devices: [ip] })
         });
         
         const data = await response.json();
         
-        if (response.ok && data.success) {
-            btn.textContent = i18n.t('fw_updated');
-            btn.style.background = '#3fb950';
-            
-            setTimeout(() => {
-                startScan();
-            }, 30000);
+        if (response.ok) {
+            // The row shows the new firmware once the device is back with it
+            watchJob(data.id);
         } else {
             btn.textContent = i18n.t('fw_failed');
             btn.style.background = '#f85149';
@@ -364,9 +750,11 @@ async function toggleAuth(ip, currentlyEnabled, event) {
         
         if (response.ok && data.success) {
             badge.textContent = i18n.t('auth_toggle_success');
+            if (selectedDevices.has(ip)) selectedDevices.set(ip, data.auth_enabled);
             
+            // Only this device's auth cell changes
             setTimeout(() => {
-                startScan();
+                applyPatchByIp(ip, { auth: data.auth_enabled });
             }, 2000);
         } else {
             badge.textContent = i18n.t('auth_toggle_failed');
@@ -0,0 +1,130 @@
+"""
+Shared cache of live device status
+Written by the background poller (and push listeners), read by the API
+"""
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StatusCache:
+    """Latest status, device info and reachability per HA device id"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(device_id, entry) after every change; entry is None when a device is removed"""
+        self.listeners.append(listener)
+
+    def _notify(self, device_id, entry):
+        """Tell listeners about a change (called without the lock held)"""
+        for listener in self.listeners:
+            try:
+                listener(device_id, entry)
+            except Exception as e:
+                logger.error("Error in status listener: %s", e, exc_info=True)
+
+    def _entry(self, device_id):
+        """Get or create the entry for a device (caller holds the lock)"""
+        return self.entries.setdefault(device_id, {
+            'status': None,
+            'info': None,
+            'online': None,
+            'last_seen': None,
+            'offline_since': None,
+            'error': None,
+            'source': None,
+        })
+
+    def restore(self, entries):
+        """Seed the cache with entries saved by an earlier run (no listeners are called)"""
+        with self.lock:
+            for device_id, saved in entries.items():
+                entry = self._entry(device_id)
+                entry.update({key: saved.get(key) for key in entry})
+
+    def update(self, device_id, status=None, info=None, source='poll'):
+        """Store a successful status/info reading"""
+        with self.lock:
+            entry = self._entry(device_id)
+            if status is not None:
+                entry['status'] = status
+            if info is not None:
+                entry['info'] = info
+            entry.update({
+                'online': True,
+                'last_seen': time.time(),
+                'offline_since': None,
+                'error': None,
+                'source': source,
+            })
+            snapshot = copy.deepcopy(entry)
+        self._notify(device_id, snapshot)
+
+    def merge_status(self, device_id, partial, source='push'):
+        """Merge a partial status update (per component) into the cached status"""
+        with self.lock:
+            entry = self._entry(device_id)
+            status = entry['status'] or {}
+            for component, value in partial.items():
+                if isinstance(value, dict) and isinstance(status.get(component), dict):
+                    status[component].update(value)
+                else:
+                    status[component] = value
+            entry['status'] = status
+            entry.update({
+                'online': True,
+                'last_seen': time.time(),
+                'offline_since': None,
+                'error': None,
+                'source': source,
+            })
+            snapshot = copy.deepcopy(entry)
+        self._notify(device_id, snapshot)
+
+    def mark_offline(self, device_id, error=None):
+        """Record a failed reading, keeping the last known status"""
+        with self.lock:
+            entry = self._entry(device_id)
+            if entry['online'] is not False:
+                entry['offline_since'] = time.time()
+            entry['online'] = False
+            entry['error'] = error
+            snapshot = copy.deepcopy(entry)
+        self._notify(device_id, snapshot)
+
+    def remove(self, device_id):
+        """Forget a device"""
+        with self.lock:
+            if self.entries.pop(device_id, None) is None:
+                return
+        self._notify(device_id, None)
+
+    def get(self, device_id):
+        """Get a copy of the entry for a device, or None"""
+        with self.lock:
+            entry = self.entries.get(device_id)
+            return copy.deepcopy(entry) if entry else None
+
+    def summary(self, device_id):
+        """Reachability fields for merging into device lists"""
+        with self.lock:
+            entry = self.entries.get(device_id)
+            if not entry:
+                return {}
+            return {
+                'online': entry['online'],
+                'last_seen': entry['last_seen'],
+                'offline_since': entry['offline_since'],
+            }
+
+    def snapshot(self):
+        """Get a copy of all entries"""
+        with self.lock:
+            return copy.deepcopy(self.entries)
@@ -0,0 +1,227 @@
+"""
+Background status poller
+Polls every device on its own schedule: online devices at a fixed
+interval, failing devices with exponential backoff, all with jitter
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import event_loop
+
+logger = logging.getLogger(__name__)
+
+
+class StatusPoller:
+    """Per-device adaptive polling into the status cache
+
+    With an async_client_factory (a coroutine returning an async client) polls
+    run on the shared event loop instead of the thread pool.
+    """
+
+    def __init__(self, inventory, status_cache, client_factory,
+                 interval=60, max_backoff=900, jitter=0.2, max_concurrent=4, skip=None,
+                 async_client_factory=None):
+        self.inventory = inventory
+        self.status_cache = status_cache
+        self.client_factory = client_factory
+        self.async_client_factory = async_client_factory
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_concurrent = max(1, max_concurrent)
+        # skip(device_id) -> True for devices whose status arrives another way
+        self.skip = skip
+
+        self.schedule = []
+        self.due = {}
+        self.in_flight = set()
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='poll')
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in the background"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='status-poller', daemon=True)
+        self._thread.start()
+        logger.info("✓ Status poller started (%ss interval, %s at a time)", self.interval, self.max_concurrent)
+
+    def stop(self):
+        """Stop polling"""
+        self._stopped.set()
+        self._wake.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _jittered(self, delay):
+        """Spread a delay by +/- jitter so polls don't line up"""
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, due, device_id):
+        """Schedule a poll, replacing any earlier schedule (caller holds the lock)"""
+        self.due[device_id] = due
+        heapq.heappush(self.schedule, (due, device_id))
+
+    def poll_now(self, device_id):
+        """Move a device to the front of the queue, e.g. after a user action"""
+        with self.lock:
+            if device_id in self.due:
+                self._push(time.monotonic(), device_id)
+        self._wake.set()
+
+    def _sync_devices(self):
+        """Schedule new devices and forget removed ones"""
+        devices = {d['id']: d for d in self.inventory.get_devices() if d.get('id') and d.get('ip')}
+        now = time.monotonic()
+
+        with self.lock:
+            # New devices start at a random point in the interval so the first
+            # round doesn't hit every device at once
+            for device_id in devices:
+                if device_id not in self.due and device_id not in self.in_flight:
+                    self._push(now + random.uniform(0, self.interval), device_id)
+
+            # Stale heap entries are skipped when popped
+            for device_id in [d for d in self.due if d not in devices]:
+                del self.due[device_id]
+                self.failures.pop(device_id, None)
+                self.status_cache.remove(device_id)
+
+    def _run(self):
+        """Scheduler loop"""
+        next_sync = 0
+
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            if now >= next_sync:
+                try:
+                    self._sync_devices()
+                except Exception as e:
+                    logger.error("Poller could not read the inventory: %s", e)
+                next_sync = now + min(self.interval, 30)
+
+            with self.lock:
+                due = []
+                while self.schedule and self.schedule[0][0] <= now:
+                    when, device_id = heapq.heappop(self.schedule)
+                    if self.due.get(device_id) != when:
+                        continue
+                    del self.due[device_id]
+                    self.in_flight.add(device_id)
+                    due.append(device_id)
+                next_due = self.schedule[0][0] if self.schedule else now + 1
+
+            for device_id in due:
+                # Block here rather than queueing, so at most max_concurrent
+                # probes are ever on the network
+                self.slots.acquire()
+                if self._stopped.is_set():
+                    self.slots.release()
+                    return
+                if self.async_client_factory:
+                    event_loop.submit(self._poll_async(device_id))
+                else:
+                    self.executor.submit(self._poll, device_id)
+
+            self._wake.wait(max(0.05, min(next_due, next_sync) - time.monotonic()))
+            self._wake.clear()
+
+    def _begin(self, device_id):
+        """The device to poll, or None if it's gone or its status arrives by push"""
+        device = self.inventory.get(device_id)
+        if not device or not device.get('ip'):
+            # Removed while waiting, don't reschedule
+            with self.lock:
+                self.in_flight.discard(device_id)
+            return None
+
+        if self.skip and self.skip(device_id):
+            with self.lock:
+                self.in_flight.discard(device_id)
+                self.failures.pop(device_id, None)
+                self._push(time.monotonic() + self._jittered(self.interval), device_id)
+            return None
+
+        return device
+
+    def _store(self, device_id, device, info, status):
+        """Save a poll result, returning whether it was a good one"""
+        if not info or status is None:
+            return False
+        self.status_cache.update(device_id, status=status, info=info)
+        self.inventory.merge(device_id, {
+            'generation': info.get('generation'),
+            'auth': info.get('auth', False),
+            'fw': info.get('fw', device.get('fw')),
+            'type': info.get('type', device.get('type')),
+        })
+        return True
+
+    def _reschedule(self, device_id, ok):
+        """Schedule the next poll: the normal interval, or back off after failures"""
+        with self.lock:
+            self.in_flight.discard(device_id)
+            if ok:
+                self.failures.pop(device_id, None)
+                delay = self.interval
+            else:
+                failures = self.failures.get(device_id, 0) + 1
+                self.failures[device_id] = failures
+                delay = min(self.interval * (2 ** failures), self.max_backoff)
+            self._push(time.monotonic() + self._jittered(delay), device_id)
+
+        if not ok:
+            self.status_cache.mark_offline(device_id, 'No response')
+
+    def _poll(self, device_id):
+        """Poll one device and reschedule it"""
+        try:
+            device = self._begin(device_id)
+            if device is None:
+                return
+
+            ok = False
+            try:
+                client = self.client_factory(device['ip'], device.get('generation'))
+                if client:
+                    info = client.get_device_info()
+                    status = client.get_status() if info else None
+                    ok = self._store(device_id, device, info, status)
+            except Exception as e:
+                logger.debug("Poll of %s failed: %s", device['ip'], e, extra={'device': device['ip']})
+
+            self._reschedule(device_id, ok)
+
+        finally:
+            self.slots.release()
+
+    async def _poll_async(self, device_id):
+        """Poll one device on the event loop and reschedule it"""
+        try:
+            device = self._begin(device_id)
+            if device is None:
+                return
+
+            ok = False
+            try:
+                client = await self.async_client_factory(device['ip'], device.get('generation'))
+                if client:
+                    info = await client.get_device_info()
+                    status = await client.get_status() if info else None
+                    ok = self._store(device_id, device, info, status)
+            except Exception as e:
+                logger.debug("Poll of %s failed: %s", device['ip'], e, extra={'device': device['ip']})
+
+            self._reschedule(device_id, ok)
+
+        finally:
+            self.slots.release()
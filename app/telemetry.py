@@ -0,0 +1,295 @@
+"""
+In-process time series of device telemetry
+Numeric readings (power, energy, temperature, RSSI, uptime, ...) are taken
+from every status the add-on sees and kept per device and metric in
+fixed-size ring buffers: recent raw samples, 1-minute and 1-hour
+aggregates. The buffers are preallocated arrays, so memory use only depends
+on the number of series, not on how many samples come in.
+"""
+import array
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('power', 'energy', 'voltage', 'current', 'temperature',
+           'humidity', 'battery', 'rssi', 'uptime', 'ram_free')
+
+# (name, seconds per bucket, buckets kept)
+TIERS = (('minute', 60, 240), ('hour', 3600, 168))
+RAW_SIZE = 120
+
+# An unchanged reading is only stored again after this many seconds, so
+# statuses merged from push updates don't repeat stale values
+REPEAT_AFTER = 60
+
+
+def _number(value):
+    """value as a float, or None if it isn't a number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def _total(values):
+    """Sum of the numeric values, or None if there are none"""
+    numbers = [v for v in map(_number, values) if v is not None]
+    return sum(numbers) if numbers else None
+
+
+def _first(*values):
+    """First numeric value, or None"""
+    for value in values:
+        number = _number(value)
+        if number is not None:
+            return number
+    return None
+
+
+def gen1_metrics(status):
+    """Telemetry from a Gen1 /status reply"""
+    meters = status.get('meters', [])
+    emeters = status.get('emeters', [])
+    tmp = status.get('tmp') or {}
+    # meters count watt-minutes, emeters watt-hours
+    energy = [total / 60 for total in map(_number, (m.get('total') for m in meters)) if total is not None]
+    readings = {
+        'power': _total(m.get('power') for m in meters + emeters),
+        'energy': _total(energy + [m.get('total') for m in emeters]),
+        'voltage': _first(status.get('voltage'), *(m.get('voltage') for m in emeters)),
+        'current': _total(m.get('current') for m in emeters),
+        'temperature': _first(status.get('temperature'), tmp.get('tC'), tmp.get('value')),
+        'humidity': _first((status.get('hum') or {}).get('value')),
+        'battery': _first((status.get('bat') or {}).get('value')),
+        'rssi': _first((status.get('wifi_sta') or {}).get('rssi')),
+        'uptime': _first(status.get('uptime')),
+        'ram_free': _first(status.get('ram_free')),
+    }
+    return {metric: value for metric, value in readings.items() if value is not None}
+
+
+def coiot_metrics(sensors):
+    """Telemetry from the sensor values of a Gen1 CoIoT status packet
+
+    Sensor ids are <category><channel><sensor>, e.g. 4201 is the power of
+    the second channel; see the CoIoT v2 sensor list.
+    """
+    def values(category, codes):
+        return [value for key, value in sensors.items()
+                if len(key) == 4 and key[0] == category and key[2:] in codes]
+
+    # 4x03 counts watt-minutes, 4x06 watt-hours (like meters and emeters)
+    energy = [total / 60 for total in map(_number, values('4', ('03',))) if total is not None]
+    readings = {
+        'power': _total(values('4', ('01', '05'))),
+        'energy': _total(energy + values('4', ('06',))),
+        'voltage': _first(*values('4', ('08',))),
+        'current': _total(values('4', ('09',))),
+        'temperature': _first(sensors.get('3104'), *values('3', ('01',))),
+        'humidity': _first(*values('3', ('03',))),
+        'battery': _first(sensors.get('3111')),
+    }
+    return {metric: value for metric, value in readings.items() if value is not None}
+
+
+def gen2_metrics(status):
+    """Telemetry from a Gen2 Shelly.GetStatus reply"""
+    components = {key: value for key, value in status.items() if isinstance(value, dict)}
+
+    def fields(prefixes, name):
+        return [value.get(name) for key, value in components.items() if key.split(':')[0] in prefixes]
+
+    meters = ('switch', 'pm1', 'cover', 'light')
+    readings = {
+        'power': _total(fields(meters, 'apower') + fields(('em',), 'total_act_power')),
+        'energy': _total((value or {}).get('total') for value in fields(meters, 'aenergy')),
+        'voltage': _first(*fields(meters + ('voltmeter',), 'voltage'), *fields(('em',), 'a_voltage')),
+        'current': _total(fields(meters, 'current') + fields(('em',), 'total_current')),
+        'temperature': _first(*fields(('temperature',), 'tC'),
+                              *((value or {}).get('tC') for value in fields(meters, 'temperature'))),
+        'humidity': _first(*fields(('humidity',), 'rh')),
+        'battery': _first(*((value or {}).get('percent') for value in fields(('devicepower',), 'battery'))),
+        'rssi': _first((components.get('wifi') or {}).get('rssi')),
+        'uptime': _first((components.get('sys') or {}).get('uptime')),
+        'ram_free': _first((components.get('sys') or {}).get('ram_free')),
+    }
+    return {metric: value for metric, value in readings.items() if value is not None}
+
+
+def extract(status, source=None):
+    """Telemetry from a Gen1 or Gen2 status
+
+    A CoIoT update only refreshes the coiot sensor values; the rest of a
+    Gen1 status is whatever the last poll read, so only the sensors count.
+    """
+    if not isinstance(status, dict):
+        return {}
+    if source == 'coiot':
+        return coiot_metrics(status.get('coiot') or {})
+    if 'sys' in status or any(':' in key for key in status):
+        return gen2_metrics(status)
+    return gen1_metrics(status)
+
+
+class Tier:
+    """Fixed-size ring of (mean, min, max, count) buckets of step seconds"""
+
+    __slots__ = ('step', 'size', 'mean', 'low', 'high', 'count', 'newest')
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        # Doubles: energy counters run into the millions of Wh, more than a
+        # float32 holds to the unit
+        self.mean = array.array('d', bytes(8 * size))
+        self.low = array.array('d', bytes(8 * size))
+        self.high = array.array('d', bytes(8 * size))
+        self.count = array.array('H', bytes(2 * size))
+        # Bucket number (time // step) of the newest bucket, older slots follow from it
+        self.newest = None
+
+    def add(self, timestamp, value):
+        bucket = int(timestamp // self.step)
+        if self.newest is None or bucket > self.newest:
+            # Clear the slots of the buckets skipped since the newest one
+            first = bucket - self.size + 1 if self.newest is None else max(self.newest + 1, bucket - self.size + 1)
+            for skipped in range(first, bucket + 1):
+                self.count[skipped % self.size] = 0
+            self.newest = bucket
+        elif bucket <= self.newest - self.size:
+            # Older than what's kept
+            return
+
+        slot = bucket % self.size
+        count = self.count[slot]
+        if count == 0:
+            self.mean[slot] = self.low[slot] = self.high[slot] = value
+        else:
+            self.mean[slot] += (value - self.mean[slot]) / (count + 1)
+            self.low[slot] = min(self.low[slot], value)
+            self.high[slot] = max(self.high[slot], value)
+        if count < 0xFFFF:
+            self.count[slot] = count + 1
+
+    def points(self, since=0):
+        """[time, mean, min, max] per filled bucket, oldest first"""
+        if self.newest is None:
+            return []
+        points = []
+        for bucket in range(self.newest - self.size + 1, self.newest + 1):
+            slot = bucket % self.size
+            if self.count[slot] and bucket * self.step >= since:
+                points.append([bucket * self.step, round(self.mean[slot], 3), round(self.low[slot], 3), round(self.high[slot], 3)])
+        return points
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.mean, self.low, self.high, self.count))
+
+
+class Series:
+    """Raw samples and downsampled tiers of one metric of one device"""
+
+    __slots__ = ('times', 'values', 'next', 'filled', 'tiers')
+
+    def __init__(self):
+        self.times = array.array('I', bytes(4 * RAW_SIZE))
+        self.values = array.array('d', bytes(8 * RAW_SIZE))
+        self.next = 0
+        self.filled = 0
+        self.tiers = {name: Tier(step, size) for name, step, size in TIERS}
+
+    def last(self):
+        """(time, value) of the newest raw sample, or None"""
+        if not self.filled:
+            return None
+        slot = (self.next - 1) % RAW_SIZE
+        return self.times[slot], self.values[slot]
+
+    def add(self, timestamp, value):
+        self.times[self.next] = int(timestamp)
+        self.values[self.next] = value
+        self.next = (self.next + 1) % RAW_SIZE
+        self.filled = min(self.filled + 1, RAW_SIZE)
+        for tier in self.tiers.values():
+            tier.add(timestamp, value)
+
+    def points(self, resolution='minute', since=0):
+        if resolution != 'raw':
+            return self.tiers[resolution].points(since)
+        points = []
+        for i in range(RAW_SIZE - self.filled, RAW_SIZE):
+            slot = (self.next + i) % RAW_SIZE
+            if self.times[slot] >= since:
+                value = round(self.values[slot], 3)
+                points.append([self.times[slot], value, value, value])
+        return points
+
+    def nbytes(self):
+        return (self.times.itemsize + self.values.itemsize) * RAW_SIZE + sum(t.nbytes() for t in self.tiers.values())
+
+
+class TelemetryStore:
+    """Time series per device and metric, for at most max_devices devices"""
+
+    def __init__(self, max_devices=1000):
+        self.max_devices = max_devices
+        self.lock = threading.Lock()
+        # device id -> {metric: Series}, least recently updated first
+        self.devices = OrderedDict()
+
+    def record(self, device_id, status, timestamp=None, source=None):
+        """Store the telemetry found in a device status (source as in the status cache)"""
+        readings = extract(status, source)
+        if not readings:
+            return
+        timestamp = timestamp or time.time()
+        with self.lock:
+            series = self.devices.get(device_id)
+            if series is None:
+                series = self.devices[device_id] = {}
+                if len(self.devices) > self.max_devices:
+                    evicted, _ = self.devices.popitem(last=False)
+                    logger.debug("Telemetry: dropped %s to stay within %s devices", evicted, self.max_devices)
+            else:
+                self.devices.move_to_end(device_id)
+
+            for metric, value in readings.items():
+                metric_series = series.get(metric)
+                if metric_series is None:
+                    metric_series = series[metric] = Series()
+                else:
+                    last = metric_series.last()
+                    if last and math.isclose(last[1], value, rel_tol=1e-6) and timestamp - last[0] < REPEAT_AFTER:
+                        continue
+                metric_series.add(timestamp, value)
+
+    def remove(self, device_id):
+        """Forget a device"""
+        with self.lock:
+            self.devices.pop(device_id, None)
+
+    def metrics(self, device_id):
+        """Metrics recorded for a device"""
+        with self.lock:
+            return sorted(self.devices.get(device_id, {}))
+
+    def query(self, device_id, metric, resolution='minute', since=0):
+        """[time, mean, min, max] points of one series, or None if there is none"""
+        if resolution != 'raw' and resolution not in dict((name, step) for name, step, _ in TIERS):
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self.lock:
+            series = self.devices.get(device_id, {}).get(metric)
+            return series.points(resolution, since) if series else None
+
+    def stats(self):
+        """Number of devices and series, and the memory their buffers take"""
+        with self.lock:
+            series = [s for metrics in self.devices.values() for s in metrics.values()]
+            return {
+                'devices': len(self.devices),
+                'series': len(series),
+                'bytes': sum(s.nbytes() for s in series),
+            }
@@ -0,0 +1,78 @@
+"""
+Stand-in for the Home Assistant WebSocket API
+Does the auth handshake and answers the commands the add-on sends:
+config/device_registry/list, config_entries/list, subscribe_events and ping.
+Point the add-on at it with HA_URL=http://127.0.0.1:<port>.
+"""
+import asyncio
+
+from aiohttp import web, WSMsgType
+
+
+class FakeHomeAssistant:
+    """Serves a fixed device registry over /websocket, with optional latency"""
+
+    def __init__(self, registry=(), latency=0.0):
+        self.registry = list(registry)
+        self.latency = latency
+        self.commands = {}
+        self.app = web.Application()
+        self.app.router.add_get('/websocket', self.websocket)
+        self.app.router.add_get('/api/', self.api)
+        self.runner = None
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def api(self, request):
+        return web.json_response({'message': 'API running.'})
+
+    def reply(self, message):
+        """The answer to one command"""
+        command = message.get('type')
+        self.commands[command] = self.commands.get(command, 0) + 1
+
+        if command == 'ping':
+            return {'id': message['id'], 'type': 'pong'}
+        if command == 'config/device_registry/list':
+            result = self.registry
+        elif command == 'config_entries/list':
+            result = [{'entry_id': 'bench', 'domain': 'shelly', 'title': 'Benchmark fleet'}]
+        elif command == 'subscribe_events':
+            result = None
+        else:
+            return {'id': message['id'], 'type': 'result', 'success': False,
+                    'error': {'code': 'unknown_command', 'message': f"Unknown command: {command}"}}
+        return {'id': message['id'], 'type': 'result', 'success': True, 'result': result}
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+
+        await ws.send_json({'type': 'auth_required', 'ha_version': '2024.6.0'})
+        auth = await ws.receive_json()
+        if auth.get('type') != 'auth':
+            await ws.close()
+            return ws
+        await ws.send_json({'type': 'auth_ok', 'ha_version': '2024.6.0'})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            await ws.send_json(self.reply(msg.json()))
+        return ws
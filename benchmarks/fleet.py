@@ -0,0 +1,210 @@
+"""
+Simulated Shelly fleet for the benchmarks
+One aiohttp server on port 80 answers for every device: each device gets
+its own loopback address (127.0.x.y), and the address a request arrived on
+tells which device it is for. Gen1 devices serve the HTTP API, Gen2 devices
+the RPC API. Latency, jitter and the share of offline devices are configurable.
+"""
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+GEN1_MODELS = ('SHSW-1', 'SHSW-25', 'SHPLG-S', 'SHDM-2')
+GEN2_MODELS = ('SNSW-001X16EU', 'SNSW-102P16EU', 'SNPL-00112EU', 'S3SW-001X16EU')
+
+
+def device_address(index):
+    """Loopback address of the index-th device (Linux routes all of 127/8 to lo)"""
+    return f"127.0.{10 + index // 250}.{1 + index % 250}"
+
+
+class SimulatedFleet:
+    """A fleet of fake Gen1 and Gen2 devices behind one HTTP server"""
+
+    def __init__(self, size, latency=0.05, jitter=0.02, offline_rate=0.0, gen2_ratio=0.5, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.devices = {}
+        self.order = []
+
+        for index in range(size):
+            generation = 2 if self.random.random() < gen2_ratio else 1
+            models = GEN2_MODELS if generation == 2 else GEN1_MODELS
+            ip = device_address(index)
+            self.devices[ip] = {
+                'index': index,
+                'ip': ip,
+                'generation': generation,
+                'model': models[index % len(models)],
+                'mac': f"B0{index:010X}",
+                'fw': '20231107-164738/v1.14.1-gcb84623' if generation == 1 else '20240430-105737/1.3.0-gd3e83b1',
+                'offline': self.random.random() < offline_rate,
+                'auth': False,
+                'booted': time.time(),
+            }
+            self.order.append(ip)
+
+        self.app = web.Application(client_max_size=1024 ** 2)
+        self.app.router.add_route('*', '/{tail:.*}', self.handle)
+        self.runner = None
+        self.closing = None
+
+    def registry(self, count=None):
+        """Device registry entries, as HA would list them, for the first count devices"""
+        entries = []
+        for ip in self.order[:count]:
+            device = self.devices[ip]
+            entries.append({
+                'id': f"bench{device['index']:05d}",
+                'name': f"Bench {device['model']} {device['index']}",
+                'name_by_user': None,
+                'manufacturer': 'Shelly',
+                'model': device['model'],
+                'sw_version': device['fw'],
+                'configuration_url': f"http://{ip}/",
+                'identifiers': [['shelly', device['mac'].lower()]],
+                'connections': [],
+            })
+        return entries
+
+    def addresses(self, count=None, online=True):
+        """IPs of the first count devices, optionally only the online ones"""
+        return [ip for ip in self.order[:count] if not (online and self.devices[ip]['offline'])]
+
+    async def start(self, host='0.0.0.0', port=80):
+        self.closing = asyncio.Event()
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port, backlog=4096).start()
+
+    async def stop(self):
+        if self.closing is not None:
+            self.closing.set()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def _delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    async def handle(self, request):
+        ip = request.transport.get_extra_info('sockname')[0] if request.transport else None
+        device = self.devices.get(ip)
+        if device is None:
+            return web.Response(status=404)
+
+        if device['offline']:
+            # Like a device that dropped off the network: never answers
+            await self.closing.wait()
+            return web.Response(status=503)
+
+        await asyncio.sleep(self._delay())
+        self.requests += 1
+        if device['generation'] == 1:
+            return self.gen1(request, device)
+        return await self.gen2(request, device)
+
+    def gen1(self, request, device):
+        """The parts of the Gen1 HTTP API the add-on uses"""
+        path = request.path
+        if path == '/shelly':
+            return web.json_response({
+                'type': device['model'],
+                'mac': device['mac'],
+                'auth': device['auth'],
+                'fw': device['fw'],
+                'num_outputs': 1,
+            })
+        if path == '/status':
+            return web.json_response({
+                'wifi_sta': {'connected': True, 'ip': device['ip'], 'rssi': -60},
+                'relays': [{'ison': False, 'source': 'input'}],
+                'update': {'status': 'idle', 'has_update': False, 'old_version': device['fw']},
+                'uptime': int(time.time() - device['booted']),
+            })
+        if path == '/settings':
+            return web.json_response({
+                'device': {'type': device['model'], 'mac': device['mac'], 'hostname': f"shelly-{device['mac']}"},
+                'name': f"Bench {device['index']}",
+                'fw': device['fw'],
+                'login': {'enabled': device['auth'], 'username': 'admin'},
+            })
+        if path == '/settings/login':
+            device['auth'] = request.query.get('enabled') in ('1', 'true')
+            return web.json_response({'enabled': device['auth'], 'unprotected': False, 'username': 'admin'})
+        if path == '/reboot':
+            device['booted'] = time.time()
+            return web.json_response({'ok': True})
+        if path == '/ota':
+            return web.json_response({
+                'status': 'updating' if request.query.get('update') else 'idle',
+                'has_update': False,
+                'new_version': device['fw'],
+                'old_version': device['fw'],
+            })
+        return web.Response(status=404)
+
+    def _gen2_info(self, device):
+        return {
+            'name': None,
+            'id': f"shelly-{device['mac'].lower()}",
+            'mac': device['mac'],
+            'model': device['model'],
+            'gen': 2,
+            'fw_id': device['fw'],
+            'ver': device['fw'].split('/')[-1],
+            'app': 'Plus1',
+            'auth_en': device['auth'],
+            'auth_domain': None,
+        }
+
+    def _rpc(self, method, params, device):
+        """Result of one RPC method, or None if the method is unknown"""
+        if method == 'Shelly.GetDeviceInfo':
+            return self._gen2_info(device)
+        if method == 'Shelly.GetStatus':
+            return {
+                'sys': {'mac': device['mac'], 'uptime': int(time.time() - device['booted']), 'available_updates': {}},
+                'switch:0': {'id': 0, 'output': False, 'apower': 0.0, 'voltage': 230.1},
+                'wifi': {'sta_ip': device['ip'], 'status': 'got ip', 'rssi': -60},
+            }
+        if method == 'Shelly.GetConfig':
+            return {'sys': {'device': {'name': None, 'mac': device['mac']}}, 'switch:0': {'id': 0, 'name': None}}
+        if method == 'Sys.SetConfig':
+            auth = (params or {}).get('config', {}).get('auth')
+            if auth is not None:
+                device['auth'] = bool(auth.get('enable'))
+            return {'restart_required': False}
+        if method == 'Shelly.Reboot':
+            device['booted'] = time.time()
+            return {}
+        if method in ('Shelly.Update', 'Shelly.CheckForUpdate'):
+            # Already on the latest firmware
+            return {}
+        return None
+
+    async def gen2(self, request, device):
+        """The parts of the Gen2 RPC API the add-on uses"""
+        path = request.path
+        if path == '/shelly':
+            return web.json_response(self._gen2_info(device))
+
+        if path == '/rpc' and request.method == 'POST':
+            payload = await request.json()
+            result = self._rpc(payload.get('method'), payload.get('params'), device)
+            if result is None:
+                return web.json_response({
+                    'id': payload.get('id'),
+                    'error': {'code': 404, 'message': f"No handler for {payload.get('method')}"},
+                })
+            return web.json_response({'id': payload.get('id'), 'src': device['mac'], 'result': result})
+
+        if path.startswith('/rpc/'):
+            result = self._rpc(path[len('/rpc/'):], dict(request.query), device)
+            if result is not None:
+                return web.json_response(result)
+
+        return web.Response(status=404)
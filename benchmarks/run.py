@@ -0,0 +1,251 @@
+"""
+Fleet-scale benchmarks
+Starts a simulated Shelly fleet and a stand-in Home Assistant, runs the
+add-on against them at several fleet sizes and times /api/scan,
+/api/device/<ip> and a batch reboot. Needs to bind port 80 (run as root or
+in the add-on container), like real Shelly devices.
+
+    python benchmarks/run.py --sizes 10,100,1000 --json results.json
+    python benchmarks/run.py --baseline results.json   # exit 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from fake_ha import FakeHomeAssistant
+from fleet import SimulatedFleet
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+# Timings compared against a baseline, lower is better
+TIMINGS = ('scan_cold_s', 'scan_warm_s', 'device_p50_ms', 'device_p95_ms', 'batch_reboot_s')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Backend:
+    """Fleet and fake HA on an event loop in a background thread"""
+
+    def __init__(self, fleet, ha):
+        self.fleet = fleet
+        self.ha = ha
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='bench-backend', daemon=True).start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self):
+        self.run(self.fleet.start())
+        self.run(self.ha.start())
+
+    def stop(self):
+        self.run(self.ha.stop())
+        self.run(self.fleet.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class AddonProcess:
+    """The add-on, started with app.py as in the container"""
+
+    def __init__(self, ha_url, data_dir, extra_env=None):
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(data_dir, 'addon.log')
+        self.env = dict(
+            os.environ,
+            HA_URL=ha_url,
+            SUPERVISOR_TOKEN='benchmark',
+            DATA_DIR=data_dir,
+            PORT=str(self.port),
+            ADMIN_PASSWORD='benchmark',
+            POLL_INTERVAL='0',
+            GEN2_PUSH='false',
+            COIOT='false',
+            LOG_LEVEL='warning',
+            **(extra_env or {})
+        )
+        self.env.pop('INGRESS_PORT', None)
+        self.process = None
+
+    def start(self, timeout=30):
+        self.log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, 'app.py'], cwd=APP_DIR, env=self.env,
+            stdout=self.log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Add-on exited with {self.process.returncode}, see {self.log_path}")
+            try:
+                if requests.get(f"{self.base}/health", timeout=1).ok:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"Add-on did not come up within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(20)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+def timed_get(url, **kwargs):
+    started = time.perf_counter()
+    response = requests.get(url, **kwargs)
+    response.raise_for_status()
+    return time.perf_counter() - started, response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def bench_size(backend, size, args):
+    """Run all measurements against the first size devices of the fleet"""
+    fleet, ha = backend.fleet, backend.ha
+    ha.registry = fleet.registry(size)
+    result = {'devices': size}
+
+    with tempfile.TemporaryDirectory(prefix='shelly-bench-') as data_dir:
+        addon = AddonProcess(ha.url, data_dir, extra_env=dict(args.env))
+        try:
+            addon.start()
+
+            # Cold: nothing known about the devices yet
+            elapsed, response = timed_get(f"{addon.base}/api/scan", timeout=600)
+            devices = response.json()
+            result['scan_cold_s'] = elapsed
+            result['scan_ok'] = sum(1 for d in devices if d.get('scan_status') == 'ok')
+
+            # Warm: generations are cached, offline devices are known
+            result['scan_warm_s'], _ = timed_get(f"{addon.base}/api/scan", timeout=600)
+
+            online = fleet.addresses(size)
+            sample = online[:args.device_samples]
+            latencies = [timed_get(f"{addon.base}/api/device/{ip}", timeout=60)[0] * 1000 for ip in sample]
+            if latencies:
+                result['device_p50_ms'] = statistics.median(latencies)
+                result['device_p95_ms'] = percentile(latencies, 0.95)
+
+            started = time.perf_counter()
+            job = requests.post(f"{addon.base}/api/batch/reboot", json={'devices': online}, timeout=60).json()
+            while job.get('status') == 'running':
+                time.sleep(0.05)
+                job = requests.get(f"{addon.base}/api/jobs/{job['id']}", timeout=60).json()
+            result['batch_reboot_s'] = time.perf_counter() - started
+            result['batch_failed'] = job.get('failed', 0)
+        finally:
+            addon.stop()
+
+    return result
+
+
+def print_table(results):
+    columns = ('devices', 'scan_ok') + TIMINGS + ('batch_failed',)
+    print(' '.join(f"{c:>15}" for c in columns))
+    for result in results:
+        cells = []
+        for column in columns:
+            value = result.get(column)
+            cells.append(f"{value:>15.3f}" if isinstance(value, float) else f"{str(value):>15}")
+        print(' '.join(cells))
+
+
+def compare(results, baseline, tolerance, slack=0.05):
+    """Timings that got slower than the baseline by more than tolerance"""
+    previous = {entry['devices']: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result['devices'])
+        if not old:
+            continue
+        for key in TIMINGS:
+            if key not in result or key not in old:
+                continue
+            # Millisecond timings get the same absolute slack, in ms
+            absolute = slack * 1000 if key.endswith('_ms') else slack
+            if result[key] > old[key] * (1 + tolerance) and result[key] - old[key] > absolute:
+                regressions.append(f"{result['devices']} devices: {key} {old[key]:.3f} -> {result[key]:.3f}")
+    return regressions
+
+
+def parse_env(value):
+    key, _, val = value.partition('=')
+    return key, val
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000', help='fleet sizes to run (default: 10,100,1000)')
+    parser.add_argument('--latency', type=float, default=0.05, help='device response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random +/- on the response time')
+    parser.add_argument('--offline-rate', type=float, default=0.02, help='share of devices that never answer')
+    parser.add_argument('--gen2-ratio', type=float, default=0.5, help='share of Gen2 devices')
+    parser.add_argument('--ha-latency', type=float, default=0.0, help='HA WebSocket response time in seconds')
+    parser.add_argument('--device-samples', type=int, default=20, help='/api/device requests per size')
+    parser.add_argument('--env', type=parse_env, action='append', default=[],
+                        help='extra add-on environment, e.g. --env ASYNC_CLIENTS=true (repeatable)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results from an earlier --json run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    fleet = SimulatedFleet(
+        max(sizes),
+        latency=args.latency,
+        jitter=args.jitter,
+        offline_rate=args.offline_rate,
+        gen2_ratio=args.gen2_ratio
+    )
+
+    backend = Backend(fleet, FakeHomeAssistant(latency=args.ha_latency))
+    backend.start()
+    results = []
+    try:
+        for size in sizes:
+            print(f"Benchmarking {size} devices...", file=sys.stderr)
+            results.append(bench_size(backend, size, args))
+    finally:
+        backend.stop()
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
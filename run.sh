@@ -7,6 +7,32 @@ export ADDON_VERSION=$(bashio::addon.version)
 
 # Get configuration
 export ADMIN_PASSWORD=$(bashio::config 'admin_password')
+export SCAN_CONCURRENCY=$(bashio::config 'scan_concurrency')
+export SCAN_TIMEOUT=$(bashio::config 'scan_timeout')
+export HTTP_POOL_SIZE=$(bashio::config 'http_pool_size')
+export HTTP_RETRIES=$(bashio::config 'http_retries')
+export POLL_INTERVAL=$(bashio::config 'poll_interval')
+export POLL_CONCURRENCY=$(bashio::config 'poll_concurrency')
+export GEN2_PUSH=$(bashio::config 'gen2_push')
+export COIOT=$(bashio::config 'coiot')
+export BATCH_CONCURRENCY=$(bashio::config 'batch_concurrency')
+export FIRMWARE_CHECK_HOURS=$(bashio::config 'firmware_check_hours')
+export ROLLOUT_WAVE_SIZE=$(bashio::config 'rollout_wave_size')
+export ROLLOUT_MAX_FAILURES=$(bashio::config 'rollout_max_failures')
+export ROLLOUT_WAVE_TIMEOUT=$(bashio::config 'rollout_wave_timeout')
+export OFFLINE_AFTER_FAILURES=$(bashio::config 'offline_after_failures')
+export OFFLINE_RETRY_SECONDS=$(bashio::config 'offline_retry_seconds')
+export ASYNC_CLIENTS=$(bashio::config 'async_clients')
+export SERVER_THREADS=$(bashio::config 'server_threads')
+export IDLE_TIMEOUT=$(bashio::config 'idle_timeout')
+export SHUTDOWN_TIMEOUT=$(bashio::config 'shutdown_timeout')
+export DEBUG=$(bashio::config 'debug')
+export LOG_LEVEL=$(bashio::config 'log_level')
+export REQUEST_LOG_SAMPLE=$(bashio::config 'request_log_sample')
+export DEVICE_LOG_SIZE=$(bashio::config 'device_log_size')
+export DEVICE_LOG_LEVEL=$(bashio::config 'device_log_level')
+export SNAPSHOT_INTERVAL=$(bashio::config 'snapshot_interval')
+export TELEMETRY_DEVICES=$(bashio::config 'telemetry_devices')
 
 # Log configuration (without showing password)
 if bashio::var.has_value "${ADMIN_PASSWORD}"; then